@@ -0,0 +1,359 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from contextlib import asynccontextmanager, contextmanager
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from http_fetch import HEADERS, TIMEOUT
+import resilience
+from metrics import metrics
+from translator import TRANSLATE_URL
+
+# Асинхронный движок обхода (python main.py --engine async): вместо пула потоков с браузерами
+# страницы проходят через цепочку стадий, связанных ограниченными очередями:
+#
+#   листинги брендов -> очередь обхода (MongoDB) -> загрузка -> разбор -> перевод -> запись -> изображения
+#
+# Если какая-то стадия не успевает, её входная очередь заполняется и предыдущие стадии ждут,
+# поэтому память не растёт. Каждый удалённый хост получает свой предел одновременных запросов
+# и скорость (token bucket). Сравнить с потоковым движком можно на локальном replay_server.py:
+#
+#   python replay_server.py --copies 50 --latency 100
+#   ASYNC_HOST_LIMITS=127.0.0.1:8800=32:200 python main.py --engine async --base-url http://127.0.0.1:8800 --letters a
+#   python main.py --engine threads --base-url http://127.0.0.1:8800 --letters a
+#
+# Без ASYNC_HOST_LIMITS replay_server ограничивается так же, как www.parfumo.com. Перед вторым прогоном
+# очистите базу, иначе парфюмы будут пропущены как уже сохранённые; сравнивайте pages/min в итоговом отчёте.
+
+# Хост: (одновременных запросов, запросов в секунду)
+HOST_LIMITS = {
+    'www.parfumo.com': (8, 5.0),
+    'media.parfumo.com': (16, 20.0),
+    'piimages.parfumo.de': (16, 20.0),
+    'translate.google.com': (4, 2.0),
+}
+DEFAULT_HOST_LIMIT = (8, 10.0)
+
+# Размер очереди между стадиями и число обработчиков каждой стадии
+QUEUE_SIZE = int(os.environ.get('ASYNC_QUEUE_SIZE', 32))
+STAGE_WORKERS = {'listing': 4, 'fetch': 32, 'parse': 4, 'translate': 4, 'store': 2, 'images': 16}
+# Потоки для синхронных частей: разбор HTML, MongoDB, кэш переводов, запись файлов изображений
+THREADS = int(os.environ.get('ASYNC_THREADS', 32))
+
+
+def parse_host_limits(text):
+    """Разбирает ASYNC_HOST_LIMITS вида "www.parfumo.com=8:5,translate.google.com=2:1"."""
+    limits = {}
+    for entry in filter(None, (part.strip() for part in text.split(','))):
+        host, _, limit = entry.partition('=')
+        concurrency, _, rate = limit.partition(':')
+        limits[host] = (int(concurrency), float(rate or DEFAULT_HOST_LIMIT[1]))
+    return limits
+
+
+HOST_LIMITS.update(parse_host_limits(os.environ.get('ASYNC_HOST_LIMITS', '')))
+
+
+class TokenBucket:
+    """Не больше rate запросов в секунду в среднем, с запасом burst на короткие всплески."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class HostLimits:
+    """Семафор и token bucket на каждый хост; слот берётся на время одного запроса."""
+
+    def __init__(self, limits=HOST_LIMITS, default=DEFAULT_HOST_LIMIT):
+        self.limits = dict(limits)
+        self.default = default
+        self.hosts = {}
+
+    def alias(self, host, like):
+        """Хост получает те же пределы, что и like (например, replay_server вместо www.parfumo.com)."""
+        self.limits.setdefault(host, self.limits.get(like, self.default))
+
+    def _get(self, host):
+        if host not in self.hosts:
+            concurrency, rate = self.limits.get(host, self.default)
+            self.hosts[host] = (asyncio.Semaphore(concurrency), TokenBucket(rate))
+        return self.hosts[host]
+
+    @asynccontextmanager
+    async def slot(self, url):
+        host = urlsplit(url).netloc
+        semaphore, bucket = self._get(host)
+        started = time.monotonic()
+        async with semaphore:
+            await bucket.acquire()
+            metrics.observe('host_wait', time.monotonic() - started)
+            metrics.inc('host_requests', host=host)
+            yield
+
+
+class AsyncCrawler:
+    """Обход очереди frontier асинхронными стадиями.
+
+    Сетевые запросы к страницам идут через aiohttp; синхронные шаги краулера (разбор страницы,
+    словарь и перевод, запись в MongoDB, сохранение изображений) выполняются в пуле потоков
+    и передаются сюда из main.py. Страницы, которым нужен браузер (раскрывающиеся блоки),
+    отдаются в hand_off — обычно это DriverPool.submit.
+    """
+
+    def __init__(self, base_url, frontier, images, writer, listing_url, parse_listing, queue_listing,
+                 prepare, translate, store, hand_off, brand_counted=None, host_limits=None,
+                 translate_url=TRANSLATE_URL):
+        self.base_url = base_url
+        self.frontier = frontier
+        self.images = images
+        self.writer = writer
+        self.listing_url = listing_url
+        self.parse_listing = parse_listing
+        self.queue_listing = queue_listing
+        self.prepare = prepare
+        self.translate = translate
+        self.store = store
+        self.hand_off = hand_off
+        self.brand_counted = brand_counted
+        self.translate_url = translate_url
+        self.limits = host_limits or HostLimits()
+        # Локальный replay_server (или зеркало) ограничивается так же, как сам сайт
+        self.limits.alias(urlsplit(base_url).netloc, 'www.parfumo.com')
+
+        self.queues = {}
+        self.high_water = {}
+        self.active = 0
+        self.listings_done = None
+        self.session = None
+        self.loop = None
+
+    # Служебное
+
+    async def _put(self, stage, item):
+        queue = self.queues[stage]
+        await queue.put(item)
+        self.high_water[stage] = max(self.high_water.get(stage, 0), queue.qsize())
+
+    async def _get(self, url):
+        async with self.limits.slot(url):
+            with metrics.timer('async_fetch'):
+                async with self.session.get(url) as response:
+                    response.raise_for_status()
+                    return await response.text(), response.headers.get('ETag'), response.headers.get('Last-Modified')
+
+    def _in_loop(self, coroutine):
+        """Выполняет корутину в цикле обхода из другого потока; False, если цикл уже остановлен."""
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        while True:
+            try:
+                future.result(timeout=1)
+                return True
+            except FutureTimeout:
+                # Пул браузеров переводит и после остановки цикла — тогда ждать некого
+                if not self.loop.is_running():
+                    future.cancel()
+                    return False
+
+    @contextmanager
+    def thread_slot(self, url):
+        """Слот хоста для синхронного кода из пула потоков (запросы Translator к переводчику).
+
+        Пока цикл обхода не запущен или уже остановлен, запрос идёт без слота.
+        """
+        slot = self.limits.slot(url)
+        if self.loop is None or not self.loop.is_running() or not self._in_loop(slot.__aenter__()):
+            yield
+            return
+        try:
+            yield
+        finally:
+            self._in_loop(slot.__aexit__(None, None, None))
+
+    async def _fetch(self, url):
+        # Повторы, Retry-After и автомат хоста — как у потокового движка (см. resilience.py)
+        return await resilience.acall(lambda: self._get(url), url, 'fetch')
+
+    async def _finish(self, url, status, error=None):
+        """Парфюм покинул конвейер: статус в очереди обхода и счётчик незавершённых."""
+        if status != 'browser':
+            await asyncio.to_thread(self.frontier.finish_perfume, url, failed=status == 'failed', error=error)
+        # Отданную браузеру страницу посчитает process_perfume (metrics.finish_trace), здесь — только hand-off
+        if status != 'browser':
+            metrics.inc('pages', kind='perfume', status=status)
+        self.active -= 1
+
+    async def _worker(self, stage, handler):
+        queue = self.queues[stage]
+        while True:
+            item = await queue.get()
+            try:
+                with metrics.timer(f'stage_{stage}'):
+                    await handler(item)
+            except Exception as e:
+                metrics.failure(stage, e)
+                print(f"Error in {stage} stage for {item['url']}: {e}")
+                try:
+                    await self._finish(item['url'], 'failed', f"{stage}: {type(e).__name__}: {e}")
+                except Exception as e:
+                    # Без этого обработчик стадии завершился бы и очередь осталась без него
+                    metrics.failure('finish', e)
+                    print(f"Error finishing {item['url']}: {e}")
+            finally:
+                queue.task_done()
+
+    # Листинги брендов
+
+    async def _listing_page(self, brand_url, page_number):
+        html, _, _ = await self._fetch(self.listing_url(brand_url, page_number))
+        return await asyncio.to_thread(self.parse_listing, html)
+
+    async def _crawl_brand(self, brand):
+        """Страницы листинга загружаются одновременно, как только известно их число (div.numbers),
+        а в очередь обхода попадают по порядку — как в main.parse_brand_perfumes."""
+        brand_url = brand['url']
+        page_number = brand['last_page'] + 1
+        page_count = page_number
+        perfume_count = 0
+        while page_number <= page_count:
+            tasks = [asyncio.ensure_future(self._listing_page(brand_url, number))
+                     for number in range(page_number, page_count + 1)]
+            try:
+                for task in tasks:
+                    cards, pages_seen = await task
+                    if not cards:
+                        metrics.inc('pages', kind='brand_page', status='empty')
+                        page_count = page_number - 1
+                        break
+                    await asyncio.to_thread(self.queue_listing, brand_url, page_number, cards)
+                    perfume_count += len(cards)
+                    metrics.inc('pages', kind='brand_page', status='ok')
+                    page_count = max(page_count, pages_seen)
+                    page_number += 1
+            finally:
+                # Страницы после пустой или упавшей больше не нужны
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+        if brand['last_page'] == 0 and self.brand_counted is not None:
+            await asyncio.to_thread(self.brand_counted, brand_url, perfume_count)
+
+    async def _listing_worker(self, shard):
+        while True:
+            brand = await asyncio.to_thread(self.frontier.lease_brand, shard)
+            if not brand:
+                return
+            print(f"Parsing brand: {brand['url']} from page {brand['last_page'] + 1}")
+            error = None
+            try:
+                await self._crawl_brand(brand)
+            except Exception as e:
+                metrics.failure('brand_page', e)
+                print(f"Error parsing brand page {brand['url']}: {e}")
+                error = f"{type(e).__name__}: {e}"
+            await asyncio.to_thread(self.frontier.finish_brand, brand['url'], failed=error is not None, error=error)
+
+    async def _listings(self, shard):
+        await asyncio.gather(*(self._listing_worker(shard) for _ in range(STAGE_WORKERS['listing'])))
+        self.listings_done.set()
+
+    async def _feed(self):
+        """Берёт парфюмы из очереди обхода в аренду, пока листинги не пройдены и конвейер не опустел."""
+        while True:
+            perfume_url = await asyncio.to_thread(self.frontier.lease_perfume)
+            if perfume_url:
+                self.active += 1
+                await self._put('fetch', {'url': perfume_url})
+            elif self.listings_done.is_set() and self.active == 0:
+                return
+            else:
+                await asyncio.sleep(1)
+
+    # Стадии парфюма
+
+    async def _fetch_stage(self, item):
+        item['html'], item['etag'], item['last_modified'] = await self._fetch(item['url'])
+        await self._put('parse', item)
+
+    async def _parse_stage(self, item):
+        status, perfume_data, image_urls = await asyncio.to_thread(
+            self.prepare, item['url'], item.pop('html'), item.pop('etag'), item.pop('last_modified'))
+        if status == 'browser':
+            # Аренда в очереди обхода остаётся за нами, парфюм завершит пул браузеров
+            metrics.inc('browser_hand_off')
+            await asyncio.to_thread(self.hand_off, item['url'])
+            await self._finish(item['url'], status)
+            return
+        if status != 'new':
+            await self._finish(item['url'], 'ok' if status == 'skipped' else status)
+            return
+        item['perfume_data'] = perfume_data
+        item['image_urls'] = image_urls
+        await self._put('translate', item)
+
+    async def _translate_stage(self, item):
+        perfume_data = item['perfume_data']
+        # Слот хоста переводчика берёт сам Translator на каждый HTTP-запрос (см. thread_slot),
+        # документ, все строки которого нашлись в кэше, переводится без ожидания
+        await asyncio.to_thread(self.translate, perfume_data['perfume_id'], perfume_data)
+        await self._put('store', item)
+
+    async def _store_stage(self, item):
+        perfume_data = item.pop('perfume_data')
+        item['perfume_id'] = perfume_data['perfume_id']
+        await asyncio.to_thread(self.store, perfume_data)
+        await self._put('images', item)
+
+    async def _download(self, image_url):
+        async with self.limits.slot(image_url):
+            return await asyncio.to_thread(self.images.download, image_url)
+
+    async def _images_stage(self, item):
+        perfume_id = item['perfume_id']
+        main_image_url, additional_image_urls = item['image_urls']
+        urls = ([main_image_url] if main_image_url else []) + list(additional_image_urls)
+        if urls:
+            paths = await asyncio.gather(*(self._download(url) for url in urls))
+            fields = await asyncio.to_thread(self.images.image_fields, perfume_id, main_image_url, urls, list(paths))
+            await asyncio.to_thread(self.writer.set_fields, perfume_id, fields)
+        await self._finish(item['url'], 'ok')
+
+    # Запуск
+
+    async def run(self, shard=None):
+        self.loop = loop = asyncio.get_running_loop()
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=THREADS, thread_name_prefix='async-step'))
+        self.listings_done = asyncio.Event()
+        handlers = {'fetch': self._fetch_stage, 'parse': self._parse_stage, 'translate': self._translate_stage,
+                    'store': self._store_stage, 'images': self._images_stage}
+        self.queues = {stage: asyncio.Queue(maxsize=QUEUE_SIZE) for stage in handlers}
+
+        connector = aiohttp.TCPConnector(limit=sum(concurrency for concurrency, _ in self.limits.limits.values()))
+        async with aiohttp.ClientSession(headers=HEADERS, connector=connector,
+                                         timeout=aiohttp.ClientTimeout(total=TIMEOUT)) as self.session:
+            workers = [asyncio.create_task(self._worker(stage, handler))
+                       for stage, handler in handlers.items() for _ in range(STAGE_WORKERS[stage])]
+            try:
+                await asyncio.gather(self._listings(shard), self._feed())
+            finally:
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+        print(f"Async stage queue high-water marks (of {QUEUE_SIZE}): {self.high_water}")
@@ -0,0 +1,117 @@
+import glob
+import os
+import re
+import sys
+import timeit
+
+from bs4 import BeautifulSoup
+
+from page_model import PARSER, PerfumePage, parse_html
+from parsers import parse_notes, parse_og_image_id, parse_perfume_type, parse_perfumers, parse_reviews, parse_tags
+
+# Микробенчмарк разбора страницы парфюма на сохранённых страницах из fixtures/:
+# прежний путь (html.parser, отдельный select на каждое поле и повторный разбор всей
+# страницы после кликов "похожие" и "теги") против PerfumePage (один разбор, один обход).
+#
+#   python bench_page_model.py [число повторов]
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def parse_before(html, tags_html):
+    soup = BeautifulSoup(html, 'html.parser')
+    name_element = soup.select_one('h1.p_name_h1[itemprop="name"]')
+    brand_element = name_element.select_one('span[itemprop="brand"] span[itemprop="name"]')
+    data = {
+        'name': name_element.contents[0].strip(),
+        'brand': brand_element.text.strip() if brand_element else "Unknown",
+        'perfume_id': parse_og_image_id(soup),
+    }
+    description_element = soup.select_one('span[itemprop="description"]')
+    if description_element:
+        links_info = []
+        for link in description_element.find_all('a'):
+            text = link.text.strip()
+            links_info.append({'text': text, 'href': link['href'].replace("https://www.parfumo.com", '')})
+            link.replace_with(text)
+        data['description'] = description_element.text.strip()
+        data['description_links'] = links_info
+    data['notes'] = parse_notes(soup)
+    ratings = soup.select_one('div.barfiller_element[data-type="bottle"] .bold.green')
+    data['rating'] = ratings.text.strip() if ratings else "No rating"
+    gender_icon = soup.select_one('div.p_gender_big i')
+    if gender_icon:
+        data['gender'] = gender_icon['class'][1]
+    data['accords'] = [accord.text.strip() for accord in soup.select('div.s-circle-container div.text-xs.grey')]
+    release_year_element = soup.select_one('span.label_a')
+    if release_year_element:
+        data['release_year'] = re.search(r'\b\d{4}\b', release_year_element.text).group(0)
+    data['type'] = parse_perfume_type(soup)
+    main_image_element = soup.select_one('img.p-main-img[itemprop="image"]')
+    data['main_image'] = main_image_element['src'] if main_image_element else None
+    data['additional_images'] = [a['href'] for a in soup.select('div#p_imagery_holder a.imagery_item')]
+    data['reviews'] = parse_reviews(soup)
+    data['perfumers'] = parse_perfumers(soup)
+    # После клика "похожие" страница целиком разбиралась заново
+    soup = BeautifulSoup(html, 'html.parser')
+    data['similar_perfumes'] = [item.get('data-s_id') for item in soup.select('div.sim_item') if item.get('data-s_id')]
+    # И ещё раз после клика "теги"
+    BeautifulSoup(html, 'html.parser')
+    data['tags'] = parse_tags(BeautifulSoup(tags_html, 'html.parser'))
+    return data
+
+
+def parse_after(html, tags_html):
+    page = PerfumePage(parse_html(html), "https://www.parfumo.com")
+    data = {
+        'name': page.name,
+        'brand': page.brand if page.brand is not None else "Unknown",
+        'perfume_id': page.perfume_id,
+    }
+    if page.description is not None:
+        data['description'] = page.description
+        data['description_links'] = page.description_links
+    data['notes'] = page.notes
+    data['rating'] = page.rating if page.rating is not None else "No rating"
+    if page.gender:
+        data['gender'] = page.gender
+    data['accords'] = page.accords
+    if page.release_year() is not None:
+        data['release_year'] = page.release_year()
+    data['type'] = page.type
+    data['main_image'] = page.main_image
+    data['additional_images'] = page.additional_images
+    data['reviews'] = page.reviews
+    data['perfumers'] = page.perfumers
+    data['similar_perfumes'] = page.similar
+    # После клика разбирается только фрагмент #tags_holder
+    data['tags'] = parse_tags(parse_html(tags_html))
+    return data
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    with open(os.path.join(FIXTURES, 'fragment_tags.html'), encoding='utf-8') as file:
+        tags_html = file.read()
+
+    print(f"Parser backend for PerfumePage: {PARSER}")
+    for path in sorted(glob.glob(os.path.join(FIXTURES, 'perfume_*.html'))):
+        with open(path, encoding='utf-8') as file:
+            html = file.read()
+
+        before, after = parse_before(html, tags_html), parse_after(html, tags_html)
+        if before != after:
+            for key in before:
+                if before.get(key) != after.get(key):
+                    print(f"  {key}: {before.get(key)!r} != {after.get(key)!r}")
+            raise SystemExit(f"{os.path.basename(path)}: page model disagrees with the old selectors")
+
+        before_time = min(timeit.repeat(lambda: parse_before(html, tags_html), number=repeat, repeat=3)) / repeat
+        after_time = min(timeit.repeat(lambda: parse_after(html, tags_html), number=repeat, repeat=3)) / repeat
+        print(f"{os.path.basename(path)} ({len(html) // 1024} KB): "
+              f"before {before_time * 1000:.2f} ms, after {after_time * 1000:.2f} ms, "
+              f"{before_time / after_time:.1f}x faster")
+
+
+if __name__ == "__main__":
+    main()
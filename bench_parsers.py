@@ -0,0 +1,114 @@
+import json
+import os
+import sys
+import timeit
+import tracemalloc
+
+from page_model import PARSER, PerfumePage, parse_html
+from parsers import parse_notes, parse_og_image_id, parse_perfume_type, parse_perfumers, parse_reviews, parse_tags
+
+# Бенчмарк парсеров на записанном корпусе страниц (fixtures/corpus.json).
+#
+# Сначала проверяет, что каждая страница корпуса разбирается в ожидаемые значения,
+# затем для каждого парсера печатает скорость (страниц в секунду), пиковую память
+# и число блоков памяти, оставшихся после прогона (tracemalloc).
+#
+#   python bench_parsers.py [число повторов]
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+PARSERS = {
+    'parse_notes': parse_notes,
+    'parse_reviews': parse_reviews,
+    'parse_perfumers': parse_perfumers,
+    'parse_tags': parse_tags,
+    'parse_og_image_id': parse_og_image_id,
+    'parse_perfume_type': parse_perfume_type,
+}
+
+
+def load_corpus():
+    with open(os.path.join(FIXTURES, 'corpus.json'), encoding='utf-8') as file:
+        corpus = json.load(file)
+    for entry in corpus['pages']:
+        with open(os.path.join(FIXTURES, entry['file']), encoding='utf-8') as file:
+            entry['html'] = file.read()
+    return corpus
+
+
+def actual_values(entry, soup):
+    """Значения, которые сверяются с expected из корпуса."""
+    kind = entry['kind']
+    if kind == 'brand_letter':
+        return {'brands': len(soup.select('div.brands_list a[href]'))}
+    if kind == 'brand_listing':
+        # Те же селекторы, что в main.parse_brand_perfumes
+        page_number = int(entry['path'].rsplit('current_page=', 1)[1])
+        return {'links': len(soup.select('div.col-normal div.name a[href]')),
+                'next_page': soup.select_one(f'div.numbers div a[href*="current_page={page_number + 1}"]') is not None}
+    if kind == 'fragment_tags':
+        return {'tags': len(parse_tags(soup))}
+    if kind == 'fragment_similar':
+        return {'similar': len(soup.select('div.sim_item[data-s_id]'))}
+    page = PerfumePage(soup)
+    notes = parse_notes(soup)
+    return {
+        'perfume_id': parse_og_image_id(soup),
+        'reviews': len(parse_reviews(soup)),
+        'top_notes': len(notes['top_notes']),
+        'additional_notes': len(notes['additional_notes']),
+        'perfumers': len(parse_perfumers(soup)),
+        'tags': len(parse_tags(soup)),
+        'similar': len(page.similar),
+        'has_similar_button': page.has_similar_button,
+        'has_tags_button': page.has_tags_button,
+    }
+
+
+def check_corpus(corpus):
+    for entry in corpus['pages']:
+        actual = actual_values(entry, parse_html(entry['html']))
+        wrong = {key: (expected, actual.get(key)) for key, expected in entry['expected'].items()
+                 if actual.get(key) != expected}
+        if wrong:
+            for key, (expected, got) in wrong.items():
+                print(f"  {key}: expected {expected!r}, got {got!r}")
+            raise SystemExit(f"{entry['file']}: parsers disagree with the corpus")
+
+
+def measure(name, run, pages, repeat):
+    seconds = min(timeit.repeat(run, number=repeat, repeat=3)) / repeat
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    baseline = tracemalloc.get_traced_memory()[0]
+    run()
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename'))
+    print(f"{name:<22}{pages / seconds:>12.0f}{seconds / pages * 1e6:>12.1f}{peak / 1024:>12.1f}{blocks:>12}")
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    corpus = load_corpus()
+    check_corpus(corpus)
+
+    perfume_pages = [entry['html'] for entry in corpus['pages'] if entry['kind'] == 'perfume']
+    soups = [parse_html(html) for html in perfume_pages]
+    tags_fragments = [parse_html(entry['html']) for entry in corpus['pages'] if entry['kind'] == 'fragment_tags']
+    print(f"Corpus: {len(corpus['pages'])} pages ({len(perfume_pages)} perfume pages), parser backend {PARSER}")
+    print(f"{'parser':<22}{'pages/s':>12}{'us/page':>12}{'peak KB':>12}{'net blocks':>12}")
+
+    # Построение дерева — общая часть для всех парсеров, замеряется отдельно
+    measure('parse_html', lambda: [parse_html(html) for html in perfume_pages], len(perfume_pages), max(1, repeat // 5))
+    for name, parser in PARSERS.items():
+        measure(name, lambda parser=parser: [parser(soup) for soup in soups], len(soups), repeat)
+    measure('parse_tags (fragment)', lambda: [parse_tags(soup) for soup in tags_fragments], len(tags_fragments), repeat)
+    # Для сравнения — все поля за один обход (последним: он заменяет ссылки описания текстом прямо в дереве)
+    measure('PerfumePage', lambda: [PerfumePage(soup) for soup in soups], len(soups), repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import heapq
+import os
+import re
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import urljoin
+
+from pymongo import ASCENDING, UpdateOne
+
+from http_fetch import fetch_html
+from metrics import metrics
+from page_model import parse_html
+
+# Сколько страниц /Brands/<буква> загружать одновременно
+BRAND_WORKERS = int(os.environ.get('BRAND_WORKERS', 8))
+
+# Число парфюмов рядом с названием бренда: "123", "(123)" или "(1,234)"
+COUNT_PATTERN = re.compile(r'^\(?\s*(\d[\d,.\s]*)\)?$')
+
+
+class BrandIndex:
+    """Каталог брендов в коллекции brands: {url, name, letter, perfume_count, last_seen}.
+
+    Списки брендов меняются редко, поэтому страницы букв загружаются только для букв,
+    которых ещё нет в каталоге, или по --refresh-brands. perfume_count берётся со страницы
+    буквы, если сайт его показывает, иначе — из последнего полного обхода листинга бренда.
+    shards — закреплённая раскладка по шардам: {число шардов: номер шарда}.
+    """
+
+    def __init__(self, db):
+        self.collection = db['brands']
+        self.collection.create_index('url', unique=True)
+        self.collection.create_index([('letter', ASCENDING)])
+
+    def known_letters(self, letters):
+        return set(self.collection.distinct('letter', {'letter': {'$in': list(letters)}}))
+
+    def update(self, letter, brands):
+        now = datetime.now(timezone.utc)
+        ops = []
+        for brand in brands:
+            fields = {'name': brand['name'], 'letter': letter, 'last_seen': now}
+            if brand.get('perfume_count') is not None:
+                fields['perfume_count'] = brand['perfume_count']
+            ops.append(UpdateOne({'url': brand['url']}, {'$set': fields}, upsert=True))
+        if ops:
+            self.collection.bulk_write(ops, ordered=False)
+
+    def record_count(self, url, perfume_count):
+        """Число парфюмов бренда по итогам полного обхода его листинга."""
+        self.collection.update_one({'url': url}, {'$set': {'perfume_count': perfume_count,
+                                                           'counted_at': datetime.now(timezone.utc)}})
+
+    def brands(self, letters):
+        return list(self.collection.find({'letter': {'$in': list(letters)}}, {'_id': 0}))
+
+    def reset_shards(self, letters):
+        """Сбрасывает закреплённую раскладку: она пересчитается по обновлённому каталогу."""
+        self.collection.update_many({'letter': {'$in': list(letters)}}, {'$unset': {'shards': ''}})
+
+    def shard_brands(self, letters, shard_index, shard_count):
+        """Бренды шарда shard_index из раскладки, закреплённой в каталоге, от крупных к мелким.
+
+        Номер шарда хранится в shards.<shard_count> и записывается только один раз, поэтому все
+        процессы читают одну раскладку, даже если record_count уже поменял веса во время обхода.
+        Ещё не разложенные бренды (новые в каталоге) раскладываются поверх закреплённой нагрузки.
+        """
+        key = str(shard_count)
+        catalog = self.brands(letters)
+        pending = [brand for brand in catalog if key not in (brand.get('shards') or {})]
+        if pending:
+            default = default_weight(catalog)
+            loads = [0] * shard_count
+            for brand in catalog:
+                if key in (brand.get('shards') or {}):
+                    loads[brand['shards'][key]] += brand.get('perfume_count') or default
+            # Условие $exists: если раскладку одновременно записал другой процесс, остаётся его
+            ops = [UpdateOne({'url': url, f'shards.{key}': {'$exists': False}}, {'$set': {f'shards.{key}': shard}})
+                   for url, shard in assign_shards(pending, shard_count, loads, default).items()]
+            self.collection.bulk_write(ops, ordered=False)
+            catalog = self.brands(letters)
+        default = default_weight(catalog)
+        own = [brand for brand in catalog if brand['shards'][key] == shard_index]
+        return sorted(own, key=lambda brand: (-(brand.get('perfume_count') or default), brand['url']))
+
+
+def perfume_count(link):
+    """Число парфюмов из <span> в ссылке на бренд или "(123)" сразу за ней; None, если сайт его не показывает."""
+    candidates = [span.get_text(strip=True) for span in link.find_all('span')]
+    sibling = link.next_sibling
+    if isinstance(sibling, str):
+        candidates.append(sibling.strip())
+    elif sibling is not None and sibling.name in ('span', 'small'):
+        candidates.append(sibling.get_text(strip=True))
+    for text in candidates:
+        match = COUNT_PATTERN.match(text)
+        if match:
+            return int(re.sub(r'\D', '', match.group(1)))
+    return None
+
+
+def parse_letter_page(html, base_url):
+    """Бренды со страницы /Brands/<буква>: [{url, name, perfume_count}]."""
+    brands = []
+    for link in parse_html(html).select('div.brands_list a[href]'):
+        count = perfume_count(link)
+        for span in link.find_all('span'):
+            span.extract()
+        brands.append({'url': urljoin(base_url, link['href']), 'name': link.get_text(' ', strip=True),
+                       'perfume_count': count})
+    return brands
+
+
+def discover(index, letters, base_url, refresh=False, workers=BRAND_WORKERS):
+    """Загружает страницы букв параллельно по HTTP и обновляет каталог; возвращает {буква: число брендов}."""
+    known = set() if refresh else index.known_letters(letters)
+    pending = [letter for letter in letters if letter not in known]
+    if refresh:
+        index.reset_shards(pending)
+    if not pending:
+        print(f"Brand index: reusing cached brands for {''.join(letters)}")
+        return {}
+
+    def load(letter):
+        with metrics.timer('brand_letter'):
+            return parse_letter_page(fetch_html(f"{base_url}/Brands/{letter}"), base_url)
+
+    found = {}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='brand-letter') as executor:
+        futures = {letter: executor.submit(load, letter) for letter in pending}
+        for letter, future in futures.items():
+            try:
+                brands = future.result()
+            except Exception as e:
+                metrics.failure('brand_letter', e)
+                print(f"Error parsing brands list for letter '{letter}': {e}")
+                continue
+            index.update(letter, brands)
+            found[letter] = len(brands)
+    print(f"Brand index: {sum(found.values())} brands from {len(found)} letter pages")
+    return found
+
+
+def default_weight(brands):
+    """Вес бренда без известного числа парфюмов — медиана известных."""
+    known = [brand['perfume_count'] for brand in brands if brand.get('perfume_count')]
+    return statistics.median(known) if known else 1
+
+
+def assign_shards(brands, shard_count, loads=None, default=1):
+    """Раскладка брендов по шардам (LPT): от крупных к мелким, каждый — самому свободному шарду.
+
+    loads — нагрузка, уже закреплённая за шардами. Возвращает {url: номер шарда}
+    в порядке от крупных брендов к мелким.
+    """
+    heap = [(loads[shard] if loads else 0, shard) for shard in range(shard_count)]
+    heapq.heapify(heap)
+    assignment = {}
+    for brand in sorted(brands, key=lambda brand: (-(brand.get('perfume_count') or default), brand['url'])):
+        load, shard = heapq.heappop(heap)
+        assignment[brand['url']] = shard
+        heapq.heappush(heap, (load + (brand.get('perfume_count') or default), shard))
+    return assignment
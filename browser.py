@@ -0,0 +1,139 @@
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.chrome.options import Options
+
+# Путь к драйверу ChromeDriver
+CHROMEDRIVER_PATH = os.environ.get(
+    'CHROMEDRIVER_PATH', 'C:/Users/Khamzat/Desktop/chromedriver-win64/chromedriver-win64/chromedriver.exe'
+)
+
+# Количество параллельных браузеров и число страниц, после которого браузер перезапускается
+WORKERS = int(os.environ.get('CRAWL_WORKERS', os.cpu_count() or 1))
+RESTART_AFTER = int(os.environ.get('CRAWL_RESTART_AFTER', 50))
+
+
+def create_driver():
+    # Настройка Selenium
+    chrome_options = Options()
+    chrome_options.headless = True  # Включаем headless режим
+    chrome_options.add_argument("--disable-gpu")
+    chrome_options.add_argument("--disable-extensions")
+    chrome_options.add_argument("--disable-popup-blocking")
+    chrome_options.add_argument("--disable-infobars")
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+
+    prefs = {"profile.managed_default_content_settings.images": 2}  # Отключаем загрузку изображений
+    chrome_options.add_experimental_option("prefs", prefs)
+
+    driver = webdriver.Chrome(service=Service(CHROMEDRIVER_PATH), options=chrome_options)
+
+    # Устанавливаем тайм-аут на загрузку страницы
+    driver.set_page_load_timeout(300)
+    return driver
+
+
+class LazyDriver:
+    """Обёртка над WebDriver, запускающая Chrome только при первом обращении.
+
+    В режиме HTTP-загрузки большинству страниц браузер не нужен вовсе.
+    on_start(driver) вызывается один раз для каждого запущенного браузера (например, согласие с cookies).
+    """
+
+    def __init__(self, on_start=None):
+        self._driver = None
+        self.on_start = on_start
+
+    @property
+    def started(self):
+        return self._driver is not None
+
+    def __getattr__(self, name):
+        if self._driver is None:
+            self._driver = create_driver()
+            if self.on_start is not None:
+                self.on_start(self._driver)
+        return getattr(self._driver, name)
+
+    def quit(self):
+        if self._driver is not None:
+            driver, self._driver = self._driver, None
+            try:
+                driver.quit()
+            except Exception as e:
+                print(f"Error closing browser: {e}")
+
+
+class DriverPool:
+    """Пул независимых браузеров, разбирающих общую очередь URL.
+
+    Каждый поток держит свой WebDriver (LazyDriver, Chrome стартует при первом
+    обращении) и вызывает handler(driver, url) для каждого URL; новый браузер
+    сначала проходит через on_start(driver).
+    После restart_after страниц (или падения Chrome) браузер пересоздаётся,
+    чтобы ограничить рост потребляемой памяти.
+    """
+
+    _stop = object()
+
+    def __init__(self, handler, workers=WORKERS, restart_after=RESTART_AFTER, on_start=None):
+        self.handler = handler
+        self.on_start = on_start
+        self.workers = workers
+        self.restart_after = restart_after
+        # Ограниченная очередь: страница брендов не убегает далеко вперёд воркеров
+        self.queue = queue.Queue(maxsize=workers * 4)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='perfume-worker')
+        self.lock = threading.Lock()
+        self.pages_done = 0
+
+    def start(self):
+        for index in range(self.workers):
+            self.executor.submit(self._worker, index)
+        return self
+
+    def submit(self, url):
+        self.queue.put(url)
+
+    def join(self):
+        """Ждёт, пока все поставленные в очередь URL будут обработаны."""
+        self.queue.join()
+
+    def shutdown(self):
+        for _ in range(self.workers):
+            self.queue.put(self._stop)
+        self.executor.shutdown(wait=True)
+
+    def _worker(self, index):
+        driver = LazyDriver(self.on_start)
+        pages = 0
+        while True:
+            url = self.queue.get()
+            if url is self._stop:
+                self.queue.task_done()
+                break
+
+            try:
+                self.handler(driver, url)
+            except WebDriverException as e:
+                print(f"Worker {index}: browser failed on {url}, restarting: {e}")
+                pages = self.restart_after
+            except Exception as e:
+                print(f"Worker {index}: error processing {url}: {e}")
+            finally:
+                self.queue.task_done()
+
+            pages += 1
+            with self.lock:
+                self.pages_done += 1
+            if pages >= self.restart_after:
+                driver.quit()
+                pages = 0
+
+        driver.quit()
@@ -0,0 +1,87 @@
+import threading
+
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+# Какие поля документа парфюма хранятся как массивы id терминов и к какому виду терминов они относятся
+NOTE_LAYERS = ('top_notes', 'heart_notes', 'base_notes', 'additional_notes')
+TERM_FIELDS = {'accords': 'accord', 'tags': 'tag'}
+TARGET_LANG = 'ru'
+
+
+class Dictionary:
+    """Общий словарь нот, аккордов и тегов в MongoDB.
+
+    Каждый термин — документ {_id: целый id, kind, name (английское название со страницы),
+    translations: {ru: ...}}. Перевод выполняется один раз при добавлении термина,
+    а документы парфюмов хранят только массивы id. Словарь загружается в память при старте;
+    новые id выдаются счётчиком в коллекции counters, поэтому несколько процессов
+    краулера могут пополнять его одновременно.
+    """
+
+    def __init__(self, db, translator=None, target_lang=TARGET_LANG):
+        self.terms = db['dictionary']
+        self.counters = db['counters']
+        self.translator = translator
+        self.target_lang = target_lang
+        self.lock = threading.Lock()
+        # Добавление терминов последовательно, чтобы потоки не выдавали один термин дважды
+        self.add_lock = threading.Lock()
+        self.ids = {}
+
+        self.terms.create_index([('kind', ASCENDING), ('name', ASCENDING)], unique=True)
+        for term in self.terms.find({}, {'kind': 1, 'name': 1}):
+            self.ids[(term['kind'], term['name'])] = term['_id']
+
+    def _next_id(self):
+        counter = self.counters.find_one_and_update(
+            {'_id': 'dictionary'}, {'$inc': {'seq': 1}}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        return counter['seq']
+
+    def _add(self, kind, names):
+        translations = {}
+        if self.translator is not None:
+            translations = self.translator.translate_many(names, target_lang=self.target_lang)
+        for name in names:
+            term = {'kind': kind, 'name': name}
+            if name in translations:
+                term['translations'] = {self.target_lang: translations[name]}
+            try:
+                term_id = self._next_id()
+                self.terms.insert_one(dict(term, _id=term_id))
+            except DuplicateKeyError:
+                # Термин успел добавить другой процесс краулера
+                term_id = self.terms.find_one({'kind': kind, 'name': name}, {'_id': 1})['_id']
+            with self.lock:
+                self.ids[(kind, name)] = term_id
+
+    def ids_for(self, kind, names):
+        """id терминов в том же порядке; неизвестные термины добавляются в словарь и переводятся."""
+        with self.lock:
+            missing = [name for name in names if (kind, name) not in self.ids]
+        if missing:
+            with self.add_lock:
+                with self.lock:
+                    missing = list(dict.fromkeys(name for name in missing if (kind, name) not in self.ids))
+                if missing:
+                    self._add(kind, missing)
+        with self.lock:
+            return [self.ids[(kind, name)] for name in names]
+
+    def encode(self, perfume_data):
+        """Заменяет ноты, аккорды и теги документа массивами id."""
+        if 'notes' in perfume_data:
+            perfume_data['notes'] = {layer: self.ids_for('note', notes) for layer, notes in perfume_data['notes'].items()}
+        for field, kind in TERM_FIELDS.items():
+            if field in perfume_data:
+                perfume_data[field] = self.ids_for(kind, perfume_data[field])
+        return perfume_data
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def term_label(term, lang=TARGET_LANG):
+    """Название термина для показа: перевод, если он есть, иначе английское."""
+    return term.get('translations', {}).get(lang) or term['name']
@@ -0,0 +1,257 @@
+import argparse
+import gzip
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+from pymongo import MongoClient
+
+from dictionary import NOTE_LAYERS, TARGET_LANG, TERM_FIELDS
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Выгрузка каталога parfumo.perfumes для аналитики.
+#
+# Коллекция читается одним курсором на сервере пачками по --batch-size документов,
+# а файлы пишутся по ходу чтения, поэтому память не растёт с размером каталога.
+#
+#   python export.py --format jsonl --out exports/full
+#   python export.py --format parquet --out exports/2026-10-18 --since 2026-10-11T00:00:00
+#
+# jsonl   — perfumes.jsonl.gz: документы как есть (ноты, аккорды и теги — id словаря);
+# parquet — perfumes.parquet и дочерние таблицы notes, accords, tags, reviews по perfume_id.
+# В обоих случаях рядом пишется словарь терминов (terms) и manifest.json; поле until
+# манифеста — значение --since для следующей инкрементальной выгрузки.
+
+BATCH_SIZE = 5000
+
+# Верхняя граница выгрузки отстаёт от текущего момента: запись, которая уже получила updated_at
+# на сервере, но ещё не видна курсору, и расхождение часов экспорта и MongoDB попадут в следующую выгрузку
+SETTLE_SECONDS = int(os.environ.get('EXPORT_SETTLE_SECONDS', 60))
+
+# Служебные поля обхода, которые аналитике не нужны
+EXCLUDED_FIELDS = {'_id': 0, 'field_hashes': 0, 'http_etag': 0, 'http_last_modified': 0}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export the perfume catalog to JSONL or Parquet.")
+    parser.add_argument('--mongo-uri', default=os.environ.get('MONGO_URI', 'mongodb://localhost:27017/'))
+    parser.add_argument('--format', choices=('jsonl', 'parquet'), default='jsonl')
+    parser.add_argument('--out', required=True, help="каталог для файлов выгрузки")
+    parser.add_argument('--since', type=parse_time,
+                        help="только парфюмы, обновлённые с этого момента (ISO 8601, UTC по умолчанию)")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help="документов за одно обращение к MongoDB и строк в группе Parquet")
+    return parser.parse_args()
+
+
+def parse_time(value):
+    moment = datetime.fromisoformat(value)
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        # pymongo отдаёт даты без часового пояса, хранятся они в UTC
+        return (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).isoformat()
+    return str(value)
+
+
+def _text(value):
+    return None if value is None else str(value)
+
+
+def _number(value, cast):
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _term(value):
+    """(term_id, name): документы до перехода на словарь хранят сами названия терминов."""
+    if isinstance(value, int):
+        return value, None
+    return None, _text(value)
+
+
+class JsonlFile:
+    def __init__(self, path):
+        self.path = path
+        self.file = gzip.open(path + '.part', 'wt', encoding='utf-8')
+        self.rows = 0
+
+    def write(self, row):
+        self.file.write(json.dumps(row, ensure_ascii=False, default=_json_default) + '\n')
+        self.rows += 1
+
+    def close(self):
+        self.file.close()
+        os.replace(self.path + '.part', self.path)
+
+
+class ParquetFile:
+    """Таблица Parquet, которая пишется группами строк по batch_size."""
+
+    def __init__(self, path, schema, batch_size=BATCH_SIZE):
+        self.path = path
+        self.schema = schema
+        self.batch_size = batch_size
+        self.writer = pq.ParquetWriter(path + '.part', schema, compression='zstd')
+        self.columns = {name: [] for name in schema.names}
+        self.pending = 0
+        self.rows = 0
+
+    def write(self, row):
+        for name, values in self.columns.items():
+            values.append(row.get(name))
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        self.writer.write_table(pa.Table.from_pydict(self.columns, schema=self.schema))
+        self.rows += self.pending
+        self.pending = 0
+        for values in self.columns.values():
+            values.clear()
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+        os.replace(self.path + '.part', self.path)
+
+
+def parquet_schemas():
+    timestamp = pa.timestamp('ms', tz='UTC')
+    term = [('perfume_id', pa.string()), ('position', pa.int32()), ('term_id', pa.int64()), ('name', pa.string())]
+    return {
+        'perfumes': pa.schema([
+            ('perfume_id', pa.string()), ('name', pa.string()), ('brand', pa.string()), ('url', pa.string()),
+            ('rating', pa.float64()), ('gender', pa.string()), ('type', pa.string()),
+            ('release_year', pa.string()), ('year', pa.int32()), ('description', pa.string()),
+            ('perfumers', pa.list_(pa.string())), ('similar_perfumes', pa.list_(pa.string())),
+            ('main_image', pa.string()), ('additional_images', pa.list_(pa.string())),
+            ('fingerprint', pa.string()), ('fetched_at', timestamp), ('changed_at', timestamp),
+            ('updated_at', timestamp),
+        ]),
+        'notes': pa.schema([('layer', pa.string())] + term),
+        'accords': pa.schema(term),
+        'tags': pa.schema(term),
+        'reviews': pa.schema([('perfume_id', pa.string()), ('position', pa.int32()),
+                              ('title', pa.string()), ('body', pa.string())]),
+        'terms': pa.schema([('term_id', pa.int64()), ('kind', pa.string()), ('name', pa.string()),
+                            ('translation', pa.string())]),
+    }
+
+
+def perfume_row(doc):
+    return {
+        'perfume_id': _text(doc.get('perfume_id')),
+        'name': _text(doc.get('name')),
+        'brand': _text(doc.get('brand')),
+        'url': doc.get('url'),
+        # "No rating" и пустые значения становятся null
+        'rating': _number(doc.get('rating'), float),
+        'gender': _text(doc.get('gender')),
+        'type': _text(doc.get('type')),
+        'release_year': _text(doc.get('release_year')),
+        'year': _number(doc.get('year'), int),
+        'description': _text(doc.get('description')),
+        'perfumers': [_text(value) for value in doc.get('perfumers') or []],
+        'similar_perfumes': [_text(value) for value in doc.get('similar_perfumes') or []],
+        'main_image': doc.get('main_image'),
+        'additional_images': list(doc.get('additional_images') or []),
+        'fingerprint': doc.get('fingerprint'),
+        'fetched_at': doc.get('fetched_at'),
+        'changed_at': doc.get('changed_at'),
+        'updated_at': doc.get('updated_at'),
+    }
+
+
+def term_rows(perfume_id, values, **fields):
+    for position, value in enumerate(values or []):
+        term_id, name = _term(value)
+        yield dict(fields, perfume_id=perfume_id, position=position, term_id=term_id, name=name)
+
+
+def write_parquet_perfume(files, doc):
+    row = perfume_row(doc)
+    perfume_id = row['perfume_id']
+    files['perfumes'].write(row)
+    notes = doc.get('notes') or {}
+    for layer in NOTE_LAYERS:
+        for note in term_rows(perfume_id, notes.get(layer), layer=layer):
+            files['notes'].write(note)
+    for field in TERM_FIELDS:
+        for term in term_rows(perfume_id, doc.get(field)):
+            files[field].write(term)
+    for position, review in enumerate(doc.get('reviews') or []):
+        files['reviews'].write({'perfume_id': perfume_id, 'position': position,
+                                'title': _text(review.get('title')), 'body': _text(review.get('body'))})
+
+
+def export(db, out_dir, fmt='jsonl', since=None, batch_size=BATCH_SIZE):
+    """Выгружает парфюмы, обновлённые в [since, until), и словарь терминов; возвращает манифест."""
+    if fmt == 'parquet' and pa is None:
+        raise SystemExit("pyarrow is not installed; use --format jsonl or pip install pyarrow")
+    started = time.monotonic()
+    # Верхняя граница фиксируется до чтения (с отставанием SETTLE_SECONDS): более поздние записи попадут в следующую
+    # инкрементальную выгрузку (полная берёт и такие документы, и документы без updated_at)
+    until = datetime.now(timezone.utc) - timedelta(seconds=SETTLE_SECONDS)
+    # Даты в MongoDB хранятся с точностью до миллисекунд — граница в манифесте должна совпадать с ними
+    until = until.replace(microsecond=until.microsecond // 1000 * 1000)
+    query = {'updated_at': {'$gte': since, '$lt': until}} if since is not None else {}
+    # Индекс по updated_at создаёт краулер (mongo_writer.ensure_indexes), выгрузка индексов не строит
+    collection = db['perfumes']
+    os.makedirs(out_dir, exist_ok=True)
+
+    if fmt == 'parquet':
+        schemas = parquet_schemas()
+        files = {name: ParquetFile(os.path.join(out_dir, f'{name}.parquet'), schema, batch_size)
+                 for name, schema in schemas.items()}
+    else:
+        files = {name: JsonlFile(os.path.join(out_dir, f'{name}.jsonl.gz')) for name in ('perfumes', 'terms')}
+
+    exported = 0
+    for doc in collection.find(query, EXCLUDED_FIELDS).batch_size(batch_size):
+        if fmt == 'parquet':
+            write_parquet_perfume(files, doc)
+        else:
+            files['perfumes'].write(doc)
+        exported += 1
+        if exported % (batch_size * 20) == 0:
+            print(f"Exported {exported} perfumes in {time.monotonic() - started:.0f}s")
+
+    # Словарь небольшой и выгружается целиком: по нему расшифровываются term_id
+    for term in db['dictionary'].find({}).batch_size(batch_size):
+        files['terms'].write({'term_id': term['_id'], 'kind': term.get('kind'), 'name': term.get('name'),
+                              'translation': (term.get('translations') or {}).get(TARGET_LANG)})
+
+    for file in files.values():
+        file.close()
+    manifest = {
+        'format': fmt,
+        'since': since.isoformat() if since else None,
+        'until': until.isoformat(),
+        'rows': {name: file.rows for name, file in files.items()},
+        'seconds': round(time.monotonic() - started, 1),
+    }
+    with open(os.path.join(out_dir, 'manifest.json'), 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, ensure_ascii=False, indent=2)
+    print(f"Export to {out_dir}: {manifest['rows']} in {manifest['seconds']}s; "
+          f"next incremental export: --since {manifest['until']}")
+    return manifest
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    client = MongoClient(args.mongo_uri)
+    export(client['parfumo'], args.out, args.format, args.since, args.batch_size)
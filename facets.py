@@ -0,0 +1,93 @@
+import argparse
+import os
+import time
+from datetime import datetime, timezone
+
+from pymongo import MongoClient
+
+# Счётчики фасетов поиска /search (google.py).
+#
+# Поиск без фильтров не агрегирует коллекцию на каждый запрос: счётчики по всему каталогу
+# хранятся одним документом в коллекции facet_counts, и этот скрипт пересчитывает их целиком.
+# Запускается периодически (cron) и после крупных обходов; первый раз — из setup_db.py:
+#
+#   python facets.py
+
+COUNTS_COLLECTION = 'facet_counts'
+
+# Фасеты поиска: параметр запроса -> поле документа (массивы индексируются как multikey)
+FACETS = {
+    'top_note': 'notes.top_notes',
+    'heart_note': 'notes.heart_notes',
+    'base_note': 'notes.base_notes',
+    'accord': 'accords',
+    'tag': 'tags',
+    'perfumer': 'perfumers',
+    'gender': 'gender',
+}
+# Фасеты по полю с одним значением: несколько значений в запросе объединяются через ИЛИ
+SCALAR_FACETS = {'gender'}
+FACET_LIMIT = 20
+# Фасеты, значения которых — id терминов словаря
+TERM_FACETS = {'top_note': 'note', 'heart_note': 'note', 'base_note': 'note', 'accord': 'accord', 'tag': 'tag'}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Recount search facets over the whole perfume catalog.")
+    parser.add_argument('--mongo-uri', default=os.environ.get('MONGO_URI', 'mongodb://localhost:27017/'))
+    return parser.parse_args()
+
+
+def facet_pipeline(match, scan_limit=None):
+    """Все счётчики за один проход по документам match (не больше scan_limit документов)."""
+    pipeline = {"total": [{"$count": "count"}]}
+    for facet, field in FACETS.items():
+        pipeline[facet] = [
+            {"$unwind": f"${field}"},
+            {"$group": {"_id": f"${field}", "count": {"$sum": 1}}},
+            {"$sort": {"count": -1, "_id": 1}},
+            {"$limit": FACET_LIMIT},
+        ]
+    pipeline["year"] = [
+        {"$match": {"year": {"$type": "int"}}},
+        {"$group": {"_id": "$year", "count": {"$sum": 1}}},
+        {"$sort": {"_id": -1}},
+    ]
+    stages = [{"$match": match}]
+    if scan_limit:
+        stages.append({"$limit": scan_limit})
+    stages.append({"$project": {"_id": 0, "year": 1, **{field: 1 for field in FACETS.values()}}})
+    stages.append({"$facet": pipeline})
+    return stages
+
+
+def summarize(counts):
+    """(число документов, {фасет: [{value, count}]}) из результата facet_pipeline."""
+    total = counts.pop("total")
+    facets = {facet: [{"value": bucket["_id"], "count": bucket["count"]} for bucket in buckets]
+              for facet, buckets in counts.items()}
+    return (total[0]["count"] if total else 0), facets
+
+
+def build(db):
+    started = time.monotonic()
+    total, facets = summarize(next(db['perfumes'].aggregate(facet_pipeline({}), allowDiskUse=True)))
+    # Один документ заменяется целиком, поэтому просмотрщик не видит полупересчитанных счётчиков
+    db[COUNTS_COLLECTION].replace_one(
+        {'_id': 'all'},
+        {'_id': 'all', 'total': total, 'facets': facets, 'built_at': datetime.now(timezone.utc)},
+        upsert=True,
+    )
+    print(f"Facet counts: {total} perfumes in {time.monotonic() - started:.1f}s")
+    return total
+
+
+def stored_counts(db):
+    """Счётчики по всему каталогу из последнего пересчёта или None, если его ещё не было."""
+    return db[COUNTS_COLLECTION].find_one({'_id': 'all'})
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    client = MongoClient(args.mongo_uri)
+    build(client['parfumo'])
@@ -0,0 +1,71 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Локальная замена translate.google.com для проверки переводчика без сети.
+# Отвечает в формате translate_a/single: каждая строка "text" переводится как "[tl] text".
+#
+#   python fake_translate_server.py 8777
+#   TRANSLATE_URL=http://localhost:8777/translate_a/single python main.py
+
+
+class FakeTranslateHandler(BaseHTTPRequestHandler):
+    requests_served = 0
+    lock = threading.Lock()
+
+    def _reply(self, params):
+        text = params.get('q', [''])[0]
+        target_lang = params.get('tl', ['ru'])[0]
+        lines = text.split('\n')
+        chunks = []
+        for index, line in enumerate(lines):
+            suffix = '\n' if index < len(lines) - 1 else ''
+            chunks.append([f"[{target_lang}] {line}{suffix}", f"{line}{suffix}", None, None, 1])
+
+        body = json.dumps([chunks, None, params.get('sl', ['auto'])[0]], ensure_ascii=False).encode('utf-8')
+        with FakeTranslateHandler.lock:
+            FakeTranslateHandler.requests_served += 1
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        if parsed.path == '/stats':
+            body = json.dumps({'requests_served': FakeTranslateHandler.requests_served}).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self._reply(parse_qs(parsed.query))
+
+    def do_POST(self):
+        params = parse_qs(urlparse(self.path).query)
+        length = int(self.headers.get('Content-Length', 0))
+        params.update(parse_qs(self.rfile.read(length).decode('utf-8')))
+        self._reply(params)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(port=0):
+    """Запускает сервер в фоновом потоке и возвращает его (адрес в server.server_address)."""
+    server = ThreadingHTTPServer(('127.0.0.1', port), FakeTranslateHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    import sys
+
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8777
+    server = ThreadingHTTPServer(('127.0.0.1', port), FakeTranslateHandler)
+    print(f"Fake translate server listening on http://127.0.0.1:{port}/translate_a/single")
+    server.serve_forever()
@@ -0,0 +1,171 @@
+import os
+import socket
+import time
+import uuid
+
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+
+# Сколько секунд действует аренда задачи; зависший или упавший процесс отдаёт её по истечении срока
+LEASE_SECONDS = 600
+MAX_ATTEMPTS = 3
+
+PENDING = 'pending'
+IN_PROGRESS = 'in_progress'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class Frontier:
+    """Устойчивая очередь обхода в MongoDB: бренды с последней пройденной страницей и статусы парфюмов.
+
+    Задачи выдаются в аренду атомарным find_one_and_update, поэтому несколько процессов
+    (и машин) могут брать работу из одной очереди без пересечений. После падения процесса
+    обход продолжается с того же места: готовые страницы и парфюмы повторно не загружаются.
+    """
+
+    def __init__(self, db, owner=None, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS, dead_letters=None):
+        self.brands = db['frontier_brands']
+        # Задачи, исчерпавшие попытки, попадают в очередь отказов (см. resilience.DeadLetters)
+        self.dead_letters = dead_letters
+        self.perfumes = db['frontier_perfumes']
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+        self.brands.create_index('url', unique=True)
+        self.brands.create_index([('status', ASCENDING), ('lease_until', ASCENDING)])
+        self.brands.create_index([('shard', ASCENDING), ('priority', DESCENDING)])
+        self.perfumes.create_index('url', unique=True)
+        self.perfumes.create_index([('status', ASCENDING), ('lease_until', ASCENDING)])
+
+    def _leasable(self, **filters):
+        return dict(filters, **{"$or": [
+            {"status": PENDING},
+            {"status": IN_PROGRESS, "lease_until": {"$lt": time.time()}},
+        ]})
+
+    def _lease(self, collection, sort=None, **filters):
+        return collection.find_one_and_update(
+            self._leasable(**filters),
+            {"$set": {"status": IN_PROGRESS, "owner": self.owner, "lease_until": time.time() + self.lease_seconds},
+             "$inc": {"attempts": 1}},
+            sort=sort,
+            return_document=ReturnDocument.AFTER,
+        )
+
+    # Бренды
+
+    def add_brands(self, brands, shard=None):
+        """Ставит в очередь бренды из каталога (см. brands.py).
+
+        Шард и приоритет (число парфюмов) обновляются при каждом планировании,
+        состояние обхода уже известных брендов сохраняется.
+        """
+        ops = [UpdateOne({"url": brand['url']},
+                         {"$setOnInsert": {"url": brand['url'], "status": PENDING, "attempts": 0, "last_page": 0,
+                                           "added_at": time.time()},
+                          "$set": {"letter": brand.get('letter'), "shard": shard,
+                                   "priority": brand.get('perfume_count') or 0}},
+                         upsert=True)
+               for brand in brands]
+        if ops:
+            self.brands.bulk_write(ops, ordered=False)
+
+    def lease_brand(self, shard=None):
+        """Берёт в аренду следующий бренд шарда (если он задан), начиная с самых крупных.
+
+        В документе last_page — последняя полностью обработанная страница.
+        """
+        filters = {"shard": shard} if shard is not None else {}
+        return self._lease(self.brands, sort=[("priority", DESCENDING)], **filters)
+
+    def complete_brand_page(self, brand_url, page_number):
+        # Заодно продлеваем аренду: бренд с сотней страниц может обходиться долго
+        self.brands.update_one(
+            {"url": brand_url, "owner": self.owner},
+            {"$max": {"last_page": page_number}, "$set": {"lease_until": time.time() + self.lease_seconds}},
+        )
+
+    def finish_brand(self, brand_url, failed=False, error=None):
+        return self._finish(self.brands, 'brand', brand_url, failed, error)
+
+    def requeue_brands(self, urls):
+        """Возвращает бренды в очередь; обход продолжится с последней пройденной страницы."""
+        return self._requeue(self.brands, urls)
+
+    # Парфюмы
+
+    def add_perfumes(self, brand_url, cards):
+        """Ставит в очередь парфюмы с карточек листинга бренда: url, name, brand и perfume_id."""
+        ops = [UpdateOne({"url": card['url']},
+                         {"$setOnInsert": dict(card, brand_url=brand_url, status=PENDING, attempts=0,
+                                               added_at=time.time())},
+                         upsert=True)
+               for card in {card['url']: card for card in cards}.values()]
+        if ops:
+            self.perfumes.bulk_write(ops, ordered=False)
+
+    def requeue_perfumes(self, urls):
+        """Возвращает уже пройденные парфюмы в очередь для повторного визита (см. recrawl.py)."""
+        return self._requeue(self.perfumes, urls)
+
+    def lease_perfume(self, urls=None):
+        """Берёт в аренду следующий парфюм очереди, а если задан urls — только один из них."""
+        filters = {"url": {"$in": list(urls)}} if urls is not None else {}
+        perfume = self._lease(self.perfumes, **filters)
+        return perfume['url'] if perfume else None
+
+    def finish_perfume(self, url, failed=False, error=None):
+        return self._finish(self.perfumes, 'perfume', url, failed, error)
+
+    def done_perfumes(self, urls):
+        """Какие из urls уже успешно пройдены."""
+        return [task['url'] for task in self.perfumes.find({"url": {"$in": list(urls)}, "status": DONE}, {"url": 1})]
+
+    def _requeue(self, collection, urls):
+        ops = [UpdateOne({"url": url},
+                         {"$set": {"status": PENDING, "attempts": 0, "requeued_at": time.time()},
+                          "$setOnInsert": {"added_at": time.time()}},
+                         upsert=True) for url in urls]
+        if ops:
+            collection.bulk_write(ops, ordered=False)
+        return len(ops)
+
+    def _finish(self, collection, stage, url, failed=False, error=None):
+        """Завершает задачу и возвращает её новый статус.
+
+        Завершить можно только свою действующую аренду: если срок истёк и задачу уже взял другой
+        процесс, запись не меняется и возвращается None.
+        """
+        held = {"url": url, "owner": self.owner, "status": IN_PROGRESS}
+        finished = {"finished_at": time.time()}
+        if not failed:
+            result = collection.update_one(held, {"$set": dict(finished, status=DONE), "$unset": {"lease_until": ""}})
+            return DONE if result.matched_count else self._lost(stage, url)
+        # Неудачная задача возвращается в очередь, пока не исчерпаны попытки. Число попыток меняется
+        # только при выдаче аренды, поэтому условие на attempts и запись статуса — одна атомарная операция
+        for status, attempts in ((FAILED, {"$gte": self.max_attempts}), (PENDING, {"$lt": self.max_attempts})):
+            task = collection.find_one_and_update(
+                dict(held, attempts=attempts),
+                {"$set": dict(finished, status=status, error=error), "$unset": {"lease_until": ""}},
+                projection={"attempts": 1},
+            )
+            if task is not None:
+                break
+        else:
+            return self._lost(stage, url)
+        if status == FAILED and self.dead_letters is not None:
+            self.dead_letters.add(stage, url, error, attempts=task.get('attempts', 0))
+        return status
+
+    @staticmethod
+    def _lost(stage, url):
+        print(f"Lease on {stage} {url} is no longer ours (expired and re-leased?), result not recorded")
+        return None
+
+    def counts(self):
+        result = {}
+        for name, collection in (('brands', self.brands), ('perfumes', self.perfumes)):
+            result[name] = {row['_id']: row['count'] for row in
+                            collection.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}])}
+        return result
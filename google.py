@@ -1,16 +1,85 @@
-from flask import Flask, jsonify, request, render_template_string, send_from_directory
-from pymongo import MongoClient
+from flask import Flask, Response, abort, jsonify, request, render_template_string, send_file, stream_with_context
+from werkzeug.security import safe_join
+from pymongo import ASCENDING, MongoClient
+from datetime import datetime, timezone
+import base64
+import hashlib
+import json
 import os
+import time
+
+import thumbnails
+from dictionary import NOTE_LAYERS, TERM_FIELDS, term_label
+from facets import FACETS, SCALAR_FACETS, TERM_FACETS, facet_pipeline, stored_counts, summarize
+from response_cache import LRUCache, ResponseCache, connect_redis
 
 app = Flask(__name__)
 
-# Подключение к MongoDB
-client = MongoClient('mongodb://localhost:27017/')
+# Подключение к MongoDB. Пул соединений рассчитан на многопоточный сервер (см. serve.py):
+# один клиент на процесс, не больше MONGO_MAX_POOL соединений, ожидание свободного ограничено
+client = MongoClient(
+    os.environ.get('MONGO_URI', 'mongodb://localhost:27017/'),
+    maxPoolSize=int(os.environ.get('MONGO_MAX_POOL', 100)),
+    minPoolSize=int(os.environ.get('MONGO_MIN_POOL', 4)),
+    maxIdleTimeMS=60000,
+    waitQueueTimeoutMS=int(os.environ.get('MONGO_WAIT_QUEUE_MS', 2000)),
+    serverSelectionTimeoutMS=5000,
+)
 db = client['parfumo']
 collection = db['perfumes']
+# Граф похожих парфюмов, собирается similar_graph.py
+similar_collection = db['similar']
+# Словарь нот, аккордов и тегов (dictionary.py): документы парфюмов хранят id терминов
+dictionary_collection = db['dictionary']
+
+# Пагинация списка парфюмов и поля, по которым доступен поиск по префиксу
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+SEARCH_FIELDS = ('name', 'brand')
+
+# Счётчики фасетов по всему каталогу (см. facets.py) перечитываются из MongoDB не чаще раза в FACET_CACHE_SECONDS
+FACET_CACHE_SECONDS = 60
+# С фильтрами счётчики считаются по первым FACET_SCAN_LIMIT найденным документам, а не по всей выборке
+FACET_SCAN_LIMIT = int(os.environ.get('FACET_SCAN_LIMIT', 10000))
+FILTERED_FACET_CACHE_SIZE = 1000
+# Кэш названий терминов словаря
+TERM_LABEL_CACHE_SIZE = 50000
+TERM_LABEL_TTL = int(os.environ.get('TERM_LABEL_TTL', 600))
+
+
+def ensure_indexes():
+    """Индексы просмотрщика; создаются отдельным шагом (python setup_db.py), а не при импорте модуля."""
+    # Сортировка и курсор /perfumes: (поле поиска, perfume_id)
+    for search_field in SEARCH_FIELDS:
+        collection.create_index([(search_field, ASCENDING), ("perfume_id", ASCENDING)])
+    # Отдельный индекс на каждый фасет: составной индекс может включать только одно поле-массив
+    for facet_field in FACETS.values():
+        collection.create_index([(facet_field, ASCENDING), ("name", ASCENDING)])
+    collection.create_index([("year", ASCENDING), ("name", ASCENDING)])
+
+def updated_version(updated_at):
+    """Версия документа по updated_at (pymongo возвращает время в UTC без часового пояса)."""
+    if not isinstance(updated_at, datetime):
+        return None
+    return updated_at.replace(tzinfo=timezone.utc).isoformat()
+
+
+def perfume_unchanged(perfume_id, cached):
+    """Сверка закэшированного ответа с MongoDB по updated_at — по индексу perfume_id, без чтения документа."""
+    perfume = collection.find_one({"perfume_id": perfume_id}, {"_id": 0, "updated_at": 1})
+    return perfume is not None and updated_version(perfume.get('updated_at')) == cached.get('version')
+
+
+# Кэш готовых ответов /perfume/<perfume_id>; краулер сбрасывает записи после перезаписи документов
+# через Redis, а без него записи сверяются с MongoDB (см. response_cache.py)
+perfume_cache = ResponseCache(shared=connect_redis(), revalidate=perfume_unchanged)
 
 # Указываем путь к папке с изображениями
 app.config['IMAGE_FOLDER'] = os.path.join(os.getcwd(), 'images')
+# За nginx/Apache файл может отдавать сам веб-сервер (X-Sendfile)
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE') == '1'
+# Изображения и превью адресуются хешем содержимого, поэтому их можно кэшировать навсегда
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
 
 # Маршрут для отображения страницы с парфюмами
 @app.route('/')
@@ -41,6 +110,24 @@ def index():
             color: #333;
         }
 
+        .perfume-search {
+            display: flex;
+            gap: 10px;
+            margin-bottom: 10px;
+        }
+
+        .perfume-search input {
+            flex-grow: 1;
+            padding: 8px;
+        }
+
+        #load-more {
+            display: block;
+            margin: 0 auto 20px;
+            padding: 8px 20px;
+            cursor: pointer;
+        }
+
         #perfume-list {
             display: flex;
             flex-wrap: wrap;
@@ -137,6 +224,14 @@ def index():
             margin-top: 15px;
         }
 
+        .similar-item {
+            display: flex;
+            align-items: center;
+            gap: 10px;
+            padding: 5px 0;
+            cursor: pointer;
+        }
+
         .tag {
             display: inline-block;
             background-color: #eee;
@@ -168,9 +263,17 @@ def index():
 <body>
     <div class="container">
         <h1>Коллекция Парфюмов</h1>
+        <div class="perfume-search">
+            <input id="search-input" type="text" placeholder="Поиск по началу названия или бренда">
+            <select id="search-field">
+                <option value="name">Название</option>
+                <option value="brand">Бренд</option>
+            </select>
+        </div>
         <div id="perfume-list">
             <!-- Список парфюмов будет загружен сюда -->
         </div>
+        <button id="load-more" hidden>Загрузить ещё</button>
         <div id="perfume-details">
             <!-- Детали парфюма будут отображаться здесь -->
         </div>
@@ -179,26 +282,78 @@ def index():
         document.addEventListener("DOMContentLoaded", () => {
             const perfumeListElement = document.getElementById('perfume-list');
             const perfumeDetailsElement = document.getElementById('perfume-details');
-
-            // Функция для получения списка парфюмов
-            function fetchPerfumes() {
-                fetch('/perfumes')
+            const searchInput = document.getElementById('search-input');
+            const searchField = document.getElementById('search-field');
+            const loadMoreButton = document.getElementById('load-more');
+            let nextCursor = null;
+            let searchTimer = null;
+
+            // Функция для получения очередной страницы списка парфюмов
+            function fetchPerfumes(reset = true) {
+                const params = new URLSearchParams({field: searchField.value});
+                if (searchInput.value.trim()) {
+                    params.set('q', searchInput.value.trim());
+                }
+                if (!reset && nextCursor) {
+                    params.set('after', nextCursor);
+                }
+                fetch(`/perfumes?${params}`)
                     .then(response => response.json())
                     .then(data => {
-                        perfumeListElement.innerHTML = '';
-                        data.forEach(perfume => {
+                        if (reset) {
+                            perfumeListElement.innerHTML = '';
+                        }
+                        data.items.forEach(perfume => {
                             const item = document.createElement('div');
                             item.className = 'perfume-item';
                             item.textContent = perfume.name;
                             item.addEventListener('click', () => fetchPerfumeDetails(perfume.perfume_id));
                             perfumeListElement.appendChild(item);
                         });
+                        nextCursor = data.next;
+                        loadMoreButton.hidden = !nextCursor;
                     })
                     .catch(error => {
                         console.error('Ошибка при получении списка парфюмов:', error);
                     });
             }
 
+            loadMoreButton.addEventListener('click', () => fetchPerfumes(false));
+            searchField.addEventListener('change', () => fetchPerfumes());
+            searchInput.addEventListener('input', () => {
+                clearTimeout(searchTimer);
+                searchTimer = setTimeout(() => fetchPerfumes(), 300);
+            });
+
+            // Превью нужной ширины вместо оригинала (см. /images и thumbnails.py)
+            function imageUrl(filename, width) {
+                return `/images/${encodeURIComponent(filename)}?w=${width}`;
+            }
+
+            // Похожие парфюмы и "вам может понравиться" из готового графа (similar_graph.py)
+            function fetchSimilar(perfumeId) {
+                fetch(`/perfume/${encodeURIComponent(perfumeId)}/similar?hops=2`)
+                    .then(response => response.ok ? response.json() : {similar: [], also_like: []})
+                    .then(data => {
+                        const similarList = document.getElementById('similar-list');
+                        if (!similarList) {
+                            return;
+                        }
+                        [...data.similar, ...data.also_like].forEach(perfume => {
+                            const item = document.createElement('div');
+                            item.className = 'similar-item';
+                            item.innerHTML = perfume.thumbnail
+                                ? `<img src="${imageUrl(perfume.thumbnail, 50)}" width="50" alt="">` : '';
+                            item.append(`${perfume.name} — ${perfume.brand}`);
+                            item.addEventListener('click', () => fetchPerfumeDetails(perfume.perfume_id));
+                            similarList.appendChild(item);
+                        });
+                    })
+                    .catch(error => {
+                        console.error('Ошибка при получении похожих парфюмов:', error);
+                    });
+            }
+
             // Функция для получения деталей парфюма
             function fetchPerfumeDetails(perfumeId) {
                 fetch(`/perfume/${encodeURIComponent(perfumeId)}`)
@@ -223,7 +378,7 @@ def index():
 
                             perfumeDetailsElement.innerHTML = `
                                 <div class="perfume-header">
-                                    <img src="/images/${data.main_image}" alt="${data.name} основное изображение">
+                                    <img src="${imageUrl(data.main_image, 200)}" srcset="${imageUrl(data.main_image, 400)} 2x" width="200" alt="${data.name} основное изображение">
                                     <div class="perfume-main">
                                         <h2>${data.name}</h2>
                                         <p><strong>Бренд:</strong> ${data.brand}</p>
@@ -233,7 +388,7 @@ def index():
                                         <p><strong>Год выпуска:</strong> ${data.release_year}</p>
                                         <div class="perfume-accords">${accordsHTML}</div>
                                         <div class="additional-images">
-                                            ${data.additional_images.map(img => `<img src="/images/${img}" alt="Дополнительное изображение">`).join('')}
+                                            ${data.additional_images.map(img => `<img src="${imageUrl(img, 50)}" srcset="${imageUrl(img, 100)} 2x" width="50" alt="Дополнительное изображение">`).join('')}
                                         </div>
                                     </div>
                                 </div>
@@ -254,7 +409,12 @@ def index():
                                     <h3>Отзывы</h3>
                                     ${reviewsHTML}
                                 </div>
+                                <div class="similar">
+                                    <h3>Похожие</h3>
+                                    <div id="similar-list"></div>
+                                </div>
                             `;
+                            fetchSimilar(perfumeId);
                         }
                     })
                     .catch(error => {
@@ -271,31 +431,353 @@ def index():
 ''')
 
 
-# Маршрут для получения списка парфюмов
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """[значение поля сортировки, perfume_id] из курсора клиента.
+
+    Значения подставляются в запрос к MongoDB, поэтому принимаются только строки
+    (поля сортировки name и brand строковые; null — документ без поля), иначе
+    объект вроде {"$ne": null} сработал бы как оператор.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (TypeError, ValueError) as e:
+        raise ValueError("invalid cursor") from e
+    if not isinstance(values, list) or len(values) != 2:
+        raise ValueError("invalid cursor")
+    last_value, last_id = values
+    if not isinstance(last_value, (str, type(None))) or not isinstance(last_id, str):
+        raise ValueError("invalid cursor")
+    return values
+
+
+def after_cursor(field, last_value, last_id):
+    """Условие "после курсора" для сортировки (field, perfume_id) по возрастанию.
+
+    Документы без поля (null) идут первыми, а {"$gt": null} не находит ничего, поэтому
+    после такого документа следующими идут оставшиеся без поля и все, у кого поле есть.
+    """
+    if last_value is None:
+        return {"$or": [{field: {"$ne": None}}, {field: None, "perfume_id": {"$gt": last_id}}]}
+    return {"$or": [{field: {"$gt": last_value}}, {field: last_value, "perfume_id": {"$gt": last_id}}]}
+
+
+# Маршрут для получения списка парфюмов.
+# Параметры: limit, after (курсор из поля next предыдущего ответа), q (начало названия или бренда),
+# field (name или brand — по какому полю искать и сортировать), format=ndjson для потоковой выдачи.
 @app.route('/perfumes', methods=['GET'])
 def get_perfumes():
-    perfumes = collection.find({}, {"_id": 0, "name": 1, "perfume_id": 1})
-    perfume_list = [{"name": perfume['name'], "perfume_id": perfume['perfume_id']} for perfume in perfumes]
-    return jsonify(perfume_list)
+    field = request.args.get('field', 'name')
+    if field not in SEARCH_FIELDS:
+        return jsonify({"error": f"field must be one of {', '.join(SEARCH_FIELDS)}"}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+
+    conditions = []
+    prefix = request.args.get('q', '').strip()
+    if prefix:
+        # Поиск по префиксу диапазоном, чтобы использовать индекс по полю
+        conditions.append({field: {"$gte": prefix, "$lt": prefix + "\uffff"}})
+    after = request.args.get('after')
+    if after:
+        try:
+            last_value, last_id = decode_cursor(after)
+        except ValueError:
+            return jsonify({"error": "invalid cursor"}), 400
+        conditions.append(after_cursor(field, last_value, last_id))
+    query = {"$and": conditions} if conditions else {}
+
+    cursor = collection.find(query, {"_id": 0, "name": 1, "brand": 1, "perfume_id": 1}) \
+        .sort([(field, ASCENDING), ("perfume_id", ASCENDING)])
+
+    if request.args.get('format') == 'ndjson':
+        # Потоковая выдача: документы читаются с сервера пачками и сразу отправляются клиенту
+        if 'limit' in request.args:
+            cursor = cursor.limit(limit)
+
+        def generate():
+            for perfume in cursor.batch_size(1000):
+                yield json.dumps(perfume, ensure_ascii=False) + '\n'
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    perfumes = list(cursor.limit(limit + 1))
+    next_cursor = None
+    if len(perfumes) > limit:
+        perfumes = perfumes[:limit]
+        next_cursor = encode_cursor([perfumes[-1].get(field), perfumes[-1]['perfume_id']])
+    return jsonify({"items": perfumes, "next": next_cursor})
+
+# Названия терминов по id. Переименованный или заново переведённый термин (см. dictionary.py)
+# просмотрщик увидит не позже чем через TERM_LABEL_TTL секунд
+term_labels = LRUCache(maxsize=TERM_LABEL_CACHE_SIZE, ttl=TERM_LABEL_TTL)
+
+
+def load_term_labels(term_ids):
+    labels, missing = {}, []
+    for term_id in set(term_ids):
+        label = term_labels.get(term_id)
+        if label is None:
+            missing.append(term_id)
+        else:
+            labels[term_id] = label
+    if missing:
+        for term in dictionary_collection.find({"_id": {"$in": missing}}):
+            labels[term['_id']] = term_label(term)
+            term_labels.set(term['_id'], labels[term['_id']])
+    return labels
+
+
+def expand_terms(perfume):
+    """Подставляет названия вместо id нот, аккордов и тегов (строки старых документов остаются как есть)."""
+    notes = perfume.get('notes') or {}
+    term_ids = [value for layer in notes.values() for value in layer if isinstance(value, int)]
+    for field in TERM_FIELDS:
+        term_ids.extend(value for value in perfume.get(field) or () if isinstance(value, int))
+    if not term_ids:
+        return perfume
+    labels = load_term_labels(term_ids)
+
+    def expand(values):
+        return [labels.get(value, str(value)) if isinstance(value, int) else value for value in values]
+
+    perfume['notes'] = {layer: expand(notes.get(layer) or []) for layer in NOTE_LAYERS if layer in notes}
+    for field in TERM_FIELDS:
+        if field in perfume:
+            perfume[field] = expand(perfume[field])
+    return perfume
+
+
+def resolve_term(kind, value):
+    """Значения для поиска по фасету-термину: id по английскому названию, переводу или числу, плюс сама строка."""
+    if value.isdigit():
+        return [int(value)]
+    term_ids = [term['_id'] for term in dictionary_collection.find(
+        {"kind": kind, "$or": [{"name": value}, {"translations.ru": value}]}, {"_id": 1})]
+    # Строка — для документов, записанных до появления словаря
+    return term_ids + [value]
+
+
+def search_query(args):
+    """Условия поиска из параметров запроса: значения одного фасета и разных фасетов объединяются через И.
+
+    Исключение — фасеты с одним значением в документе (SCALAR_FACETS, например gender): через И несколько
+    значений не дали бы ни одного результата, поэтому они объединяются через ИЛИ. Значения сортируются,
+    чтобы одинаковые запросы давали одинаковые условия (по ним кэшируются счётчики фасетов).
+    """
+    conditions = []
+    for facet, field in FACETS.items():
+        values = sorted({value for value in args.getlist(facet) if value})
+        if facet in TERM_FACETS:
+            conditions.extend({field: {"$in": resolve_term(TERM_FACETS[facet], value)}} for value in values)
+        elif len(values) == 1:
+            conditions.append({field: values[0]})
+        elif values and facet in SCALAR_FACETS:
+            conditions.append({field: {"$in": values}})
+        elif values:
+            conditions.append({field: {"$all": values}})
+    years = {}
+    if args.get('year_from'):
+        years["$gte"] = int(args['year_from'])
+    if args.get('year_to'):
+        years["$lte"] = int(args['year_to'])
+    if years:
+        conditions.append({"year": years})
+    return conditions
+
+
+# Поиск по фасетам, например /search?base_note=Vanilla&accord=Woody&year_from=2015&gender=female.
+# Возвращает страницу результатов (курсор как в /perfumes), общее число и счётчики по каждому фасету
+# среди найденных парфюмов; facets=0 отключает подсчёт. Без фильтров счётчики берутся из пересчёта
+# facets.py (facets_built_at), с фильтрами — по найденным документам, но не больше FACET_SCAN_LIMIT:
+# тогда facets_sampled=true и facets_scanned — сколько документов учтено. Счётчики с фильтрами кэшируются
+# на FACET_CACHE_SECONDS по условиям запроса. Ноты, аккорды и теги можно задавать английским названием, переводом или id словаря.
+@app.route('/search', methods=['GET'])
+def search_perfumes():
+    try:
+        limit = min(max(int(request.args.get('limit', PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        conditions = search_query(request.args)
+    except ValueError:
+        return jsonify({"error": "limit, year_from and year_to must be integers"}), 400
+    match = {"$and": conditions} if conditions else {}
+
+    page_conditions = list(conditions)
+    after = request.args.get('after')
+    if after:
+        try:
+            last_name, last_id = decode_cursor(after)
+        except ValueError:
+            return jsonify({"error": "invalid cursor"}), 400
+        page_conditions.append(after_cursor("name", last_name, last_id))
+
+    perfumes = list(collection.find({"$and": page_conditions} if page_conditions else {},
+                                    {"_id": 0, "name": 1, "brand": 1, "perfume_id": 1, "year": 1})
+                    .sort([("name", ASCENDING), ("perfume_id", ASCENDING)])
+                    .limit(limit + 1))
+    next_cursor = None
+    if len(perfumes) > limit:
+        perfumes = perfumes[:limit]
+        next_cursor = encode_cursor([perfumes[-1].get('name'), perfumes[-1]['perfume_id']])
+    result = {"items": perfumes, "next": next_cursor}
+
+    if request.args.get('facets', '1') != '0':
+        if conditions:
+            facet_counts = filtered_facet_counts(match)
+        else:
+            facet_counts = catalog_facet_counts()
+        result.update(facet_counts)
+    return jsonify(result)
+
+
+_catalog_counts = {'loaded_at': None, 'value': None}
+# Счётчики с фильтрами по условиям запроса (см. filtered_facet_counts)
+filtered_counts = LRUCache(maxsize=FILTERED_FACET_CACHE_SIZE, ttl=FACET_CACHE_SECONDS)
+
+
+def catalog_facet_counts():
+    """Счётчики без фильтров: готовый документ facets.py, а не агрегация коллекции на каждый запрос."""
+    now = time.monotonic()
+    if _catalog_counts['loaded_at'] is None or now - _catalog_counts['loaded_at'] > FACET_CACHE_SECONDS:
+        stored = stored_counts(db)
+        if stored is None:
+            # Счётчики ещё не пересчитывались (python facets.py); число парфюмов — по метаданным коллекции
+            value = {"total": collection.estimated_document_count(), "facets": None, "facets_built_at": None}
+        else:
+            built_at = stored['built_at'].replace(tzinfo=timezone.utc).isoformat()
+            value = {"total": stored['total'], "facets": label_facets(stored['facets']), "facets_built_at": built_at}
+        _catalog_counts.update(loaded_at=now, value=value)
+    return _catalog_counts['value']
+
+
+def filtered_facet_counts(match):
+    """Счётчики среди найденных парфюмов; большая выборка считается по первым FACET_SCAN_LIMIT документам.
+
+    Популярные сочетания фильтров повторяются, поэтому результат кэшируется по нормализованным условиям.
+    """
+    key = json.dumps(match, sort_keys=True, default=str)
+    counts = filtered_counts.get(key)
+    if counts is None:
+        total = collection.count_documents(match)
+        _, facets = summarize(next(collection.aggregate(facet_pipeline(match, FACET_SCAN_LIMIT))))
+        counts = {"total": total, "facets": label_facets(facets), "facets_sampled": total > FACET_SCAN_LIMIT,
+                  "facets_scanned": min(total, FACET_SCAN_LIMIT)}
+        filtered_counts.set(key, counts)
+    return counts
+
+
+def label_facets(facets):
+    """Для фасетов-терминов добавляет название к id."""
+    labels = load_term_labels([bucket["value"] for facet in TERM_FACETS for bucket in facets.get(facet, ())
+                               if isinstance(bucket["value"], int)])
+    for facet in TERM_FACETS:
+        for bucket in facets.get(facet, ()):
+            if isinstance(bucket["value"], int):
+                bucket["label"] = labels.get(bucket["value"])
+    return facets
+
+
+def render_perfume(perfume):
+    """Сериализует документ один раз: тело ответа, сильный ETag и время последнего изменения."""
+    expand_terms(perfume)
+    # Преобразуем пути к изображениям, чтобы они работали с Flask
+    # Изображения докачиваются в фоне, поэтому у свежего документа их может ещё не быть
+    if perfume.get('main_image'):
+        perfume['main_image'] = os.path.basename(perfume['main_image'])
+    perfume['additional_images'] = [os.path.basename(img) for img in perfume.get('additional_images', [])]
+    last_modified = None
+    version = updated_version(perfume.get('updated_at'))
+    if version is not None:
+        last_modified = int(datetime.fromisoformat(version).timestamp())
+        perfume['updated_at'] = version
+    body = json.dumps(perfume, ensure_ascii=False)
+    return {
+        'body': body,
+        'etag': hashlib.sha1(body.encode('utf-8')).hexdigest(),
+        'last_modified': last_modified,
+        'version': version,
+    }
+
 
-# Маршрут для получения детальной информации о парфюме по perfume_id
 # Маршрут для получения детальной информации о парфюме по perfume_id
 @app.route('/perfume/<perfume_id>', methods=['GET'])
 def get_perfume_details(perfume_id):
-    perfume = collection.find_one({"perfume_id": perfume_id}, {"_id": 0})
-    if perfume:
-        # Преобразуем пути к изображениям, чтобы они работали с Flask
-        perfume['main_image'] = os.path.basename(perfume['main_image'])
-        perfume['additional_images'] = [os.path.basename(img) for img in perfume['additional_images']]
-        return jsonify(perfume)
-    else:
-        return jsonify({"error": "Perfume not found"}), 404
+    cached = perfume_cache.get(perfume_id)
+    if cached is None:
+        token = perfume_cache.token()
+        perfume = collection.find_one({"perfume_id": perfume_id}, {"_id": 0})
+        if not perfume:
+            return jsonify({"error": "Perfume not found"}), 404
+        cached = render_perfume(perfume)
+        perfume_cache.set(perfume_id, cached, token)
+
+    response = Response(cached['body'], mimetype='application/json')
+    response.set_etag(cached['etag'])
+    if cached['last_modified'] is not None:
+        response.last_modified = datetime.fromtimestamp(cached['last_modified'], timezone.utc)
+    # Браузер и прокси хранят ответ, но каждый раз сверяются с сервером (If-None-Match / If-Modified-Since)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+@app.route('/perfume/<perfume_id>/similar', methods=['GET'])
+def get_similar_perfumes(perfume_id):
+    """Похожие парфюмы (hops=1) и, при hops=2, рекомендации второго круга — одним поиском по _id."""
+    hops = request.args.get('hops', default=1, type=int)
+    if hops not in (1, 2):
+        return jsonify({"error": "hops must be 1 or 2"}), 400
+    projection = {'_id': 0, 'similar': 1}
+    if hops == 2:
+        projection['also_like'] = 1
+    entry = similar_collection.find_one({'_id': perfume_id}, projection)
+    if entry is None:
+        return jsonify({"error": "Perfume not found in the similar graph"}), 404
+    entry['perfume_id'] = perfume_id
+    return jsonify(entry)
+
+
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify(perfume_cache.summary())
 
 
 # Маршрут для статических изображений
 @app.route('/images/<path:filename>')
 def serve_image(filename):
-    return send_from_directory(app.config['IMAGE_FOLDER'], filename)
+    """Оригинал или превью (?w=ширина); WebP отдаётся браузерам, которые его принимают."""
+    image_dir = app.config['IMAGE_FOLDER']
+    # Только изображения: индекс загрузок и временные файлы из той же папки не отдаются
+    if not thumbnails.is_image(filename):
+        abort(404)
+    path = safe_join(image_dir, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    width = request.args.get('w', type=int)
+    vary_accept = False
+    if width and thumbnails.available():
+        webp = 'image/webp' in request.headers.get('Accept', '')
+        vary_accept = True
+        try:
+            path = thumbnails.ensure_thumbnail(image_dir, filename, thumbnails.choose_size(width), webp)
+        except Exception as e:
+            # Повреждённый или неподдерживаемый файл — отдаём оригинал
+            print(f"Could not make thumbnail of {filename}: {e}")
+
+    # send_file сам обрабатывает Range, If-None-Match и If-Modified-Since
+    immutable = thumbnails.is_content_addressed(filename)
+    response = send_file(path, conditional=True, max_age=IMMUTABLE_MAX_AGE if immutable else None)
+    if immutable:
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+    if vary_accept:
+        response.vary.add('Accept')
+    return response
 
 if __name__ == '__main__':
+    # Отладочный сервер для разработки; в боевом режиме запускайте serve.py
     app.run(debug=True)
@@ -0,0 +1,72 @@
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import resilience
+from page_model import parse_html
+
+# Режим загрузки страниц парфюмов: "http" — обычный GET, браузер только для раскрывающихся блоков;
+# "browser" — как раньше, каждая страница рендерится в Chrome. Листинги брендов всегда загружаются по HTTP
+FETCH_MODE = os.environ.get('FETCH_MODE', 'http')
+
+# Размер пула keep-alive соединений на хост
+POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', 32))
+TIMEOUT = 30
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def create_session(pool_size=POOL_SIZE):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update(HEADERS)
+    return session
+
+
+def get_session():
+    """Общая для всех потоков сессия с пулом keep-alive соединений."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = create_session()
+        return _session
+
+
+def _get(url, headers=None, timeout=TIMEOUT):
+    response = get_session().get(url, headers=headers, timeout=timeout)
+    if response.status_code != 304:
+        response.raise_for_status()
+    return response
+
+
+def fetch_html(url, timeout=TIMEOUT):
+    # Временные ошибки и 429 повторяются с паузой, см. resilience.py
+    return resilience.call(lambda: _get(url, timeout=timeout), url, 'fetch').text
+
+
+def fetch_page(url, etag=None, last_modified=None, timeout=TIMEOUT):
+    """Условный GET: (html, etag, last_modified); html равен None, если страница не изменилась (304)."""
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    response = resilience.call(lambda: _get(url, headers, timeout), url, 'fetch')
+    if response.status_code == 304:
+        return None, etag, last_modified
+    return response.text, response.headers.get('ETag'), response.headers.get('Last-Modified')
+
+
+def fetch_soup(url, timeout=TIMEOUT):
+    return parse_html(fetch_html(url, timeout))
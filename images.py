@@ -0,0 +1,180 @@
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import resilience
+import thumbnails
+from http_fetch import create_session
+from metrics import metrics
+
+IMAGE_DIR = 'images'
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', 8))
+# Готовить превью сразу при загрузке; иначе просмотрщик создаст их при первом запросе
+PREGENERATE_THUMBNAILS = os.environ.get('PREGENERATE_THUMBNAILS', '1') == '1'
+CHUNK_SIZE = 1024 * 1024
+TIMEOUT = 60
+
+
+class ImagePipeline:
+    """Фоновая загрузка изображений парфюмов.
+
+    Файлы скачиваются ограниченным пулом потоков через общую keep-alive сессию
+    и сохраняются под SHA-256 содержимого, поэтому одинаковые картинки хранятся один раз,
+    а парфюмы с одинаковыми названиями больше не перезаписывают файлы друг друга.
+    Для уже скачанных URL выполняется условный GET (If-None-Match / If-Modified-Since).
+    """
+
+    def __init__(self, save_directory=IMAGE_DIR, workers=IMAGE_WORKERS, dead_letters=None):
+        self.save_directory = save_directory
+        # Изображения, не скачанные и после повторов, для прохода --retry-dead-letters (см. resilience.py)
+        self.dead_letters = dead_letters
+        os.makedirs(save_directory, exist_ok=True)
+        self.session = create_session(pool_size=workers)
+        self.session.headers['Accept'] = 'image/avif,image/webp,image/*,*/*;q=0.8'
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-worker')
+        # Не даём очереди загрузок расти без ограничений
+        self.slots = threading.BoundedSemaphore(workers * 4)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(save_directory, 'index.sqlite'), check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS images ("
+            "url TEXT PRIMARY KEY, path TEXT NOT NULL, etag TEXT, last_modified TEXT)"
+        )
+        self.db.commit()
+        self.stats = {'downloaded': 0, 'cached': 0, 'not_modified': 0, 'duplicates': 0, 'failed': 0, 'bytes': 0}
+
+    def _count(self, key, n=1):
+        with self.lock:
+            self.stats[key] += n
+
+    def _lookup(self, url):
+        with self.lock:
+            return self.db.execute("SELECT path, etag, last_modified FROM images WHERE url = ?", (url,)).fetchone()
+
+    def _remember(self, url, path, etag, last_modified):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO images (url, path, etag, last_modified) VALUES (?, ?, ?, ?)",
+                            (url, path, etag, last_modified))
+            self.db.commit()
+
+    def download(self, image_url):
+        """Скачивает изображение и возвращает путь к файлу (или None при ошибке)."""
+        with metrics.timer('image_download'):
+            return self._download(image_url)
+
+    def _download(self, image_url):
+        try:
+            known = self._lookup(image_url)
+            headers = {}
+            if known and os.path.exists(known[0]):
+                if not known[1] and not known[2]:
+                    self._count('cached')
+                    return known[0]
+                if known[1]:
+                    headers['If-None-Match'] = known[1]
+                if known[2]:
+                    headers['If-Modified-Since'] = known[2]
+
+            # Временные ошибки (в том числе обрыв посреди файла) повторяются, см. resilience.py
+            return resilience.call(lambda: self._fetch(image_url, headers, known), image_url, 'image_download')
+
+        except Exception as e:
+            print(f"Error downloading image {image_url}: {e}")
+            self._count('failed')
+            return None
+
+    def _fetch(self, image_url, headers, known):
+        with self.session.get(image_url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+            if response.status_code == 304:
+                self._count('not_modified')
+                return known[0]
+            response.raise_for_status()
+
+            extension = os.path.splitext(urlsplit(image_url).path)[1].lower() or '.jpg'
+            digest = hashlib.sha256()
+            size = 0
+            fd, temp_path = tempfile.mkstemp(dir=self.save_directory, suffix='.part')
+            try:
+                with os.fdopen(fd, 'wb') as file:
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        digest.update(chunk)
+                        file.write(chunk)
+                        size += len(chunk)
+            except Exception:
+                # Оборванная загрузка будет повторена с начала
+                os.remove(temp_path)
+                raise
+
+            image_path = os.path.join(self.save_directory, digest.hexdigest() + extension)
+            if os.path.exists(image_path):
+                os.remove(temp_path)
+                self._count('duplicates')
+            else:
+                os.replace(temp_path, image_path)
+                self._count('bytes', size)
+                metrics.inc('image_bytes', size)
+                if PREGENERATE_THUMBNAILS:
+                    with metrics.timer('thumbnails'):
+                        thumbnails.pregenerate(image_path)
+            self._count('downloaded')
+            self._remember(image_url, image_path, response.headers.get('ETag'),
+                           response.headers.get('Last-Modified'))
+            return image_path
+
+    def _submit(self, image_url):
+        self.slots.acquire()
+        future = self.executor.submit(self.download, image_url)
+        future.add_done_callback(lambda _: self.slots.release())
+        return future
+
+    def image_fields(self, perfume_id, main_image_url, urls, paths):
+        """Поля main_image и additional_images по путям скачанных файлов (paths в порядке urls).
+
+        Нескачанные изображения записываются в очередь отказов.
+        """
+        fields = {}
+        for index, (url, path) in enumerate(zip(urls, paths)):
+            is_main = index == 0 and main_image_url is not None
+            if path is None:
+                if self.dead_letters is not None:
+                    self.dead_letters.add('image', url, perfume_id=perfume_id, main=is_main)
+            elif is_main:
+                fields['main_image'] = path
+        fields['additional_images'] = [path for path in paths[1 if main_image_url else 0:] if path]
+        return fields
+
+    def submit_perfume(self, perfume_id, main_image_url, additional_image_urls, on_done):
+        """Ставит в очередь все изображения парфюма.
+
+        Когда они скачаны, вызывается on_done(perfume_id, fields) с полями main_image
+        и additional_images для записи в документ.
+        """
+        urls = ([main_image_url] if main_image_url else []) + list(additional_image_urls)
+        if not urls:
+            return
+        futures = [self._submit(url) for url in urls]
+        remaining = [len(futures)]
+        remaining_lock = threading.Lock()
+
+        def finished(_):
+            with remaining_lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            try:
+                fields = self.image_fields(perfume_id, main_image_url, urls, [future.result() for future in futures])
+                on_done(perfume_id, fields)
+            except Exception as e:
+                print(f"Error saving images of perfume {perfume_id}: {e}")
+
+        for future in futures:
+            future.add_done_callback(finished)
+
+    def close(self):
+        """Дожидается завершения всех загрузок."""
+        self.executor.shutdown(wait=True)
+        print(f"Images: {self.stats}")
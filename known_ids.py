@@ -0,0 +1,76 @@
+import hashlib
+import math
+import threading
+from urllib.parse import urlsplit, urlunsplit
+
+# Начиная с этого размера каталога вместо множеств используется фильтр Блума
+BLOOM_THRESHOLD = 2_000_000
+BLOOM_ERROR_RATE = 0.001
+
+
+def normalize_url(url):
+    """Приводит URL парфюма к каноническому виду: без параметров, якоря и завершающего слэша."""
+    parts = urlsplit(url)
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip('/'), '', ''))
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=BLOOM_ERROR_RATE):
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class KnownPerfumes:
+    """perfume_id и URL уже сохранённых парфюмов, загруженные из MongoDB один раз при старте.
+
+    Для очень больших каталогов хранит их в фильтрах Блума: изредка (с вероятностью
+    BLOOM_ERROR_RATE) новый парфюм может быть ошибочно сочтён известным.
+    """
+
+    def __init__(self, expected=0):
+        self.lock = threading.Lock()
+        if expected > BLOOM_THRESHOLD:
+            capacity = expected * 2
+            self.ids = BloomFilter(capacity)
+            self.urls = BloomFilter(capacity)
+        else:
+            self.ids = set()
+            self.urls = set()
+        self.count = 0
+
+    @classmethod
+    def load(cls, collection):
+        known = cls(expected=collection.estimated_document_count())
+        cursor = collection.find({}, {"_id": 0, "perfume_id": 1, "url": 1}).batch_size(10000)
+        for perfume in cursor:
+            known.add(perfume.get('perfume_id'), perfume.get('url'))
+        print(f"Loaded {known.count} known perfumes from MongoDB.")
+        return known
+
+    def add(self, perfume_id=None, url=None):
+        with self.lock:
+            if perfume_id:
+                self.ids.add(perfume_id)
+                self.count += 1
+            if url:
+                self.urls.add(normalize_url(url))
+
+    def has_id(self, perfume_id):
+        return perfume_id in self.ids
+
+    def has_url(self, url):
+        return normalize_url(url) in self.urls
@@ -0,0 +1,111 @@
+import argparse
+import random
+import threading
+import time
+
+from http_fetch import create_session
+
+# Нагрузочный тест просмотрщика: N потоков в течение заданного времени запрашивают
+# /perfumes (страницы списка, в том числе по курсору и с поиском) и /perfume/<id>,
+# затем печатают p50/p99 и RPS по каждому маршруту.
+#
+#   python serve.py --threads 16 &
+#   python loadtest.py --url http://localhost:8000 --concurrency 32 --duration 30
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load test the perfume viewer API.")
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=30.0, help="Seconds per route")
+    parser.add_argument('--sample', type=int, default=1000, help="How many perfume ids to sample for /perfume/<id>")
+    return parser.parse_args()
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def collect_targets(session, base_url, sample):
+    """Идентификаторы, курсоры и префиксы для запросов, взятые из самого API."""
+    perfume_ids, cursors, prefixes = [], [None], set()
+    cursor = None
+    while len(perfume_ids) < sample:
+        params = {'limit': 100}
+        if cursor:
+            params['after'] = cursor
+        data = session.get(f"{base_url}/perfumes", params=params, timeout=30).json()
+        perfume_ids.extend(item['perfume_id'] for item in data['items'])
+        prefixes.update(item['name'][:2] for item in data['items'] if item.get('name'))
+        cursor = data.get('next')
+        if not cursor:
+            break
+        cursors.append(cursor)
+    if not perfume_ids:
+        raise SystemExit("The viewer returned no perfumes; nothing to test")
+    return perfume_ids, cursors, sorted(prefixes)
+
+
+def run_route(name, make_request, concurrency, duration):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker():
+        session = create_session(pool_size=1)
+        local_latencies, local_errors = [], 0
+        while time.monotonic() < deadline:
+            started = time.monotonic()
+            try:
+                response = make_request(session)
+                if response.status_code >= 400:
+                    local_errors += 1
+            except Exception:
+                local_errors += 1
+            local_latencies.append(time.monotonic() - started)
+        with lock:
+            latencies.extend(local_latencies)
+            errors[0] += local_errors
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    print(f"{name:<28} {len(latencies):>8} req  {len(latencies) / elapsed:>8.1f} rps  "
+          f"p50 {percentile(latencies, 0.50) * 1000:>7.1f} ms  p99 {percentile(latencies, 0.99) * 1000:>7.1f} ms  "
+          f"{errors[0]} errors")
+
+
+def main():
+    args = parse_args()
+    base_url = args.url.rstrip('/')
+    perfume_ids, cursors, prefixes = collect_targets(create_session(pool_size=1), base_url, args.sample)
+    print(f"Testing {base_url} with {args.concurrency} threads, {args.duration:.0f}s per route "
+          f"({len(perfume_ids)} perfume ids, {len(cursors)} list pages)")
+
+    def list_page(session):
+        cursor = random.choice(cursors)
+        return session.get(f"{base_url}/perfumes", params={'after': cursor} if cursor else None, timeout=30)
+
+    def search(session):
+        return session.get(f"{base_url}/perfumes", params={'q': random.choice(prefixes)}, timeout=30)
+
+    def details(session):
+        return session.get(f"{base_url}/perfume/{random.choice(perfume_ids)}", timeout=30)
+
+    run_route("/perfumes", list_page, args.concurrency, args.duration)
+    if prefixes:
+        run_route("/perfumes?q=<prefix>", search, args.concurrency, args.duration)
+    run_route("/perfume/<id>", details, args.concurrency, args.duration)
+
+
+if __name__ == "__main__":
+    main()
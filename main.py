@@ -1,47 +1,50 @@
+import argparse
+import asyncio
+import functools
+import string
 import time
 
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from bs4 import BeautifulSoup
 from pymongo import MongoClient
 from urllib.parse import urljoin
-import requests
-import os
-import re
+import threading
 from concurrent.futures import ThreadPoolExecutor
-import json
 
-# Настройка Selenium
-chrome_options = Options()
-chrome_options.headless = True  # Включаем headless режим
-chrome_options.add_argument("--disable-gpu")
-chrome_options.add_argument("--disable-extensions")
-chrome_options.add_argument("--disable-popup-blocking")
-chrome_options.add_argument("--disable-infobars")
-chrome_options.add_argument("--no-sandbox")
-chrome_options.add_argument("--disable-dev-shm-usage")
-
-prefs = {"profile.managed_default_content_settings.images": 2}  # Отключаем загрузку изображений
-chrome_options.add_experimental_option("prefs", prefs)
-
-# Путь к драйверу ChromeDriver
-service = Service('C:/Users/Khamzat/Desktop/chromedriver-win64/chromedriver-win64/chromedriver.exe')
-
-# Создание экземпляра драйвера
-driver = webdriver.Chrome(service=service, options=chrome_options)
-
-# Устанавливаем тайм-аут на загрузку страницы
-driver.set_page_load_timeout(300)
+import brands
+from browser import DriverPool
+from dictionary import Dictionary
+from http_fetch import FETCH_MODE, fetch_html, fetch_page
+from images import ImagePipeline
+from frontier import Frontier
+from known_ids import KnownPerfumes
+from metrics import METRICS_PORT, configure_logging, metrics
+from mongo_writer import BulkWriter
+from page_model import SIMILAR_BUTTON, TAGS_BUTTON, ListingPage, PerfumePage, parse_html
+from parsers import parse_tags
+import recrawl
+from resilience import DeadLetters
+from response_cache import connect_redis, publish_invalidation
+from translator import Translator, translate_document
+from waits import AdaptiveWaits
 
 # Подключение к MongoDB
 try:
     client = MongoClient('mongodb://localhost:27017/')
     db = client['parfumo']
     collection = db['perfumes']
+    # После каждой пачки записанные парфюмы сбрасываются из общего кэша просмотрщика (google.py)
+    cache_backend = connect_redis()
+    writer = BulkWriter(collection, on_flush=lambda perfume_ids: publish_invalidation(cache_backend, perfume_ids))
+    # Уже сохранённые парфюмы, чтобы не загружать их страницы повторно
+    known_perfumes = KnownPerfumes.load(collection)
+    # Очередь обхода: бренды, пройденные страницы и статусы парфюмов (см. frontier.py)
+    # Задачи и изображения, от которых обход отказался после всех попыток (см. resilience.py)
+    dead_letters = DeadLetters(db)
+    frontier = Frontier(db, dead_letters=dead_letters)
+    # Каталог брендов с числом парфюмов, переиспользуется между запусками (см. brands.py)
+    brand_index = brands.BrandIndex(db)
+    recrawl.ensure_indexes(collection)
     print("Connected to MongoDB successfully.")
 except Exception as e:
     print(f"Error connecting to MongoDB: {e}")
@@ -50,367 +53,631 @@ except Exception as e:
 # Базовый URL
 base_url = "https://www.parfumo.com"
 
-# Функция перевода через неофициальный API Google Translate
-def translate_text(text, target_lang='ru', src_lang='auto'):
-    try:
-        # URL для неофициального API Google Translate
-        url = "https://translate.google.com/translate_a/single"
-
-        # Параметры запроса
-        params = {
-            "client": "gtx",  # Используем "gtx", чтобы указать Google Translate API
-            "sl": src_lang,  # Исходный язык (автоматическое определение)
-            "tl": target_lang,  # Целевой язык
-            "dt": "t",  # Тип перевода
-            "q": text,  # Текст для перевода
-        }
-
-        # Заголовки для запроса
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        }
-
-        # Выполнение запроса
-        response = requests.get(url, params=params, headers=headers)
-        response.raise_for_status()
-
-        # Парсинг результата
-        translated_text = json.loads(response.text)[0][0][0]
-        return translated_text
+# Буквы каталога брендов (страницы /Brands/<буква>)
+BRAND_LETTERS = string.ascii_lowercase
+# Сколько страниц листинга одного бренда загружать одновременно
+LISTING_WORKERS = 8
 
-    except Exception as e:
-        print(f"Translation failed: {e}")
-        return text
+# Максимальные ожидания в секундах, настраиваются из командной строки;
+# фактические тайм-ауты подстраиваются под недавние задержки (см. waits.py)
+NAME_WAIT = 2  # появление названия парфюма после загрузки страницы в браузере
+EXPANDER_WAIT = 4  # кнопки и содержимое блоков "похожие" и "теги"
+# Режим повторного обхода: уже сохранённые парфюмы не пропускаются, а обновляются (см. recrawl.py)
+REFRESH = False
+# Загрузить страницы букв заново, даже если бренды этих букв уже есть в каталоге
+REFRESH_BRANDS = False
+# Нажимать кнопку согласия с cookies в каждом запущенном браузере пула
+ACCEPT_COOKIES = True
 
+waits = AdaptiveWaits()
 
-def sanitize_filename(filename):
-    return re.sub(r'[\\/*?:"<>|]', "", filename)
+# Фоновая загрузка изображений с дедупликацией по содержимому (см. images.py)
+images = ImagePipeline(dead_letters=dead_letters)
 
-def download_image(image_url, save_directory, perfume_name, image_type, image_index=None):
-    try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-
-        response = requests.get(image_url, headers=headers, stream=True)
-        if response.status_code == 200:
-            image_extension = image_url.split('.')[-1]
-            sanitized_perfume_name = sanitize_filename(perfume_name)
-            if image_type == 'main':
-                image_path = os.path.join(save_directory, f"{sanitized_perfume_name}_main.{image_extension}")
-            else:
-                image_path = os.path.join(save_directory, f"{sanitized_perfume_name}_additional_{image_index}.{image_extension}")
+# Переводчик с пакетной отправкой строк и постоянным кэшем (см. translator.py)
+translator = Translator()
 
-            with open(image_path, 'wb') as file:
-                for chunk in response.iter_content(1024):
-                    file.write(chunk)
+# Ноты, аккорды и теги хранятся в документах как id общего словаря; перевод — один раз на термин
+dictionary = Dictionary(db, translator)
 
-            print(f"Image saved at {image_path}")
-            return image_path
-        else:
-            print(f"Failed to download image: {image_url}. Status code: {response.status_code}")
-            return None
+def parse_similar_perfumes(driver, page, interactive=True):
+    # Без браузера (или если кнопки нет в разметке) довольствуемся тем, что уже есть на странице
+    if not interactive or not page.has_similar_button:
+        return page.similar
 
-    except Exception as e:
-        print(f"Error downloading image {image_url}: {e}")
-        return None
+    try:
+        similar_button = waits.until(
+            driver, EC.element_to_be_clickable((By.CSS_SELECTOR, SIMILAR_BUTTON)), 'similar_button', EXPANDER_WAIT
+        )
+        driver.execute_script("arguments[0].scrollIntoView();", similar_button)
+        similar_button.click()
 
-def parse_notes(soup):
-    notes = {'top_notes': [], 'heart_notes': [], 'base_notes': [], 'additional_notes': []}
+        waits.until(driver, EC.presence_of_element_located((By.CSS_SELECTOR, 'div.sim_item')),
+                    'similar_items', EXPANDER_WAIT)
 
-    # Парсинг пирамиды нот, если она есть
-    top_notes_elements = soup.select('div.pyramid_block.nb_t .clickable_note_img')
-    for note in top_notes_elements:
-        notes['top_notes'].append(translate_text(note.text.strip()))
+        # Забираем из браузера только идентификаторы, не перечитывая всю страницу
+        metrics.inc('expansions', block='similar')
+        return [s_id for s_id in driver.execute_script(
+            "return Array.from(document.querySelectorAll('div.sim_item'), e => e.getAttribute('data-s_id'));"
+        ) if s_id]
 
-    heart_notes_elements = soup.select('div.pyramid_block.nb_m .clickable_note_img')
-    for note in heart_notes_elements:
-        notes['heart_notes'].append(translate_text(note.text.strip()))
+    except Exception as e:
+        metrics.failure('expand_similar', e)
+        print("Button to show all similar perfumes not found or not needed.")
+        return page.similar
 
-    base_notes_elements = soup.select('div.pyramid_block.nb_b .clickable_note_img')
-    for note in base_notes_elements:
-        notes['base_notes'].append(translate_text(note.text.strip()))
 
-    # Парсинг нот в другом формате (как в вашем примере)
-    additional_notes_elements = soup.select('div.notes_list div.nb_n span.clickable_note_img')
-    for note in additional_notes_elements:
-        note_text = note.text.strip()
-        if note_text:
-            notes['additional_notes'].append(translate_text(note_text))
+def parse_tags_section(driver, page, interactive=True):
+    if not interactive or not page.has_tags_button:
+        return page.tags
 
-    return notes
-def parse_reviews(soup):
-    reviews_data = []
-    review_elements = soup.select('article.review')
+    try:
+        tags_button = waits.until(
+            driver, EC.element_to_be_clickable((By.CSS_SELECTOR, TAGS_BUTTON)), 'tags_button', EXPANDER_WAIT
+        )
+        tags_button.click()
 
-    for review in review_elements:
-        title_element = review.select_one('div.text-lg.bold span[itemprop="name"]')
-        body_element = review.select_one('div[itemprop="reviewBody"] div.leading-7')
+        waits.until(
+            driver, EC.presence_of_element_located((By.CSS_SELECTOR, 'div#tags_holder a.inline-block.text-lg.grey')),
+            'tags_items', EXPANDER_WAIT
+        )
 
-        if title_element and body_element:
-            review_data = {
-                "title": translate_text(title_element.text.strip()),
-                "body": translate_text(body_element.text.strip())
-            }
-            reviews_data.append(review_data)
+        # Разбираем только изменившийся фрагмент с тегами
+        metrics.inc('expansions', block='tags')
+        return parse_tags(parse_html(driver.execute_script("return document.querySelector('#tags_holder').outerHTML;")))
 
-    return reviews_data
+    except Exception as e:
+        metrics.failure('expand_tags', e)
+        print("Tags section not found or not needed.")
+        return page.tags
 
-def parse_perfumers(soup):
-    perfumers = []
-    perfumers_element = soup.select('h2.text-lg.bold:-soup-contains("Perfumer") + div.w-100 a, h2.text-lg.bold:-soup-contains("Perfumers") + div.w-100 a')
 
-    for perfumer in perfumers_element:
-        perfumers.append(translate_text(perfumer.text.strip()))
+def accept_cookies(driver):
+    """Согласие с cookies в только что запущенном браузере: иначе баннер перекрывает кнопки блоков "похожие" и "теги"."""
+    if not ACCEPT_COOKIES:
+        return
+    try:
+        driver.get(base_url)
+        accept_button = waits.until(
+            driver, EC.element_to_be_clickable((By.XPATH, '//button[text()="Accept"]')), 'accept', 10
+        )
+        accept_button.click()
+        print("Clicked on the 'Accept' button.")
+    except Exception as e:
+        print("Accept button not found or could not be clicked:", e)
 
-    return perfumers
 
-def parse_tags(soup):
-    tags = []
-    tag_elements = soup.select('div#tags_holder a.inline-block.text-lg.grey')
+def render_in_browser(driver, perfume_url):
+    with metrics.timer('driver_get'):
+        driver.get(perfume_url)
+    waits.until(driver, EC.presence_of_element_located((By.CSS_SELECTOR, 'h1.p_name_h1[itemprop="name"]')),
+                'name', NAME_WAIT)
+    with metrics.timer('parse_html'):
+        return parse_html(driver.page_source)
+
+
+def encode_and_translate(perfume_id, perfume_data):
+    # Термины заменяются id словаря, остальные строки страницы переводятся одним пакетом с учётом кэша
+    with metrics.timer('dictionary'):
+        dictionary.encode(perfume_data)
+    with metrics.timer('translate'):
+        stats = translate_document(translator, perfume_data)
+    metrics.inc('translation_strings', stats['strings'])
+    metrics.inc('translation_requests', stats['http_requests'])
+    metrics.inc('translation_cache_hits', stats['cache_hits'])
+    print(f"Translations for {perfume_id}: {stats['strings']} strings, "
+          f"hit rate {stats['hit_rate']:.0%}, {stats['http_requests']} requests, "
+          f"{stats['requests_saved']} requests saved")
+
+
+def refresh_perfume(stored, perfume_data, hashes, etag, last_modified, image_urls):
+    """Обновляет сохранённый парфюм: $set только изменившихся полей, перевод и загрузка только для них."""
+    perfume_id = stored['perfume_id']
+    changed = recrawl.changed_fields(stored.get('field_hashes'), hashes)
+    metrics.annotate(changed=changed)
+    fields = recrawl.visit_fields(stored.get('revisit_interval'), bool(changed), etag, last_modified, hashes)
+    if not changed:
+        metrics.inc('refresh', result='unchanged')
+        writer.set_fields(perfume_id, fields, touch=False)
+        return
+
+    metrics.inc('refresh', result='changed')
+    partial = {field: perfume_data[field] for field in changed if field in perfume_data}
+    encode_and_translate(perfume_id, partial)
+    fields.update(partial)
+    # Год, пропавший со страницы, удаляется, иначе в документе остался бы прежний
+    unset = ()
+    if 'year' in perfume_data:
+        fields['year'] = perfume_data['year']
+    else:
+        unset = ('year',)
+    writer.set_fields(perfume_id, fields, unset=unset)
+    if 'image_urls' in changed:
+        main_image_url, additional_image_urls = image_urls
+        images.submit_perfume(perfume_id, main_image_url, additional_image_urls, writer.set_fields)
+    print(f"Refreshed perfume {perfume_id}: changed {', '.join(changed)}")
+
+
+def skip_known(perfume_id, perfume_url):
+    """True, если парфюм уже сохранён (тогда его страница не разбирается дальше)."""
+    if not known_perfumes.has_id(perfume_id):
+        return False
+    metrics.annotate(skipped=True)
+    print(f"Perfume with ID {perfume_id} already exists, skipping.")
+    # Запоминаем URL, чтобы в следующий раз пропустить парфюм ещё на странице бренда
+    if not known_perfumes.has_url(perfume_url):
+        writer.set_fields(perfume_id, {"url": perfume_url})
+        known_perfumes.add(url=perfume_url)
+    return True
+
+
+def collect_perfume_data(page, perfume_url):
+    """Документ парфюма из статической разметки страницы (без раскрывающихся блоков) и URL его изображений."""
+    perfume_data = {
+        "name": page.name,
+        "brand": page.brand if page.brand is not None else "Unknown",
+        "url": perfume_url,
+        "perfume_id": page.perfume_id,
+    }
+
+    if page.description is not None:
+        perfume_data['description'] = page.description
+        perfume_data['description_links'] = page.description_links
+
+    perfume_data['notes'] = page.notes
+    perfume_data['rating'] = page.rating if page.rating is not None else "No rating"
+
+    if page.gender:
+        perfume_data['gender'] = page.gender
+
+    perfume_data['accords'] = page.accords
+
+    release_year = page.release_year()
+    if release_year is not None:
+        # Текстовая метка переводится вместе с остальными строками в encode_and_translate, после подсчёта хешей
+        perfume_data['release_year'] = release_year
+        if release_year.isdigit():
+            # Числовой год для фильтра по диапазону в поиске (см. /search в google.py)
+            perfume_data['year'] = int(release_year)
+
+    if page.type:
+        perfume_data['type'] = page.type
+
+    # Изображения скачиваются в фоне после записи документа, см. images.ImagePipeline
+    main_image_url = urljoin(perfume_url, page.main_image) if page.main_image else None
+    additional_image_urls = [urljoin(perfume_url, href) for href in page.additional_images]
+    perfume_data['additional_images'] = []
+
+    perfume_data['reviews'] = page.reviews
+    perfume_data['perfumers'] = page.perfumers
+    return perfume_data, main_image_url, additional_image_urls
+
+
+def prepare_perfume(perfume_url, html, etag=None, last_modified=None):
+    """Разбор страницы, загруженной асинхронным движком (см. async_crawler.py), без браузера.
+
+    Возвращает (статус, документ, (main_image_url, additional_image_urls)). Статус 'browser' —
+    странице нужны клики по раскрывающимся блокам, 'skipped' — парфюм уже сохранён,
+    'failed' — нет названия или id, 'new' — документ готов к переводу.
+    """
+    with metrics.timer('parse_html'):
+        soup = parse_html(html)
+    with metrics.timer('page_model'):
+        page = PerfumePage(soup, base_url)
+    if page.name is None or page.has_similar_button or page.has_tags_button:
+        return 'browser', None, None
+    if not page.perfume_id:
+        print(f"Perfume ID not found for {perfume_url}")
+        return 'failed', None, None
+    if skip_known(page.perfume_id, perfume_url):
+        return 'skipped', None, None
+
+    perfume_data, main_image_url, additional_image_urls = collect_perfume_data(page, perfume_url)
+    perfume_data['similar_perfumes'] = page.similar
+    perfume_data['tags'] = page.tags
+    hashes = recrawl.field_hashes(perfume_data, ([main_image_url] if main_image_url else []) + additional_image_urls)
+    perfume_data.update(recrawl.visit_fields(None, True, etag, last_modified, hashes))
+    return 'new', perfume_data, (main_image_url, additional_image_urls)
+
+
+def store_perfume(perfume_data):
+    # Запись идёт пачками, см. mongo_writer.BulkWriter (время самой записи — стадия mongo_flush)
+    with metrics.timer('write_enqueue'):
+        writer.upsert(perfume_data)
+    known_perfumes.add(perfume_data['perfume_id'], perfume_data['url'])
+
+
+def parse_perfume_page(driver, perfume_url):
+    waits.start_page()
+    try:
+        soup = None
+        rendered = False
+        etag = last_modified = None
+        # При повторном обходе берём сохранённые отпечатки и валидаторы HTTP для условного запроса
+        stored = None
+        if REFRESH and known_perfumes.has_url(perfume_url):
+            stored = collection.find_one({"url": perfume_url}, recrawl.STORED_PROJECTION)
+        if FETCH_MODE == 'http':
+            try:
+                with metrics.timer('fetch_http'):
+                    html, etag, last_modified = fetch_page(perfume_url, *(
+                        (stored.get('http_etag'), stored.get('http_last_modified')) if stored else ()))
+                if html is None:
+                    # 304: страница не менялась, только переносим следующий визит
+                    metrics.inc('refresh', result='not_modified')
+                    metrics.annotate(perfume_id=stored['perfume_id'], not_modified=True)
+                    writer.set_fields(stored['perfume_id'],
+                                      recrawl.visit_fields(stored.get('revisit_interval'), False), touch=False)
+                    return True
+                with metrics.timer('parse_html'):
+                    soup = parse_html(html)
+            except Exception as e:
+                metrics.failure('fetch_http', e)
+                print(f"HTTP fetch failed for {perfume_url}, falling back to browser: {e}")
+
+        with metrics.timer('page_model'):
+            page = PerfumePage(soup, base_url) if soup is not None else None
+        if page is None or page.name is None:
+            soup = render_in_browser(driver, perfume_url)
+            with metrics.timer('page_model'):
+                page = PerfumePage(soup, base_url)
+            rendered = True
+        metrics.annotate(rendered=rendered)
+
+        if page.name is not None:
+            perfume_id = page.perfume_id
+            if not perfume_id:
+                print(f"Perfume ID not found for {perfume_url}")
+                return False  # Выход из функции, если perfume_id не найден
+
+            metrics.annotate(perfume_id=perfume_id)
+            if REFRESH and stored is None and known_perfumes.has_id(perfume_id):
+                stored = collection.find_one({"perfume_id": perfume_id}, recrawl.STORED_PROJECTION)
+            if stored is None and skip_known(perfume_id, perfume_url):
+                return True  # Выход из функции, если запись уже существует
+
+            perfume_data, main_image_url, additional_image_urls = collect_perfume_data(page, perfume_url)
+
+            # Раскрывающиеся блоки "похожие" и "теги" требуют кликов: только ради них открываем браузер
+            if not rendered and (page.has_similar_button or page.has_tags_button):
+                render_in_browser(driver, perfume_url)
+                rendered = True
+                metrics.annotate(rendered=True)
+
+            with metrics.timer('expand_similar'):
+                perfume_data['similar_perfumes'] = parse_similar_perfumes(driver, page, interactive=rendered)
+            with metrics.timer('expand_tags'):
+                perfume_data['tags'] = parse_tags_section(driver, page, interactive=rendered)
+
+            # Отпечатки полей считаются до перевода, чтобы сравнивать с тем, что было на странице
+            hashes = recrawl.field_hashes(perfume_data, ([main_image_url] if main_image_url else []) + additional_image_urls)
+            if stored is not None:
+                refresh_perfume(stored, perfume_data, hashes, etag, last_modified, (main_image_url, additional_image_urls))
+                return True
+
+            encode_and_translate(perfume_id, perfume_data)
+            perfume_data.update(recrawl.visit_fields(None, True, etag, last_modified, hashes))
+
+            store_perfume(perfume_data)
+            with metrics.timer('image_enqueue'):
+                images.submit_perfume(perfume_id, main_image_url, additional_image_urls, writer.set_fields)
+            print(f"Queued perfume with ID: {perfume_id} (waited {waits.page_total():.2f}s for the browser)")
+            return True
 
-    for tag in tag_elements:
-        tags.append(translate_text(tag.text.strip()))
+        else:
+            print(f"Name element not found for {perfume_url}")
+            return False
 
-    return tags
+    except Exception as e:
+        metrics.failure('perfume', e)
+        print(f"Error parsing perfume page {perfume_url}: {e}")
+        return False
 
-def parse_similar_perfumes(soup):
-    similar_perfumes = []
 
+def process_perfume(driver, perfume_url):
+    # Статус парфюма сохраняется в очереди обхода, чтобы после перезапуска не загружать его снова
+    metrics.start_trace('perfume', perfume_url)
+    finished = False
     try:
-        similar_button = WebDriverWait(driver, 4).until(
-            EC.element_to_be_clickable((By.CSS_SELECTOR, 'div.action_similar[data-type="all"]'))
-        )
-        driver.execute_script("arguments[0].scrollIntoView();", similar_button)
-        similar_button.click()
+        finished = parse_perfume_page(driver, perfume_url)
+        with metrics.timer('frontier'):
+            frontier.finish_perfume(perfume_url, failed=not finished, error=None if finished else metrics.trace_errors())
+    finally:
+        metrics.finish_trace('ok' if finished else 'failed')
+
+
+def feed_perfumes(pool, brands_done, urls=None):
+    """Раздаёт пулу парфюмы из очереди обхода, пока бренды не пройдены и очередь не опустела.
+
+    Если задан urls, раздаются только эти парфюмы, остальная очередь не трогается.
+    """
+    while True:
+        perfume_url = frontier.lease_perfume(urls)
+        if perfume_url:
+            pool.submit(perfume_url)
+        elif brands_done.is_set() and pool.queue.unfinished_tasks == 0:
+            break
+        else:
+            time.sleep(1)
 
-        WebDriverWait(driver, 4).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, 'div.sim_item'))
-        )
 
-        soup = BeautifulSoup(driver.page_source, 'html.parser')
+def listing_url(brand_url, page_number):
+    return f"{brand_url}?current_page={page_number}&v=grid&o=n_asc&g_f=1&g_m=1&g_u=1"
 
-    except Exception:
-        print("Button to show all similar perfumes not found or not needed.")
 
-    # Независимо от того, была ли найдена и нажата кнопка, парсим имеющиеся данные
-    similar_items = soup.select('div.sim_item')
-    for item in similar_items:
-        s_id = item.get('data-s_id')
-        if s_id:
-            similar_perfumes.append(s_id)
+def parse_listing(html):
+    """Карточки парфюмов со страницы бренда и число страниц бренда (см. page_model.ListingPage)."""
+    page = ListingPage(parse_html(html), base_url)
+    return page.cards, page.page_count
 
-    return similar_perfumes
 
+def known_card(card):
+    """True, если парфюм карточки уже сохранён: по URL или по perfume_id из миниатюры."""
+    if known_perfumes.has_url(card['url']):
+        return True
+    if not card['perfume_id'] or not known_perfumes.has_id(card['perfume_id']):
+        return False
+    # Парфюм сохранён под другим URL — запоминаем и этот, как skip_known
+    writer.set_fields(card['perfume_id'], {"url": card['url']})
+    known_perfumes.add(url=card['url'])
+    return True
 
-def parse_og_image_id(soup):
-    og_image_tag = soup.select_one('meta[property="og:image"]')
-    if og_image_tag:
-        og_image_url = og_image_tag.get('content')
-        og_image_id = og_image_url.split('/')[-1].split('_')[0]
-        return og_image_id
-    return None
 
-def parse_perfume_type(soup):
-    perfume_type_element = soup.select_one('span.p_con.label_a.pointer.upper')
-    if perfume_type_element:
-        perfume_type = perfume_type_element.text.strip()
+def queue_listing(brand_url, page_number, cards):
+    """Записывает в очередь обхода ещё не сохранённые парфюмы страницы и отмечает её пройденной."""
+    new_cards = [card for card in cards if not known_card(card)]
+    with metrics.timer('frontier'):
+        frontier.add_perfumes(brand_url, new_cards)
+        frontier.complete_brand_page(brand_url, page_number)
+    return [card['url'] for card in new_cards]
 
-        # Переводим с французского на русский, используя корректные параметры
-        return translate_text(perfume_type, target_lang='ru', src_lang='fr')
 
-    return None
+def fetch_listing(brand_url, page_number):
+    current_url = listing_url(brand_url, page_number)
+    metrics.start_trace('brand_page', current_url)
+    try:
+        with metrics.timer('brand_fetch'):
+            html = fetch_html(current_url)
+        with metrics.timer('brand_parse'):
+            cards, page_count = parse_listing(html)
+    except Exception:
+        metrics.finish_trace('failed')
+        raise
+    metrics.finish_trace('ok' if cards else 'empty', links=len(cards), page_count=page_count)
+    return cards, page_count
+
 
-def parse_perfume_page(perfume_url):
+def parse_brand_perfumes(brand_url, start_page=1):
+    """Обходит листинг бренда по HTTP, без браузера.
+
+    Первая непройденная страница сообщает число страниц (div.numbers), остальные загружаются
+    параллельно. Карточки попадают в очередь обхода страница за страницей по порядку, поэтому
+    last_page во frontier растёт без пропусков и прерванный обход продолжается с нужного места.
+    """
     try:
-        driver.get(perfume_url)
-        WebDriverWait(driver, 2).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, 'h1.p_name_h1[itemprop="name"]'))
-        )
-        soup = BeautifulSoup(driver.page_source, 'html.parser')
+        page_number = start_page
+        page_count = start_page
+        perfume_count = 0
+        finished = False
+        with ThreadPoolExecutor(max_workers=LISTING_WORKERS, thread_name_prefix='listing') as executor:
+            while not finished and page_number <= page_count:
+                pages = executor.map(lambda number: fetch_listing(brand_url, number),
+                                     range(page_number, page_count + 1))
+                for cards, pages_seen in pages:
+                    if not cards:
+                        # Листинг кончился раньше, чем обещала пагинация
+                        finished = True
+                        break
+                    queue_listing(brand_url, page_number, cards)
+                    perfume_count += len(cards)
+                    # Пагинация может показывать не все номера сразу — дальние страницы загружаются следующим кругом
+                    page_count = max(page_count, pages_seen)
+                    page_number += 1
+
+        # Полный обход листинга уточняет размер бренда для раскладки по шардам
+        if start_page == 1:
+            brand_index.record_count(brand_url, perfume_count)
+        return True
 
-        name_element = soup.select_one('h1.p_name_h1[itemprop="name"]')
-        if name_element:
-            brand_element = name_element.select_one('span[itemprop="brand"] span[itemprop="name"]')
+    except Exception as e:
+        metrics.failure('brand_page', e)
+        print(f"Error parsing brand page {brand_url}: {e}")
+        return False
 
-            perfume_data = {
-                "name": name_element.contents[0].strip(),
-                "brand": brand_element.text.strip() if brand_element else "Unknown"
-            }
 
-            perfume_id = parse_og_image_id(soup)
-            if perfume_id:
-                perfume_data['perfume_id'] = perfume_id
-            else:
-                print(f"Perfume ID not found for {perfume_url}")
-                return  # Выход из функции, если perfume_id не найден
-
-            existing_perfume = collection.find_one({"perfume_id": perfume_id})
-            if existing_perfume:
-                print(f"Perfume with ID {perfume_id} already exists, skipping.")
-                return  # Выход из функции, если запись уже существует
-
-            description_element = soup.select_one('span[itemprop="description"]')
-            if description_element:
-                links = description_element.find_all('a')
-                links_info = []
-                for link in links:
-                    href = link['href'].replace(base_url, '')
-                    text = link.text.strip()
-                    links_info.append({'text': text, 'href': href})
-                    link.replace_with(text)
-
-                translated_description = translate_text(description_element.text.strip())
-                perfume_data['description'] = translated_description
-                perfume_data['description_links'] = links_info
-
-            perfume_data['notes'] = parse_notes(soup)
-
-            ratings = soup.select_one('div.barfiller_element[data-type="bottle"] .bold.green')
-            perfume_data['rating'] = ratings.text.strip() if ratings else "No rating"
-
-            gender_icon = soup.select_one('div.p_gender_big i')
-            if gender_icon:
-                gender_class = gender_icon['class'][1]
-                perfume_data['gender'] = gender_class
-
-            accords = soup.select('div.s-circle-container div.text-xs.grey')
-            perfume_data['accords'] = [translate_text(accord.text.strip()) for accord in accords]
-
-            release_year_element = soup.select_one('span.label_a')
-            if release_year_element:
-                release_year = re.search(r'\b\d{4}\b', release_year_element.text)
-                if release_year:
-                    perfume_data['release_year'] = release_year.group(0)
-                else:
-                    perfume_data['release_year'] = translate_text(release_year_element.text.strip())
-
-            perfume_type = parse_perfume_type(soup)
-            if perfume_type:
-                perfume_data['type'] = perfume_type
-
-            main_image_element = soup.select_one('img.p-main-img[itemprop="image"]')
-            if main_image_element:
-                main_image_url = main_image_element['src']
-                save_directory = 'images'
-                os.makedirs(save_directory, exist_ok=True)
-                main_image_path = download_image(main_image_url, save_directory, perfume_data['name'], image_type='main')
-                if main_image_path:
-                    perfume_data['main_image'] = main_image_path
-
-            additional_image_elements = soup.select('div#p_imagery_holder a.imagery_item')
-            additional_image_paths = []
-            for index, image_element in enumerate(additional_image_elements):
-                image_url = image_element['href']
-                image_path = download_image(image_url, save_directory, perfume_data['name'], image_type='additional',
-                                            image_index=index)
-                if image_path:
-                    additional_image_paths.append(image_path)
-            perfume_data['additional_images'] = additional_image_paths
-
-            perfume_data['reviews'] = parse_reviews(soup)
-            perfume_data['perfumers'] = parse_perfumers(soup)
-
-            similar_perfumes = parse_similar_perfumes(soup)
-            perfume_data['similar_perfumes'] = similar_perfumes
+def schedule_brands(letters, shard_index=0, shard_count=1):
+    """Ставит в очередь обхода бренды этого шарда из каталога и возвращает ключ шарда.
 
-            try:
-                tags_button = WebDriverWait(driver, 4).until(
-                    EC.element_to_be_clickable((By.CSS_SELECTOR, 'div.action_inspiration[data-type="tags"]'))
-                )
-                tags_button.click()
+    Каталог загружается по HTTP только для новых букв (или для всех с --refresh-brands);
+    бренды раскладываются по шардам от крупных к мелким, чтобы шарды заканчивали примерно одновременно.
+    Раскладка закрепляется в каталоге (см. BrandIndex.shard_brands), так что все процессы видят одну и ту же.
+    """
+    brands.discover(brand_index, letters, base_url, refresh=REFRESH_BRANDS)
+    own = brand_index.shard_brands(letters, shard_index, shard_count)
+    shard = f"{shard_index}/{shard_count}"
+    frontier.add_brands(own, shard=shard)
+    print(f"Shard {shard}: {len(own)} brands, about {sum(brand.get('perfume_count') or 0 for brand in own)} "
+          f"perfumes by the brand index")
+    return shard
 
-                WebDriverWait(driver, 4).until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, 'div#tags_holder a.inline-block.text-lg.grey'))
-                )
 
-                soup = BeautifulSoup(driver.page_source, 'html.parser')
-                tags = parse_tags(soup)
+def parse_all_brands(letters=BRAND_LETTERS, shard_index=0, shard_count=1):
+    try:
+        shard = schedule_brands(letters, shard_index, shard_count)
 
-            except Exception as e:
-                print("Tags section not found or not needed.")
-                tags = []
+        pool = DriverPool(process_perfume, on_start=accept_cookies).start()
+        brands_done = threading.Event()
+        feeder = threading.Thread(target=feed_perfumes, args=(pool, brands_done), daemon=True)
+        feeder.start()
+        try:
+            # Бренды шарда берутся в аренду из очереди обхода и продолжаются со следующей непройденной страницы
+            while True:
+                brand = frontier.lease_brand(shard)
+                if not brand:
+                    break
+                print(f"Parsing brand: {brand['url']} from page {brand['last_page'] + 1}")
+                finished = parse_brand_perfumes(brand['url'], start_page=brand['last_page'] + 1)
+                frontier.finish_brand(brand['url'], failed=not finished)
+
+            brands_done.set()
+            feeder.join()
+            pool.join()
+        finally:
+            brands_done.set()
+            pool.shutdown()
 
-            perfume_data['tags'] = tags
+    except Exception as e:
+        print(f"Error parsing brands: {e}")
 
-            result = collection.replace_one({"perfume_id": perfume_id}, perfume_data, upsert=True)
-            if result.upserted_id:
-                print(f"Inserted perfume with ID: {result.upserted_id}")
-            else:
-                print(f"Updated perfume with ID: {perfume_id}")
 
-        else:
-            print(f"Name element not found for {perfume_url}")
+def crawl_async(letters=BRAND_LETTERS, shard_index=0, shard_count=1):
+    """То же, что parse_all_brands, но асинхронными стадиями (см. async_crawler.py).
+
+    Браузеры пула запускаются только для страниц с раскрывающимися блоками.
+    """
+    from async_crawler import AsyncCrawler
 
+    pool = DriverPool(process_perfume, on_start=accept_cookies).start()
+    try:
+        shard = schedule_brands(letters, shard_index, shard_count)
+        crawler = AsyncCrawler(base_url, frontier, images, writer, listing_url, parse_listing, queue_listing,
+                               prepare_perfume, encode_and_translate, store_perfume, pool.submit,
+                               brand_counted=brand_index.record_count)
+        translator.slot = functools.partial(crawler.thread_slot, crawler.translate_url)
+        try:
+            asyncio.run(crawler.run(shard))
+        finally:
+            translator.slot = None
+        pool.join()
     except Exception as e:
-        print(f"Error parsing perfume page {perfume_url}: {e}")
+        print(f"Error in async crawl: {e}")
+    finally:
+        pool.shutdown()
 
 
-def parse_brand_perfumes(brand_url):
-    time.sleep(5)
+def crawl_queued_perfumes(urls=None):
+    """Обходит пулом браузеров парфюмы из очереди обхода (все или только urls)."""
+    pool = DriverPool(process_perfume, on_start=accept_cookies).start()
+    brands_done = threading.Event()
+    brands_done.set()
     try:
-        page_number = 1
-        while True:
-            current_url = f"{brand_url}?current_page={page_number}&v=grid&o=n_asc&g_f=1&g_m=1&g_u=1"
-            driver.get(current_url)
-            soup = BeautifulSoup(driver.page_source, 'html.parser')
-
-            perfume_links = soup.select('div.col-normal div.name a[href]')
-            if not perfume_links:
-                break
-
-            # Открываем несколько вкладок для парфюмов
-            for link in perfume_links:
-                perfume_url = urljoin(base_url, link['href'])
-                driver.execute_script("window.open(arguments[0]);", perfume_url)
-
-            # Обрабатываем каждую вкладку
-            for handle in driver.window_handles[1:]:
-                driver.switch_to.window(handle)
-                parse_perfume_page(driver.current_url)
-                driver.close()  # Закрываем вкладку после завершения обработки
-
-            # Возвращаемся на основную вкладку
-            driver.switch_to.window(driver.window_handles[0])
-
-            next_page = soup.select_one(f'div.numbers div a[href*="current_page={page_number+1}"]')
-            if next_page:
-                page_number += 1
-            else:
-                break
+        feed_perfumes(pool, brands_done, urls)
+        pool.join()
+    finally:
+        pool.shutdown()
+
+
+def refresh_perfumes(limit):
+    """Повторный визит парфюмов, у которых подошёл срок next_visit (см. recrawl.py)."""
+    try:
+        urls = recrawl.due_perfumes(collection, limit)
+        frontier.requeue_perfumes(urls)
+        print(f"Refreshing {len(urls)} perfumes due for a revisit.")
+        # Только подошедшие парфюмы: прочие задачи очереди (повторы, другие шарды) обходит обычный запуск
+        crawl_queued_perfumes(urls)
 
     except Exception as e:
-        print(f"Error parsing brand page {brand_url}: {e}")
+        print(f"Error refreshing perfumes: {e}")
 
 
-def parse_all_brands():
+def retry_dead_letters(limit):
+    """Повторный проход по очереди отказов: страницы парфюмов, изображения и бренды."""
     try:
-        driver.get(base_url + "/Brands/b")
+        perfume_urls = [entry['key'] for entry in dead_letters.pending('perfume', limit)]
+        if perfume_urls:
+            print(f"Retrying {len(perfume_urls)} perfume pages from the dead-letter queue.")
+            frontier.requeue_perfumes(perfume_urls)
+            crawl_queued_perfumes(perfume_urls)
+            dead_letters.resolve('perfume', frontier.done_perfumes(perfume_urls))
+
+        image_entries = dead_letters.pending('image', limit)
+        if image_entries:
+            print(f"Retrying {len(image_entries)} images from the dead-letter queue.")
+        resolved = []
+        for entry in image_entries:
+            image_path = images.download(entry['key'])
+            if image_path is None:
+                dead_letters.add('image', entry['key'], perfume_id=entry['perfume_id'], main=entry['main'])
+            elif entry['main']:
+                writer.set_fields(entry['perfume_id'], {'main_image': image_path})
+                resolved.append(entry['key'])
+            else:
+                writer.add_to_set(entry['perfume_id'], 'additional_images', image_path)
+                resolved.append(entry['key'])
+        dead_letters.resolve('image', resolved)
 
-        # Проверяем наличие кнопки "Accept" и нажимаем на нее, если она есть
-        try:
-            accept_button = WebDriverWait(driver, 10).until(
-                EC.element_to_be_clickable((By.XPATH, '//button[text()="Accept"]'))
-            )
-            accept_button.click()  # Нажимаем на кнопку
-            print("Clicked on the 'Accept' button.")
-        except Exception as e:
-            print("Accept button not found or could not be clicked:", e)
-
-        # Продолжаем парсинг брендов после нажатия на кнопку
-        soup = BeautifulSoup(driver.page_source, 'html.parser')
-
-        brand_links = soup.select('div.brands_list a[href]')
-        for link in brand_links:
-            brand_url = urljoin(base_url, link['href'])
-            print(f"Parsing brand: {brand_url}")
-            parse_brand_perfumes(brand_url)
+        # Бренды продолжатся со своей последней страницы при следующем обходе их букв
+        brand_urls = [entry['key'] for entry in dead_letters.pending('brand', limit)]
+        if brand_urls:
+            frontier.requeue_brands(brand_urls)
+            dead_letters.resolve('brand', brand_urls)
+            print(f"Requeued {len(brand_urls)} brands for the next crawl of their letters.")
 
     except Exception as e:
-        print(f"Error parsing brands list: {e}")
+        print(f"Error retrying dead letters: {e}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Parfumo crawler")
+    parser.add_argument('--letters', help="буквы брендов для обхода, например 'bc' (по умолчанию весь алфавит)")
+    parser.add_argument('--shard-index', type=int, default=0, help="номер этого процесса среди --shard-count")
+    parser.add_argument('--shard-count', type=int, default=1,
+                        help="сколько процессов делят бренды между собой (по размеру, см. brands.py)")
+    parser.add_argument('--refresh-brands', action='store_true',
+                        help="загрузить страницы букв заново вместо каталога брендов из MongoDB; "
+                             "при нескольких шардах запускайте с ним один процесс до старта остальных")
+    parser.add_argument('--no-accept-cookies', action='store_true', help="не нажимать кнопку согласия с cookies")
+    parser.add_argument('--name-wait', type=float, default=NAME_WAIT)
+    parser.add_argument('--expander-wait', type=float, default=EXPANDER_WAIT)
+    parser.add_argument('--engine', choices=('threads', 'async'), default='threads',
+                        help="threads — пул браузеров; async — асинхронные стадии с пределами по хостам")
+    parser.add_argument('--refresh', action='store_true',
+                        help="не обходить бренды, а обновить сохранённые парфюмы, которым пора на повторный визит")
+    parser.add_argument('--refresh-limit', type=int, default=1000, help="сколько парфюмов обновить за запуск")
+    parser.add_argument('--retry-dead-letters', action='store_true',
+                        help="не обходить бренды, а повторить задачи из очереди отказов (dead_letters)")
+    parser.add_argument('--dead-letter-limit', type=int, default=1000, help="сколько задач каждого вида повторить")
+    parser.add_argument('--base-url', default=base_url,
+                        help="адрес сайта, например локального replay_server.py для прогона без сети")
+    parser.add_argument('--metrics-port', type=int, default=METRICS_PORT,
+                        help="порт эндпоинта /metrics для Prometheus (0 — не запускать)")
+    args = parser.parse_args()
+    if not 0 <= args.shard_index < args.shard_count:
+        parser.error("--shard-index must be between 0 and --shard-count - 1")
+    if args.refresh and args.engine == 'async':
+        parser.error("--refresh is only supported by the threads engine")
+    return args
 
 
 if __name__ == "__main__":
-    parse_all_brands()
-    driver.quit()
-
+    args = parse_args()
+    NAME_WAIT = args.name_wait
+    EXPANDER_WAIT = args.expander_wait
+    base_url = args.base_url.rstrip('/')
+    REFRESH = args.refresh
+    REFRESH_BRANDS = args.refresh_brands
+    ACCEPT_COOKIES = not args.no_accept_cookies
+    configure_logging()
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+
+    if args.retry_dead_letters:
+        retry_dead_letters(args.dead_letter_limit)
+    elif REFRESH:
+        refresh_perfumes(args.refresh_limit)
+    else:
+        letters = args.letters.lower() if args.letters else BRAND_LETTERS
+        print(f"Crawling brand letters: {', '.join(letters)} ({args.engine} engine)")
+        if args.engine == 'async':
+            crawl_async(letters, args.shard_index, args.shard_count)
+        else:
+            parse_all_brands(letters, args.shard_index, args.shard_count)
+    # Сначала дожидаемся изображений: их пути дописываются в документы через writer
+    images.close()
+    writer.close()
+    print(f"MongoDB writes: {writer.summary()}")
+    print(f"Crawl frontier: {frontier.counts()}")
+    print(f"Dead letters by stage: {dead_letters.counts()}")
+    print(f"Browser wait p95 by selector: {waits.summary()}")
+    print(metrics.summary())
+    metrics.close()
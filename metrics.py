@@ -0,0 +1,208 @@
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Границы корзин гистограмм задержек, секунды (как в клиентах Prometheus)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Сколько последних замеров каждой стадии хранить для точных перцентилей в итоговом отчёте
+WINDOW = 5000
+
+# Файл с записью по каждой странице (JSONL); пустое значение отключает запись
+TRACE_PATH = os.environ.get('METRICS_TRACE', 'crawl_trace.jsonl')
+# Порт HTTP-эндпоинта /metrics в текстовом формате Prometheus; 0 — не запускать
+METRICS_PORT = int(os.environ.get('METRICS_PORT', 0))
+
+LOG_PATH = 'parfumo_scraper.log'
+# Библиотеки, которые на DEBUG пишут каждый запрос к chromedriver и MongoDB
+CHATTY_LOGGERS = ('selenium', 'urllib3', 'pymongo', 'PIL')
+
+
+def configure_logging(path=LOG_PATH, level=logging.INFO):
+    """Лог в файл без многословных отладочных сообщений selenium, urllib3 и pymongo."""
+    logging.basicConfig(filename=path, level=level, format='%(asctime)s %(levelname)s:%(name)s:%(message)s')
+    for name in CHATTY_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=WINDOW)
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+        self.recent.append(seconds)
+
+    def percentile(self, fraction):
+        samples = sorted(self.recent)
+        if not samples:
+            return 0.0
+        return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+class Metrics:
+    """Счётчики, гистограммы задержек по стадиям и трасса каждой страницы.
+
+    Стадии замеряются через timer(); если в потоке открыта трасса страницы (start_trace),
+    время стадии добавляется и в неё, а finish_trace() дописывает запись в JSONL.
+    """
+
+    def __init__(self, trace_path=TRACE_PATH):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.started = time.monotonic()
+        self.local = threading.local()
+        self.trace_path = trace_path
+        self.trace_file = None
+        self.server = None
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+        trace = getattr(self.local, 'trace', None)
+        if trace is not None:
+            trace['stages'][stage] = round(trace['stages'].get(stage, 0.0) + seconds, 4)
+
+    @contextmanager
+    def timer(self, stage):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.monotonic() - started)
+
+    def inc(self, name, n=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    def failure(self, stage, error):
+        """Ошибка стадии, с разбивкой по типу исключения."""
+        self.inc('failures', stage=stage, type=type(error).__name__)
+        trace = getattr(self.local, 'trace', None)
+        if trace is not None:
+            trace.setdefault('errors', []).append(f"{stage}: {type(error).__name__}")
+
+    def start_trace(self, kind, url):
+        self.local.trace = {'kind': kind, 'url': url, 'started': time.time(), 'stages': {}}
+        self.local.trace_started = time.monotonic()
+
+    def annotate(self, **fields):
+        """Дополнительные поля для трассы текущей страницы (perfume_id, skipped и т.п.)."""
+        trace = getattr(self.local, 'trace', None)
+        if trace is not None:
+            trace.update(fields)
+
+    def finish_trace(self, status, **fields):
+        trace = getattr(self.local, 'trace', None)
+        if trace is None:
+            return
+        self.local.trace = None
+        trace['status'] = status
+        trace['seconds'] = round(time.monotonic() - self.local.trace_started, 4)
+        trace.update(fields)
+        self.inc('pages', kind=trace['kind'], status=status)
+        self.observe(f"{trace['kind']}_total", trace['seconds'])
+        if not self.trace_path:
+            return
+        line = json.dumps(trace, ensure_ascii=False) + '\n'
+        with self.lock:
+            if self.trace_file is None:
+                self.trace_file = open(self.trace_path, 'a', encoding='utf-8')
+            self.trace_file.write(line)
+
+    def trace_errors(self):
+        """Ошибки, записанные в трассу текущей страницы (для сообщения в очереди обхода)."""
+        trace = getattr(self.local, 'trace', None)
+        if trace is None or not trace.get('errors'):
+            return None
+        return '; '.join(trace['errors'])
+
+    def counter_total(self, name, **labels):
+        with self.lock:
+            return sum(value for (key, key_labels), value in self.counters.items()
+                       if key == name and all(item in key_labels for item in labels.items()))
+
+    def prometheus(self):
+        """Все метрики в текстовом формате Prometheus."""
+        lines = []
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                label_text = ','.join(f'{key}="{val}"' for key, val in labels)
+                lines.append(f"parfumo_{name}_total{{{label_text}}} {value}" if label_text
+                             else f"parfumo_{name}_total {value}")
+            for stage, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS + (float('inf'),), histogram.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else bound
+                    lines.append(f'parfumo_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+                lines.append(f'parfumo_stage_seconds_sum{{stage="{stage}"}} {histogram.total:.6f}')
+                lines.append(f'parfumo_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port=METRICS_PORT):
+        """Запускает эндпоинт /metrics в фоновом потоке."""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('0.0.0.0', port), Handler)
+        threading.Thread(target=self.server.serve_forever, name='metrics-server', daemon=True).start()
+        print(f"Metrics available at http://localhost:{self.server.server_address[1]}/metrics")
+        return self.server
+
+    def summary(self):
+        """Итоговый отчёт: скорость, счётчики и перцентили задержек по стадиям."""
+        elapsed = time.monotonic() - self.started
+        pages = self.counter_total('pages', kind='perfume')
+        lines = [f"Run time {elapsed:.0f}s, {pages} perfume pages, {pages / elapsed * 60 if elapsed else 0:.1f} pages/min"]
+        with self.lock:
+            lines.append(f"{'stage':<24}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'total s':>10}")
+            for stage, histogram in sorted(self.histograms.items(), key=lambda item: -item[1].total):
+                lines.append(f"{stage:<24}{histogram.count:>8}{histogram.percentile(0.5) * 1000:>10.1f}"
+                             f"{histogram.percentile(0.95) * 1000:>10.1f}{max(histogram.recent, default=0) * 1000:>10.1f}"
+                             f"{histogram.total:>10.1f}")
+            for (name, labels), value in sorted(self.counters.items()):
+                label_text = ', '.join(f"{key}={val}" for key, val in labels)
+                lines.append(f"{name}{' (' + label_text + ')' if label_text else ''}: {value}")
+        return '\n'.join(lines)
+
+    def close(self):
+        with self.lock:
+            if self.trace_file is not None:
+                self.trace_file.close()
+                self.trace_file = None
+        if self.server is not None:
+            self.server.shutdown()
+
+
+# Общий экземпляр для краулера и его модулей (images, mongo_writer, waits, translator)
+metrics = Metrics()
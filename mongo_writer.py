@@ -0,0 +1,180 @@
+import atexit
+import threading
+import time
+from datetime import datetime, timezone
+
+from pymongo import ASCENDING, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
+
+from metrics import metrics
+
+# Размер пачки и максимальное время, которое документ может ждать в буфере
+BATCH_SIZE = 100
+FLUSH_INTERVAL = 5.0
+
+
+def ensure_indexes(collection):
+    try:
+        collection.create_index('perfume_id', unique=True)
+    except OperationFailure as e:
+        # Например, в коллекции уже есть дубликаты perfume_id
+        print(f"Could not create unique index on perfume_id: {e}")
+    # Инкрементальная выгрузка (export.py --since) выбирает документы по updated_at
+    collection.create_index([('updated_at', ASCENDING)])
+
+
+class BulkWriter:
+    """Буферизованная запись документов парфюмов пачками через bulk_write.
+
+    Документы копятся в буфере и сбрасываются неупорядоченной пачкой upsert'ов,
+    когда набирается batch_size операций или проходит flush_interval секунд.
+    Остаток буфера записывается при close() и при завершении процесса.
+    Каждая запись проставляет updated_at временем сервера в момент записи пачки ($currentDate),
+    а не постановки в буфер: иначе документ, ждавший сброса, получил бы метку раньше, чем попал
+    в базу, и инкрементальная выгрузка (export.py) могла бы его пропустить. После пачки on_flush
+    получает perfume_id изменённых документов (например, для сброса кэша просмотрщика).
+    """
+
+    def __init__(self, collection, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL, on_flush=None):
+        self.collection = collection
+        self.on_flush = on_flush
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.ops = []
+        self.touched = set()
+        self.oldest = None
+        self.batches = []
+        self.closed = threading.Event()
+
+        ensure_indexes(collection)
+
+        self.timer = threading.Thread(target=self._flush_periodically, name='bulk-writer', daemon=True)
+        self.timer.start()
+        atexit.register(self.close)
+
+    def add(self, operation, perfume_id=None):
+        with self.lock:
+            self.ops.append(operation)
+            if perfume_id is not None:
+                self.touched.add(perfume_id)
+            if self.oldest is None:
+                self.oldest = time.monotonic()
+            full = len(self.ops) >= self.batch_size
+        if full:
+            self.flush()
+
+    def upsert(self, perfume_data):
+        perfume_id = perfume_data['perfume_id']
+        # В замене нельзя использовать операторы: метка времени клиента — только чтобы поле не пропадало,
+        # время сервера проставляет следующая операция (частичные обновления пишутся после замен)
+        perfume_data['updated_at'] = datetime.now(timezone.utc)
+        self.add(ReplaceOne({"perfume_id": perfume_id}, perfume_data, upsert=True), perfume_id)
+        self.add(UpdateOne({"perfume_id": perfume_id}, {"$currentDate": {"updated_at": True}}))
+
+    def set_fields(self, perfume_id, fields, touch=True, unset=()):
+        """Частичное обновление; touch=False — служебные поля, содержимое не изменилось (updated_at и кэш не трогаем).
+
+        Поля из unset удаляются из документа (например, year, если год пропал со страницы).
+        """
+        update = {"$set": fields}
+        if unset:
+            update["$unset"] = {field: "" for field in unset}
+        if touch:
+            update["$currentDate"] = {"updated_at": True}
+        self.add(UpdateOne({"perfume_id": perfume_id}, update), perfume_id if touch else None)
+
+    def add_to_set(self, perfume_id, field, value):
+        """Добавляет значение в массив документа (например, дозагруженное изображение)."""
+        self.add(UpdateOne({"perfume_id": perfume_id},
+                           {"$addToSet": {field: value}, "$currentDate": {"updated_at": True}}),
+                 perfume_id)
+
+    def flush(self):
+        """Записывает накопленные операции и возвращает статистику пачки (или None, если буфер пуст)."""
+        with self.flush_lock:
+            with self.lock:
+                ops, self.ops = self.ops, []
+                touched, self.touched = self.touched, set()
+                self.oldest = None
+            if not ops:
+                return None
+
+            started = time.monotonic()
+            stats = {'batch': len(self.batches) + 1, 'operations': len(ops), 'errors': 0}
+            # Частичные обновления (например, пути изображений) применяются после записи самих документов
+            replaces = [op for op in ops if isinstance(op, ReplaceOne)]
+            updates = [op for op in ops if not isinstance(op, ReplaceOne)]
+            details = {}
+            try:
+                for group in (replaces, updates):
+                    if group:
+                        self._merge(details, self._write(group))
+            except Exception as e:
+                metrics.failure('mongo_flush', e)
+                # Сеть или сервер недоступны — возвращаем операции в буфер до следующей попытки
+                with self.lock:
+                    self.ops[:0] = ops
+                    self.touched |= touched
+                    if self.oldest is None:
+                        self.oldest = started
+                raise
+
+            stats['errors'] = details.get('errors', 0)
+            stats['upserted'] = details.get('nUpserted', 0)
+            stats['matched'] = details.get('nMatched', 0)
+            stats['modified'] = details.get('nModified', 0)
+            stats['seconds'] = round(time.monotonic() - started, 3)
+            metrics.observe('mongo_flush', time.monotonic() - started)
+            metrics.inc('mongo_operations', len(ops))
+            if stats['errors']:
+                metrics.inc('failures', stats['errors'], stage='mongo_flush', type='BulkWriteError')
+            self.batches.append(stats)
+            print(f"Flushed batch {stats['batch']}: {stats['operations']} ops, {stats['upserted']} inserted, "
+                  f"{stats['modified']} updated, {stats['errors']} errors in {stats['seconds']}s")
+            if self.on_flush is not None:
+                try:
+                    self.on_flush(sorted(touched))
+                except Exception as e:
+                    print(f"Error in on_flush callback: {e}")
+            return stats
+
+    def _write(self, ops):
+        try:
+            return self.collection.bulk_write(ops, ordered=False).bulk_api_result
+        except BulkWriteError as e:
+            details = dict(e.details)
+            details['errors'] = len(details.get('writeErrors', []))
+            for error in details.get('writeErrors', [])[:5]:
+                print(f"Bulk write error: {error.get('errmsg')}")
+            return details
+
+    @staticmethod
+    def _merge(totals, details):
+        for key in ('nUpserted', 'nMatched', 'nModified', 'errors'):
+            totals[key] = totals.get(key, 0) + details.get(key, 0)
+
+    def _flush_periodically(self):
+        while not self.closed.wait(min(1.0, self.flush_interval)):
+            with self.lock:
+                due = self.oldest is not None and time.monotonic() - self.oldest >= self.flush_interval
+            if due:
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f"Error flushing perfumes to MongoDB: {e}")
+
+    def close(self):
+        if self.closed.is_set():
+            return
+        self.closed.set()
+        self.flush()
+        atexit.unregister(self.close)
+
+    def summary(self):
+        totals = {'batches': len(self.batches), 'operations': 0, 'upserted': 0, 'modified': 0, 'errors': 0}
+        for stats in self.batches:
+            for key in ('operations', 'upserted', 'modified', 'errors'):
+                totals[key] += stats[key]
+        return totals
@@ -0,0 +1,231 @@
+import re
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup, Tag
+
+try:
+    import lxml  # noqa: F401
+    PARSER = 'lxml'
+except ImportError:
+    PARSER = 'html.parser'
+
+# Кнопки раскрытия блоков, для которых нужен браузер
+SIMILAR_BUTTON = 'div.action_similar[data-type="all"]'
+TAGS_BUTTON = 'div.action_inspiration[data-type="tags"]'
+
+NOTE_LAYERS = {'nb_t': 'top_notes', 'nb_m': 'heart_notes', 'nb_b': 'base_notes'}
+
+# Номер страницы в ссылках пагинации листинга бренда
+PAGE_PARAM = re.compile(r'current_page=(\d+)')
+
+
+def parse_html(html):
+    """Строит дерево страницы (или фрагмента) самым быстрым доступным парсером."""
+    return BeautifulSoup(html, PARSER)
+
+
+def _text(element):
+    return element.get_text().strip()
+
+
+def image_perfume_id(src):
+    """perfume_id из имени файла изображения парфюма (".../61234_vanilla-dream_240.jpg")."""
+    prefix = src.split('/')[-1].split('_')[0]
+    return prefix if prefix.isdigit() else None
+
+
+class PerfumePage:
+    """Все поля страницы парфюма, извлечённые за один обход дерева.
+
+    Повторяет селекторы из parsers.py и прежнего parse_perfume_page, но вместо
+    отдельного select() на каждое поле проходит документ один раз, отслеживая,
+    внутри какого блока (пирамида нот, отзыв, теги и т.д.) находится элемент.
+    """
+
+    def __init__(self, soup, base_url=''):
+        self.base_url = base_url
+        self.name = None
+        self.brand = None
+        self.perfume_id = None
+        self.description = None
+        self.description_links = []
+        self.notes = {'top_notes': [], 'heart_notes': [], 'base_notes': [], 'additional_notes': []}
+        self.rating = None
+        self.gender = None
+        self.accords = []
+        self.release_year_text = None
+        self.type = None
+        self.main_image = None
+        self.additional_images = []
+        self.reviews = []
+        self.perfumers = []
+        self.tags = []
+        self.similar = []
+        self.has_similar_button = False
+        self.has_tags_button = False
+        self._walk(soup, {})
+
+    def _walk(self, parent, ctx):
+        after_perfumer_heading = False
+        for element in parent.children:
+            if not isinstance(element, Tag):
+                continue
+            child_ctx = ctx
+            # h2 "Perfumer(s)" + div.w-100 a
+            if after_perfumer_heading and element.name == 'div' and 'w-100' in (element.get('class') or ()):
+                child_ctx = dict(ctx, perfumers=True)
+            after_perfumer_heading = self._visit(element, child_ctx)
+
+    def _visit(self, element, ctx):
+        """Обрабатывает элемент и его потомков; возвращает True для заголовка блока парфюмеров."""
+        name = element.name
+        classes = element.get('class') or ()
+        itemprop = element.get('itemprop')
+        review = None
+
+        if name == 'meta':
+            if self.perfume_id is None and element.get('property') == 'og:image' and element.get('content'):
+                self.perfume_id = element['content'].split('/')[-1].split('_')[0]
+            return False
+
+        if name == 'div':
+            if 'pyramid_block' in classes:
+                for layer_class, layer in NOTE_LAYERS.items():
+                    if layer_class in classes:
+                        ctx = dict(ctx, layer=layer)
+            elif 'notes_list' in classes:
+                ctx = dict(ctx, notes_list=True)
+            elif 'nb_n' in classes and ctx.get('notes_list'):
+                ctx = dict(ctx, nb_n=True)
+            if 'sim_item' in classes and element.get('data-s_id'):
+                self.similar.append(element['data-s_id'])
+            elif 's-circle-container' in classes:
+                ctx = dict(ctx, accords=True)
+            elif 'text-xs' in classes and 'grey' in classes and ctx.get('accords'):
+                self.accords.append(_text(element))
+            elif 'barfiller_element' in classes and element.get('data-type') == 'bottle':
+                ctx = dict(ctx, bottle=True)
+            elif 'p_gender_big' in classes:
+                ctx = dict(ctx, gender=True)
+            elif element.get('id') == 'tags_holder':
+                ctx = dict(ctx, tags=True)
+            elif element.get('id') == 'p_imagery_holder':
+                ctx = dict(ctx, imagery=True)
+            elif 'action_similar' in classes and element.get('data-type') == 'all':
+                self.has_similar_button = True
+            elif 'action_inspiration' in classes and element.get('data-type') == 'tags':
+                self.has_tags_button = True
+            if ctx.get('review') is not None:
+                if 'text-lg' in classes and 'bold' in classes:
+                    ctx = dict(ctx, review_title=True)
+                elif itemprop == 'reviewBody':
+                    ctx = dict(ctx, review_body=True)
+                elif 'leading-7' in classes and ctx.get('review_body') and ctx['review'].get('body') is None:
+                    ctx['review']['body'] = _text(element)
+
+        elif name == 'span':
+            if itemprop == 'description' and self.description is None:
+                self._description(element)
+            elif itemprop == 'brand' and ctx.get('name'):
+                ctx = dict(ctx, brand=True)
+            elif itemprop == 'name':
+                if ctx.get('brand') and self.brand is None:
+                    self.brand = _text(element)
+                elif ctx.get('review_title') and ctx['review'].get('title') is None:
+                    ctx['review']['title'] = _text(element)
+            if 'label_a' in classes:
+                if self.release_year_text is None:
+                    self.release_year_text = _text(element)
+                if self.type is None and {'p_con', 'pointer', 'upper'}.issubset(classes):
+                    self.type = _text(element)
+
+        elif name == 'h1':
+            if self.name is None and 'p_name_h1' in classes and itemprop == 'name':
+                self.name = element.contents[0].strip() if element.contents else ''
+                ctx = dict(ctx, name=True)
+
+        elif name == 'h2':
+            if 'text-lg' in classes and 'bold' in classes and 'Perfumer' in element.get_text():
+                self._walk(element, ctx)
+                return True
+
+        elif name == 'article' and 'review' in classes:
+            review = {}
+            ctx = dict(ctx, review=review)
+
+        elif name == 'a':
+            if ctx.get('perfumers'):
+                self.perfumers.append(_text(element))
+            if ctx.get('tags') and {'inline-block', 'text-lg', 'grey'}.issubset(classes):
+                self.tags.append(_text(element))
+            if ctx.get('imagery') and 'imagery_item' in classes and element.get('href'):
+                self.additional_images.append(element['href'])
+
+        elif name == 'img':
+            if self.main_image is None and 'p-main-img' in classes and itemprop == 'image':
+                self.main_image = element.get('src')
+
+        elif name == 'i':
+            if ctx.get('gender') and self.gender is None and len(classes) > 1:
+                self.gender = classes[1]
+
+        if 'clickable_note_img' in classes:
+            if ctx.get('layer'):
+                self.notes[ctx['layer']].append(_text(element))
+            if ctx.get('nb_n') and name == 'span':
+                note_text = _text(element)
+                if note_text:
+                    self.notes['additional_notes'].append(note_text)
+
+        if ctx.get('bottle') and self.rating is None and 'bold' in classes and 'green' in classes:
+            self.rating = _text(element)
+
+        self._walk(element, ctx)
+
+        if review is not None and review.get('title') is not None and review.get('body') is not None:
+            self.reviews.append({"title": review['title'], "body": review['body']})
+        return False
+
+    def _description(self, element):
+        for link in element.find_all('a'):
+            text = _text(link)
+            self.description_links.append({'text': text, 'href': link['href'].replace(self.base_url, '')})
+            link.replace_with(text)
+        self.description = _text(element)
+
+    def release_year(self):
+        """Год выпуска, если он указан четырьмя цифрами, иначе исходный текст метки."""
+        if self.release_year_text is None:
+            return None
+        release_year = re.search(r'\b\d{4}\b', self.release_year_text)
+        return release_year.group(0) if release_year else self.release_year_text
+
+
+class ListingPage:
+    """Карточки парфюмов со страницы бренда (вид grid) и число страниц бренда.
+
+    Карточка: {url, name, brand, perfume_id}; perfume_id берётся из имени файла миниатюры,
+    так что уже сохранённые парфюмы отсеиваются без загрузки их страниц. Число страниц —
+    наибольший номер в ссылках пагинации div.numbers (1, если пагинации нет).
+    """
+
+    def __init__(self, soup, base_url=''):
+        self.cards = []
+        for card in soup.select('div.col-normal'):
+            link = card.select_one('div.name a[href]')
+            if link is None:
+                continue
+            brand = card.select_one('div.name span.brand')
+            image = card.select_one('div.image img[src]')
+            self.cards.append({
+                'url': urljoin(base_url, link['href']),
+                'name': _text(link),
+                'brand': _text(brand) if brand is not None else None,
+                'perfume_id': image_perfume_id(image['src']) if image is not None else None,
+            })
+
+        self.page_count = 1
+        for link in soup.select('div.numbers a[href]'):
+            page = PAGE_PARAM.search(link['href'])
+            if page:
+                self.page_count = max(self.page_count, int(page.group(1)))
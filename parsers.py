@@ -0,0 +1,79 @@
+# Разбор отдельных блоков страницы парфюма CSS-селекторами.
+# Основной обход использует page_model.PerfumePage (один проход по дереву);
+# эти функции нужны для фрагментов, подгружаемых после кликов, и для сравнения в бенчмарке.
+
+
+def parse_notes(soup):
+    notes = {'top_notes': [], 'heart_notes': [], 'base_notes': [], 'additional_notes': []}
+
+    # Парсинг пирамиды нот, если она есть (перевод выполняется позже, одним пакетом на страницу)
+    top_notes_elements = soup.select('div.pyramid_block.nb_t .clickable_note_img')
+    for note in top_notes_elements:
+        notes['top_notes'].append(note.text.strip())
+
+    heart_notes_elements = soup.select('div.pyramid_block.nb_m .clickable_note_img')
+    for note in heart_notes_elements:
+        notes['heart_notes'].append(note.text.strip())
+
+    base_notes_elements = soup.select('div.pyramid_block.nb_b .clickable_note_img')
+    for note in base_notes_elements:
+        notes['base_notes'].append(note.text.strip())
+
+    # Парсинг нот в другом формате (как в вашем примере)
+    additional_notes_elements = soup.select('div.notes_list div.nb_n span.clickable_note_img')
+    for note in additional_notes_elements:
+        note_text = note.text.strip()
+        if note_text:
+            notes['additional_notes'].append(note_text)
+
+    return notes
+def parse_reviews(soup):
+    reviews_data = []
+    review_elements = soup.select('article.review')
+
+    for review in review_elements:
+        title_element = review.select_one('div.text-lg.bold span[itemprop="name"]')
+        body_element = review.select_one('div[itemprop="reviewBody"] div.leading-7')
+
+        if title_element and body_element:
+            review_data = {
+                "title": title_element.text.strip(),
+                "body": body_element.text.strip()
+            }
+            reviews_data.append(review_data)
+
+    return reviews_data
+
+def parse_perfumers(soup):
+    perfumers = []
+    perfumers_element = soup.select('h2.text-lg.bold:-soup-contains("Perfumer") + div.w-100 a, h2.text-lg.bold:-soup-contains("Perfumers") + div.w-100 a')
+
+    for perfumer in perfumers_element:
+        perfumers.append(perfumer.text.strip())
+
+    return perfumers
+
+def parse_tags(soup):
+    tags = []
+    tag_elements = soup.select('div#tags_holder a.inline-block.text-lg.grey')
+
+    for tag in tag_elements:
+        tags.append(tag.text.strip())
+
+    return tags
+
+def parse_og_image_id(soup):
+    og_image_tag = soup.select_one('meta[property="og:image"]')
+    if og_image_tag:
+        og_image_url = og_image_tag.get('content')
+        og_image_id = og_image_url.split('/')[-1].split('_')[0]
+        return og_image_id
+    return None
+
+def parse_perfume_type(soup):
+    perfume_type_element = soup.select_one('span.p_con.label_a.pointer.upper')
+    if perfume_type_element:
+        # Тип указан по-французски, переводится вместе с остальными полями в translate_document
+        return perfume_type_element.text.strip()
+
+    return None
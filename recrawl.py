@@ -0,0 +1,81 @@
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ASCENDING
+
+# Интервал повторного посещения подстраивается под то, как часто меняется страница:
+# изменилась — следующий визит вдвое раньше, не изменилась — вдвое позже
+INITIAL_INTERVAL = 7 * 24 * 3600
+MIN_INTERVAL = 24 * 3600
+MAX_INTERVAL = 90 * 24 * 3600
+
+# Служебные поля документа, которые не входят в отпечаток содержимого
+VISIT_FIELDS = ('field_hashes', 'fingerprint', 'fetched_at', 'changed_at', 'next_visit', 'revisit_interval',
+                'http_etag', 'http_last_modified', 'updated_at', 'main_image', 'additional_images', 'year')
+
+# Что нужно знать о сохранённом парфюме, чтобы решить, обновлять ли его
+STORED_PROJECTION = {'_id': 0, 'perfume_id': 1, 'field_hashes': 1, 'revisit_interval': 1,
+                     'http_etag': 1, 'http_last_modified': 1}
+
+
+def ensure_indexes(collection):
+    collection.create_index([('next_visit', ASCENDING)])
+
+
+def _hash(value):
+    return hashlib.sha1(json.dumps(value, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
+
+
+def field_hashes(perfume_data, image_urls=()):
+    """Хеш каждого поля, разобранного со страницы (до перевода и замены терминов id словаря)."""
+    hashes = {field: _hash(value) for field, value in perfume_data.items() if field not in VISIT_FIELDS}
+    hashes['image_urls'] = _hash(list(image_urls))
+    return hashes
+
+
+def fingerprint(hashes):
+    return _hash(hashes)
+
+
+def changed_fields(old_hashes, new_hashes):
+    """Поля, значения которых изменились или появились со времени прошлого визита."""
+    return [field for field, value in new_hashes.items() if (old_hashes or {}).get(field) != value]
+
+
+def next_interval(previous, changed):
+    if not previous:
+        return INITIAL_INTERVAL
+    interval = previous / 2 if changed else previous * 2
+    return int(min(MAX_INTERVAL, max(MIN_INTERVAL, interval)))
+
+
+def visit_fields(previous_interval, changed, etag=None, last_modified=None, hashes=None):
+    """Поля документа после визита: время, расписание следующего визита и валидаторы HTTP."""
+    now = datetime.now(timezone.utc)
+    interval = next_interval(previous_interval, changed)
+    fields = {'fetched_at': now, 'revisit_interval': interval, 'next_visit': now + timedelta(seconds=interval)}
+    if changed:
+        fields['changed_at'] = now
+    if etag is not None:
+        fields['http_etag'] = etag
+    if last_modified is not None:
+        fields['http_last_modified'] = last_modified
+    if hashes is not None:
+        fields['field_hashes'] = hashes
+        fields['fingerprint'] = fingerprint(hashes)
+    return fields
+
+
+def due_perfumes(collection, limit):
+    """URL парфюмов, которым пора на повторный визит; сначала самые просроченные и ни разу не проверенные."""
+    now = datetime.now(timezone.utc)
+    urls = []
+    never_visited = collection.find({'next_visit': {'$exists': False}, 'url': {'$exists': True}},
+                                    {'_id': 0, 'url': 1}).limit(limit)
+    urls.extend(doc['url'] for doc in never_visited)
+    if len(urls) < limit:
+        due = collection.find({'next_visit': {'$lte': now}, 'url': {'$exists': True}}, {'_id': 0, 'url': 1}) \
+            .sort('next_visit', ASCENDING).limit(limit - len(urls))
+        urls.extend(doc['url'] for doc in due)
+    return urls
@@ -0,0 +1,168 @@
+import argparse
+import copy
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from page_model import parse_html
+
+# Локальный сервер, который отдаёт записанный корпус (fixtures/corpus.json) вместо parfumo.com,
+# чтобы прогонять весь конвейер краулера без сети:
+#
+#   python replay_server.py --port 8800 --copies 50 --latency 30
+#   python main.py --base-url http://127.0.0.1:8800 --letters a
+#
+# --copies размножает каждый парфюм на странице бренда (с разными perfume_id),
+# --latency добавляет задержку к каждому ответу, как у настоящего сайта.
+# Изображения (media.parfumo.com) отдаются одним файлом из корпуса.
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+SITE_HOSTS = ('https://www.parfumo.com', 'https://media.parfumo.com')
+EMPTY_PAGE = '<!DOCTYPE html><html><head><meta charset="utf-8"></head><body></body></html>'
+COPY_SUFFIX = re.compile(r'^(.*)-(\d+)$')
+
+
+class Corpus:
+    def __init__(self, copies=1):
+        with open(os.path.join(FIXTURES, 'corpus.json'), encoding='utf-8') as file:
+            manifest = json.load(file)
+        self.copies = copies
+        self.brand_letter = None
+        self.pages = {}
+        for entry in manifest['pages']:
+            if entry['path'] is None:
+                continue
+            with open(os.path.join(FIXTURES, entry['file']), encoding='utf-8') as file:
+                html = file.read()
+            if entry['kind'] == 'brand_letter':
+                self.brand_letter = html
+            elif entry['kind'] == 'brand_listing' and copies > 1:
+                html = self._multiply_listing(html)
+            self.pages[entry['path']] = html
+        with open(os.path.join(FIXTURES, manifest['image']), 'rb') as file:
+            self.image = file.read()
+        self.image_etag = '"' + hashlib.sha1(self.image).hexdigest() + '"'
+
+    def _multiply_listing(self, html):
+        soup = parse_html(html)
+        for card in soup.select('div.col-normal'):
+            for index in range(1, self.copies):
+                clone = copy.copy(card)
+                for link in clone.select('a[href]'):
+                    link['href'] = f"{link['href']}-{index}"
+                # Миниатюра копии несёт тот же id, что и страница копии (см. perfume)
+                for image in clone.select('img[src]'):
+                    image['src'] = re.sub(r'/(\d+)_', lambda m: f"/{m.group(1)}{index:04d}_", image['src'])
+                card.insert_after(clone)
+        return str(soup)
+
+    def perfume(self, path):
+        if path in self.pages:
+            return self.pages[path]
+        match = COPY_SUFFIX.match(path)
+        if not match or match.group(1) not in self.pages or int(match.group(2)) >= self.copies:
+            return None
+        # Копия: тот же парфюм, но с собственным id (он берётся из og:image)
+        index = int(match.group(2))
+        return re.sub(r'(/perfumes/\d+/)(\d+)_', lambda m: f"{m.group(1)}{m.group(2)}{index:04d}_",
+                      self.pages[match.group(1)])
+
+    def lookup(self, url):
+        """HTML для пути запроса или None."""
+        parts = urlsplit(url)
+        path = parts.path
+        if re.fullmatch(r'/Brands/[a-z]', path):
+            return self.brand_letter
+        if path.startswith('/Brands/'):
+            current_page = parse_qs(parts.query).get('current_page', ['1'])[0]
+            # Страницы за пределами корпуса пустые — на них обход бренда заканчивается
+            return self.pages.get(f"{path}?current_page={current_page}", EMPTY_PAGE)
+        if path.startswith('/Perfumes/'):
+            return self.perfume(path)
+        return None
+
+
+def make_handler(corpus, base_url, latency, stats, stats_lock):
+    class ReplayHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _send(self, status, body, content_type, headers=()):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if latency:
+                time.sleep(latency)
+            with stats_lock:
+                stats['requests'] += 1
+            if self.path == '/stats':
+                with stats_lock:
+                    body = json.dumps(stats).encode('utf-8')
+                self._send(200, body, 'application/json')
+                return
+            if self.path.startswith(('/perfumes/', '/imagery/')):
+                with stats_lock:
+                    stats['images'] += 1
+                if self.headers.get('If-None-Match') == corpus.image_etag:
+                    self._send(304, b'', 'image/jpeg', [('ETag', corpus.image_etag)])
+                    return
+                self._send(200, corpus.image, 'image/jpeg', [('ETag', corpus.image_etag)])
+                return
+            html = corpus.lookup(self.path)
+            if html is None:
+                with stats_lock:
+                    stats['not_found'] += 1
+                self._send(404, b'Not found', 'text/plain')
+                return
+            for host in SITE_HOSTS:
+                html = html.replace(host, base_url)
+            with stats_lock:
+                stats['pages'] += 1
+            self._send(200, html.encode('utf-8'), 'text/html; charset=utf-8')
+
+        def log_message(self, format, *args):
+            pass
+
+    return ReplayHandler
+
+
+def start_server(port=0, copies=1, latency=0.0):
+    """Запускает сервер в фоновом потоке и возвращает его (адрес — server.server_address)."""
+    corpus = Corpus(copies)
+    stats = {'requests': 0, 'pages': 0, 'images': 0, 'not_found': 0}
+    server = ThreadingHTTPServer(('127.0.0.1', port), None)
+    server.RequestHandlerClass = make_handler(corpus, f"http://127.0.0.1:{server.server_address[1]}",
+                                              latency, stats, threading.Lock())
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='replay-server', daemon=True).start()
+    return server
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replay the recorded parfumo corpus over HTTP.")
+    parser.add_argument('--port', type=int, default=8800)
+    parser.add_argument('--copies', type=int, default=1, help="how many copies of each perfume a brand page lists")
+    parser.add_argument('--latency', type=float, default=0.0, help="delay per response, milliseconds")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    server = start_server(args.port, args.copies, args.latency / 1000)
+    print(f"Replaying fixtures/corpus.json on http://127.0.0.1:{server.server_address[1]} "
+          f"({args.copies} copies per perfume, {args.latency:.0f} ms latency)")
+    print("Run the crawler with --base-url pointing here; see fake_translate_server.py for translations.")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,261 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+from pymongo import ASCENDING, DESCENDING
+
+from metrics import metrics
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+# Повторы запросов: число попыток и экспоненциальная задержка со случайным разбросом (full jitter)
+ATTEMPTS = int(os.environ.get('RETRY_ATTEMPTS', 4))
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 30.0
+# Retry-After больше этого значения не выжидаем в потоке: хост закрывается автоматом на это время
+MAX_RETRY_AFTER = 120.0
+
+# Автомат хоста размыкается после стольких подряд неудачных запросов и не пропускает запросы
+# cooldown секунд; затем пробный запрос либо замыкает его, либо удваивает паузу
+BREAKER_THRESHOLD = int(os.environ.get('BREAKER_THRESHOLD', 5))
+BREAKER_COOLDOWN = 15.0
+BREAKER_MAX_COOLDOWN = 300.0
+
+# 408 и 425 — тайм-ауты, 429 — ограничение частоты, 5xx — временные ошибки сервера
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+TRANSIENT_ERRORS = (requests.ConnectionError, requests.Timeout, ConnectionError, TimeoutError, asyncio.TimeoutError)
+if aiohttp is not None:
+    TRANSIENT_ERRORS += (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+def status_of(error):
+    """HTTP-статус ошибки requests или aiohttp (None, если ответа не было)."""
+    response = getattr(error, 'response', None)
+    if response is not None and getattr(response, 'status_code', None) is not None:
+        return response.status_code
+    return getattr(error, 'status', None)
+
+
+def classify(error):
+    """'throttled' (429), 'transient' (сеть, тайм-аут, 5xx) — стоит повторить; 'permanent' — нет."""
+    status = status_of(error)
+    if status is not None:
+        if status == 429:
+            return 'throttled'
+        return 'transient' if status in RETRYABLE_STATUS else 'permanent'
+    if isinstance(error, TRANSIENT_ERRORS):
+        return 'transient'
+    return 'permanent'
+
+
+def retry_after(error):
+    """Значение заголовка Retry-After в секундах (число или HTTP-дата), если сервер его прислал."""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or getattr(error, 'headers', None)
+    value = headers.get('Retry-After') if headers else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff(attempt, after=None):
+    delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** (attempt - 1)))
+    if after is not None:
+        delay = max(delay, min(after, MAX_RETRY_AFTER))
+    return delay
+
+
+class CircuitBreaker:
+    """Автомат одного хоста: после серии неудач запросы к нему приостанавливаются.
+
+    Пока автомат разомкнут, вызывающие ждут (wait_time) вместо того, чтобы тратить
+    попытки; по истечении паузы пропускается один пробный запрос.
+    """
+
+    def __init__(self, host, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.host = host
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.failures = 0
+        self.open_until = 0.0
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    def wait_time(self):
+        """0, если запрос можно выполнять сейчас; иначе сколько секунд подождать и спросить снова."""
+        with self.lock:
+            if self.state == CLOSED:
+                return 0.0
+            now = time.monotonic()
+            if now < self.open_until:
+                return self.open_until - now
+            if self.trial_running:
+                return 1.0
+            self.state = HALF_OPEN
+            self.trial_running = True
+            return 0.0
+
+    def success(self):
+        with self.lock:
+            if self.state != CLOSED:
+                print(f"Circuit for {self.host} closed")
+            self.state = CLOSED
+            self.failures = 0
+            self.cooldown = self.base_cooldown
+            self.trial_running = False
+
+    def failure(self, pause=None):
+        """Неудачный запрос; pause — Retry-After сервера, на это время автомат размыкается сразу."""
+        with self.lock:
+            self.failures += 1
+            if self.state == CLOSED and self.failures < self.threshold and not pause:
+                return
+            self.trial_running = False
+            # Пауза из Retry-After выдерживается как есть; иначе — текущий cooldown,
+            # который удваивается, если и пробный запрос после него не прошёл
+            open_until = time.monotonic() + (pause or self.cooldown)
+            if self.state == HALF_OPEN and not pause:
+                self.cooldown = min(BREAKER_MAX_COOLDOWN, self.cooldown * 2)
+            if self.state == OPEN:
+                # Запросы, начатые до размыкания, только продлевают паузу
+                self.open_until = max(self.open_until, open_until)
+                return
+            metrics.inc('circuit_opened', host=self.host)
+            self.state = OPEN
+            self.open_until = open_until
+            print(f"Circuit for {self.host} open for {open_until - time.monotonic():.0f}s "
+                  f"after {self.failures} failures")
+
+    def release(self):
+        """Пробный запрос закончился ошибкой, не связанной с хостом (например, 404)."""
+        with self.lock:
+            self.trial_running = False
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(url):
+    host = urlsplit(url).netloc
+    with _breakers_lock:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker(host)
+        return _breakers[host]
+
+
+def _failed(breaker, error, stage, attempt, attempts):
+    """Учитывает ошибку попытки и возвращает паузу перед следующей (None — больше не пытаться)."""
+    kind = classify(error)
+    if kind == 'permanent':
+        breaker.release()
+        metrics.failure(stage, error)
+        return None
+    after = retry_after(error)
+    # Retry-After дольше обычной паузы — ограничение всего хоста, а не одного запроса
+    breaker.failure(after if after and after > BACKOFF_BASE else None)
+    if attempt >= attempts:
+        metrics.failure(stage, error)
+        return None
+    metrics.inc('retries', stage=stage, reason=kind)
+    return backoff(attempt, after)
+
+
+def call(fn, url, stage, attempts=ATTEMPTS):
+    """Выполняет fn() с повторами временных ошибок и автоматом хоста url; последняя ошибка пробрасывается."""
+    breaker = breaker_for(url)
+    attempt = 0
+    while True:
+        wait = breaker.wait_time()
+        if wait:
+            time.sleep(wait)
+            continue
+        attempt += 1
+        try:
+            result = fn()
+        except Exception as e:
+            delay = _failed(breaker, e, stage, attempt, attempts)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            continue
+        breaker.success()
+        return result
+
+
+async def acall(fn, url, stage, attempts=ATTEMPTS):
+    """То же для асинхронного движка: fn — функция без аргументов, возвращающая корутину."""
+    breaker = breaker_for(url)
+    attempt = 0
+    while True:
+        wait = breaker.wait_time()
+        if wait:
+            await asyncio.sleep(wait)
+            continue
+        attempt += 1
+        try:
+            result = await fn()
+        except Exception as e:
+            delay = _failed(breaker, e, stage, attempt, attempts)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            continue
+        breaker.success()
+        return result
+
+
+class DeadLetters:
+    """Задачи, от которых обход отказался, в коллекции dead_letters для повторного прохода.
+
+    Документ {stage, key, error, failures, failed_at, ...}: key — URL страницы или изображения,
+    остальные поля нужны для повтора (например, perfume_id изображения).
+    Повторный проход: python main.py --retry-dead-letters.
+    """
+
+    def __init__(self, db):
+        self.collection = db['dead_letters']
+        self.collection.create_index([('stage', ASCENDING), ('key', ASCENDING)], unique=True)
+
+    def add(self, stage, key, error=None, **fields):
+        metrics.inc('dead_letters', stage=stage)
+        self.collection.update_one(
+            {'stage': stage, 'key': key},
+            {'$set': dict(fields, error=str(error) if error is not None else None, failed_at=datetime.now(timezone.utc)),
+             '$inc': {'failures': 1}},
+            upsert=True,
+        )
+
+    def pending(self, stage, limit=0):
+        return list(self.collection.find({'stage': stage}, {'_id': 0}).sort('failed_at', DESCENDING).limit(limit))
+
+    def resolve(self, stage, keys):
+        keys = list(keys)
+        if keys:
+            self.collection.delete_many({'stage': stage, 'key': {'$in': keys}})
+
+    def counts(self):
+        return {row['_id']: row['count'] for row in
+                self.collection.aggregate([{'$group': {'_id': '$stage', 'count': {'$sum': 1}}}])}
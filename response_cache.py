@@ -0,0 +1,227 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Необязательный общий кэш в Redis: краулер сообщает через него о перезаписанных парфюмах,
+# и процессы просмотрщика сразу удаляют их из своих LRU.
+# Без Redis (REDIS_URL не задан или пакет redis не установлен) оповещений нет, поэтому запись
+# старше PERFUME_CACHE_REVALIDATE секунд перед выдачей сверяется с источником (см. ResponseCache):
+# это один лёгкий запрос к MongoDB на обращение вместо полного чтения и сериализации документа,
+# а устаревший ответ живёт не дольше PERFUME_CACHE_REVALIDATE, а не весь TTL.
+# 0 — сверять при каждом обращении.
+REDIS_URL = os.environ.get('REDIS_URL')
+CACHE_SIZE = int(os.environ.get('PERFUME_CACHE_SIZE', 10000))
+CACHE_TTL = int(os.environ.get('PERFUME_CACHE_TTL', 3600))
+REVALIDATE_AFTER = float(os.environ.get('PERFUME_CACHE_REVALIDATE', 5))
+
+# Сколько секунд помнить об инвалидации ключа: ответ, собранный по документу, прочитанному
+# до неё, не попадает в кэш (см. ResponseCache.token); отрисовка дольше этого не кэшируется вовсе
+INVALIDATION_HORIZON = 60
+
+KEY_PREFIX = 'perfume:'
+INVALIDATION_CHANNEL = 'perfume-invalidate'
+
+
+def connect_redis(url=REDIS_URL):
+    if not url:
+        return None
+    try:
+        import redis
+    except ImportError:
+        print("REDIS_URL is set but the redis package is not installed, using the in-process cache only.")
+        return None
+    return redis.Redis.from_url(url)
+
+
+class LRUCache:
+    """Потокобезопасный LRU-кэш с ограничением времени жизни записей."""
+
+    def __init__(self, maxsize=CACHE_SIZE, ttl=CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self.items[key]
+                return None
+            self.items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.items[key] = (time.monotonic() + self.ttl, value)
+            self.items.move_to_end(key)
+            while len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.items.pop(key, None)
+
+    def __len__(self):
+        return len(self.items)
+
+
+class ResponseCache:
+    """Кэш готовых JSON-ответов: локальный LRU и, при наличии, общий Redis.
+
+    Значение — словарь с body, etag и last_modified. Краулер после записи документов
+    вызывает publish_invalidation, и все процессы просмотрщика удаляют эти записи.
+    Без общего кэша оповещения не доходят, поэтому используется revalidate(key, value):
+    локальная запись старше revalidate_after секунд выдаётся, только если revalidate
+    подтвердил, что источник не изменился, иначе она удаляется.
+
+    Ответ может собираться по документу, прочитанному до инвалидации, а попасть в кэш уже после неё.
+    Поэтому перед чтением источника берётся token(), и set(key, value, token) не оставляет в кэше
+    ответ, если key инвалидировали после этой отметки.
+    """
+
+    def __init__(self, local=None, shared=None, ttl=CACHE_TTL, revalidate=None, revalidate_after=REVALIDATE_AFTER):
+        self.local = local or LRUCache(ttl=ttl)
+        self.shared = shared
+        self.ttl = ttl
+        self.revalidate = revalidate if shared is None else None
+        self.revalidate_after = revalidate_after
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'shared_hits': 0, 'misses': 0, 'invalidations': 0, 'revalidations': 0,
+                      'stale_sets': 0}
+        # Номер последней инвалидации и её время по ключам, не старше INVALIDATION_HORIZON
+        self.sequence = 0
+        self.invalidated = OrderedDict()
+        if shared is not None:
+            threading.Thread(target=self._listen, name='cache-invalidation', daemon=True).start()
+
+    def _count(self, key, n=1):
+        with self.lock:
+            self.stats[key] += n
+
+    def _fresh(self, key, value):
+        if self.revalidate is None or time.monotonic() - value['checked_at'] < self.revalidate_after:
+            return True
+        self._count('revalidations')
+        if not self.revalidate(key, value):
+            self.invalidate([key])
+            return False
+        value['checked_at'] = time.monotonic()
+        return True
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is not None and self._fresh(key, value):
+            self._count('hits')
+            return value
+        if self.shared is not None:
+            try:
+                raw = self.shared.get(KEY_PREFIX + key)
+            except Exception as e:
+                print(f"Shared cache unavailable: {e}")
+                raw = None
+            if raw is not None:
+                value = json.loads(raw)
+                self.local.set(key, value)
+                self._count('shared_hits')
+                return value
+        self._count('misses')
+        return None
+
+    def token(self):
+        """Отметка перед чтением источника, передаётся в set."""
+        with self.lock:
+            return self.sequence, time.monotonic()
+
+    def _invalidated_since(self, key, token):
+        sequence, started = token
+        with self.lock:
+            if time.monotonic() - started > INVALIDATION_HORIZON:
+                return True
+            entry = self.invalidated.get(key)
+            return entry is not None and entry[0] > sequence
+
+    def set(self, key, value, token=None):
+        """Кладёт ответ в кэш; False, если key инвалидировали после token и ответ мог устареть."""
+        if token is not None and self._invalidated_since(key, token):
+            self._count('stale_sets')
+            return False
+        if self.revalidate is not None:
+            value['checked_at'] = time.monotonic()
+        self.local.set(key, value)
+        if self.shared is not None:
+            try:
+                self.shared.set(KEY_PREFIX + key, json.dumps(value), ex=self.ttl)
+            except Exception as e:
+                print(f"Shared cache unavailable: {e}")
+        # Инвалидация могла прийти, пока ответ записывался, — тогда запись убираем
+        if token is not None and self._invalidated_since(key, token):
+            self._count('stale_sets')
+            self.local.delete(key)
+            self._delete_shared([key])
+            return False
+        return True
+
+    def invalidate(self, keys):
+        now = time.monotonic()
+        with self.lock:
+            self.sequence += 1
+            for key in keys:
+                self.invalidated[key] = (self.sequence, now)
+                self.invalidated.move_to_end(key)
+            while self.invalidated and next(iter(self.invalidated.values()))[1] < now - INVALIDATION_HORIZON:
+                self.invalidated.popitem(last=False)
+        for key in keys:
+            self.local.delete(key)
+        self._count('invalidations', len(keys))
+
+    def _delete_shared(self, keys):
+        if self.shared is None or not keys:
+            return
+        try:
+            self.shared.delete(*[KEY_PREFIX + key for key in keys])
+        except Exception as e:
+            print(f"Shared cache unavailable: {e}")
+
+    def _listen(self):
+        # Сообщения об инвалидации от краулера (см. publish_invalidation)
+        while True:
+            try:
+                pubsub = self.shared.pubsub()
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                for message in pubsub.listen():
+                    if message.get('type') == 'message':
+                        keys = json.loads(message['data'])
+                        self.invalidate(keys)
+                        # Другой процесс мог положить в Redis ответ по старому документу между удалением
+                        # ключей краулером и этим сообщением; повторное удаление убирает и его
+                        self._delete_shared(keys)
+            except Exception as e:
+                print(f"Cache invalidation listener failed, reconnecting: {e}")
+                time.sleep(5)
+
+    def summary(self):
+        with self.lock:
+            stats = dict(self.stats)
+        lookups = stats['hits'] + stats['shared_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['hits'] + stats['shared_hits']) / lookups if lookups else 0.0
+        stats['size'] = len(self.local)
+        stats['shared'] = self.shared is not None
+        stats['revalidate_after'] = self.revalidate_after if self.revalidate is not None else None
+        return stats
+
+
+def publish_invalidation(shared, perfume_ids):
+    """Удаляет перезаписанные парфюмы из общего кэша и оповещает процессы просмотрщика."""
+    if shared is None or not perfume_ids:
+        return
+    try:
+        shared.delete(*[KEY_PREFIX + perfume_id for perfume_id in perfume_ids])
+        shared.publish(INVALIDATION_CHANNEL, json.dumps(list(perfume_ids)))
+    except Exception as e:
+        print(f"Could not invalidate cached perfumes: {e}")
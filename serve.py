@@ -0,0 +1,169 @@
+import _thread
+import argparse
+import os
+import signal
+import sys
+import threading
+import time
+
+# Боевой запуск просмотрщика (google.py) вместо app.run(debug=True).
+#
+#   python serve.py --threads 16                      # waitress: один процесс, пул потоков
+#   python serve.py --server gunicorn --workers 4     # gunicorn: процессы x потоки (Linux)
+#
+# Индексы и миграции создаются отдельно, до первого запуска и после обновлений: python setup_db.py
+#
+# Запросы к MongoDB синхронные, поэтому параллельность даёт пул потоков, а не asyncio;
+# размер пула соединений задаётся MONGO_MAX_POOL (см. google.py) и должен быть не меньше числа потоков.
+
+DEFAULT_WORKERS = int(os.environ.get('WEB_WORKERS', os.cpu_count() or 1))
+DEFAULT_THREADS = int(os.environ.get('WEB_THREADS', 8))
+GRACEFUL_TIMEOUT = 30
+# Сколько секунд после последнего ответа даётся главному циклу waitress, чтобы дописать его в сокет
+QUIET_PERIOD = 0.5
+# Наибольшая длительность одного оборота главного цикла waitress (select)
+LOOP_TIMEOUT = 1
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve the perfume viewer in production mode.")
+    parser.add_argument('--server', choices=('waitress', 'gunicorn'), default='waitress')
+    parser.add_argument('--host', default=os.environ.get('WEB_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('WEB_PORT', 8000)))
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help="Worker processes (gunicorn only)")
+    parser.add_argument('--threads', type=int, default=DEFAULT_THREADS,
+                        help="Request threads per worker process")
+    parser.add_argument('--graceful-timeout', type=int, default=GRACEFUL_TIMEOUT,
+                        help="Seconds to let in-flight requests finish on shutdown")
+    return parser.parse_args()
+
+
+def close_app():
+    import google
+    google.client.close()
+    print("MongoDB connections closed.")
+
+
+class InFlight:
+    """WSGI-обёртка, считающая незавершённые запросы: по ней остановка waitress дожидается ответов.
+
+    Запрос считается завершённым, когда сервер закрыл тело ответа (в том числе потокового).
+    После drain() новые запросы получают 503, а балансировщик уводит клиентов на другие процессы.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.count = 0
+        self.draining = False
+        self.idle = threading.Condition()
+
+    def __call__(self, environ, start_response):
+        from werkzeug.wsgi import ClosingIterator
+
+        with self.idle:
+            rejected = self.draining
+            if not rejected:
+                self.count += 1
+        if rejected:
+            start_response('503 Service Unavailable', [('Content-Type', 'text/plain'), ('Retry-After', '1')])
+            return [b"Server is shutting down\n"]
+        try:
+            body = self.app(environ, start_response)
+        except BaseException:
+            self._done()
+            raise
+        return ClosingIterator(body, self._done)
+
+    def _done(self):
+        with self.idle:
+            self.count -= 1
+            self.idle.notify_all()
+
+    def drain(self):
+        with self.idle:
+            self.draining = True
+
+    def wait_idle(self, timeout):
+        with self.idle:
+            return self.idle.wait_for(lambda: self.count == 0, timeout)
+
+
+def serve_waitress(args):
+    from waitress.server import create_server
+
+    import google
+
+    app = InFlight(google.app)
+    server = create_server(app, host=args.host, port=args.port, threads=args.threads,
+                           channel_timeout=60, connection_limit=max(100, args.threads * 10),
+                           asyncore_loop_timeout=LOOP_TIMEOUT, ident='parfumo')
+    stopping = threading.Event()
+    drained = threading.Event()
+
+    def drain():
+        # Останавливаемся только через открытые средства: новые запросы отклоняет InFlight,
+        # а из server.run() выходим так же, как waitress при Ctrl+C (KeyboardInterrupt в главном потоке),
+        # после чего server.close() закрывает слушающий сокет
+        app.drain()
+        if not app.wait_idle(args.graceful_timeout):
+            print(f"Graceful timeout: {app.count} requests still running")
+        # Даём главному циклу дописать последние ответы в сокеты и выходим из server.run()
+        time.sleep(QUIET_PERIOD + LOOP_TIMEOUT)
+        drained.set()
+        _thread.interrupt_main()
+
+    def stop(signum, frame):
+        if drained.is_set():
+            raise KeyboardInterrupt
+        if stopping.is_set():
+            return
+        stopping.set()
+        print(f"Received signal {signum}, finishing in-flight requests...")
+        threading.Thread(target=drain, name='graceful-shutdown', daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    print(f"Serving on http://{args.host}:{args.port} with waitress, {args.threads} threads")
+    try:
+        server.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        close_app()
+
+
+def serve_gunicorn(args):
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        sys.exit("gunicorn is not installed; use --server waitress or pip install gunicorn")
+
+    class ViewerApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f"{args.host}:{args.port}")
+            self.cfg.set('workers', args.workers)
+            self.cfg.set('threads', args.threads)
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('graceful_timeout', args.graceful_timeout)
+            self.cfg.set('keepalive', 5)
+            # Закрываем пул соединений MongoDB при остановке каждого процесса
+            self.cfg.set('worker_exit', lambda server, worker: close_app())
+
+        def load(self):
+            # Приложение импортируется в каждом процессе отдельно: MongoClient нельзя наследовать через fork
+            import google
+            return google.app
+
+    print(f"Serving on http://{args.host}:{args.port} with gunicorn, "
+          f"{args.workers} workers x {args.threads} threads")
+    ViewerApplication().run()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.server == 'gunicorn':
+        serve_gunicorn(args)
+    else:
+        serve_waitress(args)
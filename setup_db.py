@@ -0,0 +1,36 @@
+import argparse
+import time
+
+import facets
+import google
+
+# Подготовка базы для просмотрщика (google.py): индексы поиска, разовые миграции данных
+# и первый подсчёт фасетов (дальше его обновляет python facets.py по расписанию).
+# Запускается один раз после развёртывания и после обновлений, а не при каждом старте процесса:
+#
+#   python setup_db.py
+#
+# Все шаги идемпотентны, повторный запуск безопасен.
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Create viewer indexes and run data migrations.")
+    parser.add_argument('--skip-migrations', action='store_true', help="только индексы")
+    return parser.parse_args()
+
+
+def backfill_year(collection):
+    """Числовой год у документов, записанных до появления поля year."""
+    result = collection.update_many({"year": {"$exists": False}, "release_year": {"$regex": r"^\d{4}$"}},
+                                    [{"$set": {"year": {"$toInt": "$release_year"}}}])
+    return result.modified_count
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    started = time.monotonic()
+    google.ensure_indexes()
+    print(f"Viewer indexes are in place ({time.monotonic() - started:.1f}s)")
+    if not args.skip_migrations:
+        print(f"Backfilled numeric year in {backfill_year(google.collection)} perfumes")
+    facets.build(google.db)
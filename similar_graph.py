@@ -0,0 +1,111 @@
+import argparse
+import os
+import time
+from collections import Counter
+
+from pymongo import InsertOne, MongoClient
+
+# Офлайн-сборка графа похожих парфюмов.
+#
+# Краулер сохраняет в каждом документе только сырые data-s_id (similar_perfumes).
+# Этот скрипт один раз проходит коллекцию, превращает их в карточки соседей
+# (perfume_id, name, brand, thumbnail) и заранее считает второй круг "вам может
+# понравиться": парфюмы, до которых можно дойти за два шага, по числу таких путей.
+# Результат пишется в коллекцию similar (_id = perfume_id), и просмотрщик отвечает
+# на /perfume/<id>/similar одним поиском по _id.
+#
+#   python similar_graph.py
+
+SIMILAR_COLLECTION = 'similar'
+# Сколько рекомендаций второго круга хранить на парфюм
+TWO_HOP_LIMIT = 20
+BATCH_SIZE = 1000
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build the similar-perfumes adjacency index.")
+    parser.add_argument('--mongo-uri', default=os.environ.get('MONGO_URI', 'mongodb://localhost:27017/'))
+    parser.add_argument('--two-hop-limit', type=int, default=TWO_HOP_LIMIT)
+    return parser.parse_args()
+
+
+def card(perfume_id, info):
+    name, brand, thumbnail = info
+    return {'perfume_id': perfume_id, 'name': name, 'brand': brand, 'thumbnail': thumbnail}
+
+
+def load_graph(collection):
+    """Карточки всех парфюмов и списки соседей, в которых оставлены только известные id."""
+    cards = {}
+    raw_edges = {}
+    projection = {'_id': 0, 'perfume_id': 1, 'name': 1, 'brand': 1, 'main_image': 1, 'similar_perfumes': 1}
+    for doc in collection.find({}, projection):
+        perfume_id = doc.get('perfume_id')
+        if not perfume_id:
+            continue
+        thumbnail = os.path.basename(doc['main_image']) if doc.get('main_image') else None
+        cards[perfume_id] = (doc.get('name'), doc.get('brand'), thumbnail)
+        raw_edges[perfume_id] = doc.get('similar_perfumes') or []
+
+    edges = {}
+    unresolved = 0
+    for perfume_id, similar_ids in raw_edges.items():
+        neighbours = []
+        seen = {perfume_id}
+        for similar_id in similar_ids:
+            if similar_id in seen:
+                continue
+            seen.add(similar_id)
+            if similar_id in cards:
+                neighbours.append(similar_id)
+            else:
+                # Похожий парфюм ещё не скачан
+                unresolved += 1
+        edges[perfume_id] = neighbours
+    return cards, edges, unresolved
+
+
+def two_hop(perfume_id, edges, limit):
+    """Соседи соседей, без самого парфюма и его прямых соседей, по числу путей длины 2."""
+    direct = set(edges[perfume_id])
+    paths = Counter()
+    for neighbour in edges[perfume_id]:
+        for candidate in edges.get(neighbour, ()):
+            if candidate != perfume_id and candidate not in direct:
+                paths[candidate] += 1
+    # При равном числе путей порядок стабилен — по perfume_id
+    return [candidate for candidate, _ in sorted(paths.items(), key=lambda item: (-item[1], item[0]))[:limit]]
+
+
+def build(db, two_hop_limit=TWO_HOP_LIMIT):
+    started = time.monotonic()
+    cards, edges, unresolved = load_graph(db['perfumes'])
+
+    # Пишем во временную коллекцию и подменяем ею рабочую, чтобы просмотрщик не видел полусобранный граф
+    staging = db[SIMILAR_COLLECTION + '_build']
+    staging.drop()
+    batch = []
+    for perfume_id, neighbours in edges.items():
+        batch.append(InsertOne({
+            '_id': perfume_id,
+            'similar': [card(neighbour, cards[neighbour]) for neighbour in neighbours],
+            'also_like': [card(candidate, cards[candidate]) for candidate in two_hop(perfume_id, edges, two_hop_limit)],
+        }))
+        if len(batch) >= BATCH_SIZE:
+            staging.bulk_write(batch, ordered=False)
+            batch = []
+    if batch:
+        staging.bulk_write(batch, ordered=False)
+
+    if edges:
+        staging.rename(SIMILAR_COLLECTION, dropTarget=True)
+    edge_count = sum(len(neighbours) for neighbours in edges.values())
+    print(f"Similar graph: {len(edges)} perfumes, {edge_count} edges, {unresolved} unresolved ids "
+          f"in {time.monotonic() - started:.1f}s")
+    return {'perfumes': len(edges), 'edges': edge_count, 'unresolved': unresolved}
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    client = MongoClient(args.mongo_uri)
+    build(client['parfumo'], args.two_hop_limit)
@@ -0,0 +1,114 @@
+import os
+import re
+import tempfile
+import threading
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Ширины превью: только из этого списка, чтобы запросами нельзя было заставить сервер
+# генерировать бесконечное число вариантов
+SIZES = (50, 100, 200, 400, 800)
+# Какие размеры готовить сразу после загрузки изображения (см. images.ImagePipeline)
+PREGENERATE_SIZES = (100, 200, 400)
+THUMB_DIR = 'thumbs'
+WEBP_QUALITY = 80
+JPEG_QUALITY = 85
+
+# Расширения, которые отдаёт просмотрщик: в папке изображений лежат и служебные файлы
+# (индекс ImagePipeline index.sqlite, недокачанные *.part)
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.avif')
+
+# Имена файлов, сохранённых под SHA-256 содержимого (images.py): их содержимое никогда не меняется
+CONTENT_ADDRESSED = re.compile(r'^[0-9a-f]{64}\.[a-z0-9]+$')
+
+# Блокировки по хешу пути: фиксированный набор вместо словаря, растущего с каждым файлом
+_locks = [threading.Lock() for _ in range(64)]
+
+
+def available():
+    return Image is not None
+
+
+def is_image(filename):
+    return os.path.splitext(filename)[1].lower() in IMAGE_EXTENSIONS
+
+
+def is_content_addressed(filename):
+    return bool(CONTENT_ADDRESSED.match(os.path.basename(filename)))
+
+
+def choose_size(width):
+    """Наименьший допустимый размер, не меньше запрошенного."""
+    for size in SIZES:
+        if size >= width:
+            return size
+    return SIZES[-1]
+
+
+def thumbnail_path(image_dir, filename, width, webp):
+    name, extension = os.path.splitext(os.path.basename(filename))
+    if webp:
+        extension = '.webp'
+    elif extension.lower() not in ('.jpg', '.jpeg', '.png', '.gif'):
+        extension = '.jpg'
+    return os.path.join(image_dir, THUMB_DIR, f"{name}_w{width}{extension}")
+
+
+def _lock_for(path):
+    return _locks[hash(path) % len(_locks)]
+
+
+def make_thumbnail(source, target, width):
+    """Уменьшает изображение до ширины width (пропорционально) и атомарно сохраняет в target."""
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with Image.open(source) as image:
+        source_format = image.format
+        image.thumbnail((width, width * 4))
+        extension = os.path.splitext(target)[1].lower()
+        if extension == '.webp':
+            options = {'format': 'WEBP', 'quality': WEBP_QUALITY, 'method': 4}
+        elif extension in ('.jpg', '.jpeg'):
+            if image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            options = {'format': 'JPEG', 'quality': JPEG_QUALITY, 'optimize': True, 'progressive': True}
+        else:
+            options = {'format': source_format or extension.lstrip('.').upper()}
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                image.save(file, **options)
+            os.replace(temp_path, target)
+        except Exception:
+            os.remove(temp_path)
+            raise
+
+
+def ensure_thumbnail(image_dir, filename, width, webp):
+    """Путь к готовому превью; создаёт его при первом запросе. None, если Pillow не установлен."""
+    if not available():
+        return None
+    target = thumbnail_path(image_dir, filename, width, webp)
+    if os.path.exists(target):
+        return target
+    # Одновременные запросы одного превью не должны генерировать его по несколько раз
+    with _lock_for(target):
+        if not os.path.exists(target):
+            make_thumbnail(os.path.join(image_dir, filename), target, width)
+    return target
+
+
+def pregenerate(image_path, sizes=PREGENERATE_SIZES):
+    """Готовит превью (WebP и в исходном формате) для только что скачанного изображения."""
+    if not available():
+        return
+    image_dir, filename = os.path.split(image_path)
+    for width in sizes:
+        for webp in (True, False):
+            try:
+                ensure_thumbnail(image_dir, filename, width, webp)
+            except Exception as e:
+                print(f"Could not make {width}px thumbnail of {image_path}: {e}")
+                return
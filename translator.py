@@ -0,0 +1,211 @@
+import json
+import os
+import sqlite3
+import threading
+from contextlib import nullcontext
+
+import requests
+
+import resilience
+
+# URL неофициального API Google Translate (можно подменить локальным сервером, см. fake_translate_server.py)
+TRANSLATE_URL = os.environ.get('TRANSLATE_URL', "https://translate.google.com/translate_a/single")
+
+# Файл с постоянным кэшем переводов
+CACHE_PATH = os.environ.get('TRANSLATION_CACHE', 'translations.sqlite')
+
+# Максимальный размер одного пакета (в символах) и количество строк в нём
+MAX_BATCH_CHARS = 4500
+MAX_BATCH_ITEMS = 100
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+}
+
+
+class TranslationError(Exception):
+    """Пакет строк не удалось перевести даже после повторов."""
+
+
+class Translator:
+    """Переводчик с пакетной отправкой строк и кэшем на диске.
+
+    Кэш хранится в SQLite и адресуется тройкой (text, src_lang, target_lang),
+    поэтому каждая нота или аккорд переводится один раз за всё время обхода.
+    """
+
+    def __init__(self, cache_path=CACHE_PATH, url=TRANSLATE_URL, session=None):
+        self.url = url
+        self.session = session or requests.Session()
+        self.session.headers.update(HEADERS)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(cache_path, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS translations ("
+            "text TEXT NOT NULL, src_lang TEXT NOT NULL, target_lang TEXT NOT NULL, "
+            "translated TEXT NOT NULL, PRIMARY KEY (text, src_lang, target_lang))"
+        )
+        self.db.commit()
+        # Необязательный слот на каждый HTTP-запрос: функция без аргументов, возвращающая контекстный
+        # менеджер (асинхронный движок подставляет предел хоста, см. AsyncCrawler.thread_slot)
+        self.slot = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = new_stats()
+
+    def _count(self, stats, key, n=1):
+        with self.lock:
+            self.stats[key] += n
+            if stats is not None:
+                stats[key] += n
+
+    def _cached(self, texts, src_lang, target_lang):
+        found = {}
+        with self.lock:
+            for text in texts:
+                row = self.db.execute(
+                    "SELECT translated FROM translations WHERE text = ? AND src_lang = ? AND target_lang = ?",
+                    (text, src_lang, target_lang)
+                ).fetchone()
+                if row:
+                    found[text] = row[0]
+        return found
+
+    def _store(self, translations, src_lang, target_lang):
+        with self.lock:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO translations (text, src_lang, target_lang, translated) VALUES (?, ?, ?, ?)",
+                [(text, src_lang, target_lang, translated) for text, translated in translations.items()]
+            )
+            self.db.commit()
+
+    def _request(self, text, src_lang, target_lang, stats=None):
+        params = {
+            "client": "gtx",
+            "sl": src_lang,
+            "tl": target_lang,
+            "dt": "t",
+        }
+
+        def post():
+            # Текст передаём в теле запроса, чтобы большие пакеты не упирались в длину URL
+            with self.slot() if self.slot else nullcontext():
+                response = self.session.post(self.url, params=params, data={"q": text})
+            self._count(stats, 'http_requests')
+            response.raise_for_status()
+            return response
+
+        response = resilience.call(post, self.url, 'translate')
+        return ''.join(chunk[0] for chunk in json.loads(response.text)[0] if chunk[0])
+
+    def _batches(self, texts):
+        batch, size = [], 0
+        for text in texts:
+            if batch and (size + len(text) + 1 > MAX_BATCH_CHARS or len(batch) >= MAX_BATCH_ITEMS):
+                yield batch
+                batch, size = [], 0
+            batch.append(text)
+            size += len(text) + 1
+        if batch:
+            yield batch
+
+    def _translate_batch(self, batch, src_lang, target_lang, stats):
+        # Многострочные тексты (отзывы) нельзя склеить, их переводим по одному
+        single = [text for text in batch if '\n' not in text]
+        result = {text: self._request(text, src_lang, target_lang, stats).strip()
+                  for text in batch if '\n' in text}
+
+        # Остальные строки склеиваются через перевод строки, Google сохраняет разбиение по строкам
+        if len(single) > 1:
+            lines = self._request('\n'.join(single), src_lang, target_lang, stats).split('\n')
+            if len(lines) == len(single):
+                result.update({text: line.strip() for text, line in zip(single, lines)})
+                return result
+        # Разбиение не совпало — переводим по одной
+        result.update({text: self._request(text, src_lang, target_lang, stats).strip() for text in single})
+        return result
+
+    def translate_many(self, texts, target_lang='ru', src_lang='auto', stats=None):
+        """Переводит набор строк, возвращает словарь {исходная строка: перевод}.
+
+        Пустые строки и дубликаты отбрасываются, найденное в кэше не переводится повторно.
+        Если пакет не удалось перевести и после повторов (см. resilience.py), бросается
+        TranslationError, чтобы документ не сохранился переведённым наполовину; уже переведённые
+        пакеты остаются в кэше. Если передан stats (см. new_stats), счётчики этого вызова
+        добавляются и в него.
+        """
+        texts = [text for text in texts if text and text.strip()]
+        unique = list(dict.fromkeys(texts))
+        result = self._cached(unique, src_lang, target_lang)
+        self._count(stats, 'strings', len(texts))
+        self._count(stats, 'unique', len(unique))
+        self._count(stats, 'cache_hits', len(result))
+
+        missing = [text for text in unique if text not in result]
+        for batch in self._batches(missing):
+            try:
+                translated = self._translate_batch(batch, src_lang, target_lang, stats)
+            except Exception as e:
+                raise TranslationError(f"{len(batch)} strings not translated: {e}") from e
+            self._store(translated, src_lang, target_lang)
+            result.update(translated)
+
+        return result
+
+    def translate(self, text, target_lang='ru', src_lang='auto', stats=None):
+        return self.translate_many([text], target_lang, src_lang, stats).get(text, text)
+
+
+def new_stats():
+    return {'strings': 0, 'unique': 0, 'cache_hits': 0, 'http_requests': 0}
+
+
+def summarize_stats(stats):
+    """Дополняет счётчики долей попаданий в кэш и числом сэкономленных запросов."""
+    stats = dict(stats)
+    stats['hit_rate'] = stats['cache_hits'] / stats['unique'] if stats['unique'] else 1.0
+    # Раньше каждая строка стоила отдельного HTTP-запроса
+    stats['requests_saved'] = stats['strings'] - stats['http_requests']
+    return stats
+
+
+def collect_strings(perfume_data):
+    """Собирает все строки документа, которые нужно перевести с автоопределением языка.
+
+    Ноты, аккорды и теги переводятся один раз при добавлении в словарь (см. dictionary.py).
+    """
+    texts = []
+    texts.extend(perfume_data.get('perfumers', []))
+    for review in perfume_data.get('reviews', []):
+        texts.extend([review['title'], review['body']])
+    if perfume_data.get('description'):
+        texts.append(perfume_data['description'])
+    # Год выпуска из четырёх цифр не переводится, текстовая метка — да
+    if perfume_data.get('release_year') and not perfume_data['release_year'].isdigit():
+        texts.append(perfume_data['release_year'])
+    return texts
+
+
+def translate_document(translator, perfume_data):
+    """Переводит все поля документа одним пакетом и возвращает статистику по странице."""
+    stats = new_stats()
+    translated = translator.translate_many(collect_strings(perfume_data), stats=stats)
+
+    def tr(text):
+        return translated.get(text, text)
+
+    if 'perfumers' in perfume_data:
+        perfume_data['perfumers'] = [tr(text) for text in perfume_data['perfumers']]
+    if 'reviews' in perfume_data:
+        perfume_data['reviews'] = [{'title': tr(r['title']), 'body': tr(r['body'])} for r in perfume_data['reviews']]
+    if perfume_data.get('description'):
+        perfume_data['description'] = tr(perfume_data['description'])
+    if perfume_data.get('release_year'):
+        perfume_data['release_year'] = tr(perfume_data['release_year'])
+
+    # Тип парфюма указан по-французски
+    if perfume_data.get('type'):
+        perfume_data['type'] = translator.translate(perfume_data['type'], target_lang='ru', src_lang='fr', stats=stats)
+
+    return summarize_stats(stats)
@@ -0,0 +1,77 @@
+import threading
+import time
+from collections import deque
+
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.support.ui import WebDriverWait
+
+from metrics import metrics
+
+# Сколько последних замеров помнить для каждого селектора и сколько нужно, чтобы им доверять
+WINDOW = 200
+MIN_SAMPLES = 20
+PERCENTILE = 0.95
+MARGIN = 1.5
+MIN_TIMEOUT = 0.5
+
+
+class AdaptiveWaits:
+    """Ожидания WebDriver с тайм-аутами, подобранными по недавней статистике.
+
+    Для каждого ключа (селектора) хранится окно последних задержек; тайм-аут берётся как
+    PERCENTILE этих задержек с запасом MARGIN, но не больше заданного максимума.
+    Пока замеров мало, используется максимум. Время ожидания суммируется по странице
+    для каждого потока отдельно (см. start_page / page_total).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.local = threading.local()
+
+    def _percentile(self, key):
+        with self.lock:
+            samples = sorted(self.samples.get(key, ()))
+        if not samples:
+            return None, 0
+        return samples[min(len(samples) - 1, int(len(samples) * PERCENTILE))], len(samples)
+
+    def timeout(self, key, maximum):
+        value, count = self._percentile(key)
+        if count < MIN_SAMPLES:
+            return maximum
+        return min(maximum, max(MIN_TIMEOUT, value * MARGIN))
+
+    def _record(self, key, seconds):
+        with self.lock:
+            self.samples.setdefault(key, deque(maxlen=WINDOW)).append(seconds)
+
+    def until(self, driver, condition, key, maximum):
+        """Аналог WebDriverWait(driver, maximum).until(condition) с адаптивным тайм-аутом."""
+        started = time.monotonic()
+        try:
+            result = WebDriverWait(driver, self.timeout(key, maximum)).until(condition)
+            self._record(key, time.monotonic() - started)
+            return result
+        except TimeoutException:
+            # Не дождались — считаем задержку максимальной, чтобы тайм-аут не сжимался дальше
+            self._record(key, maximum)
+            metrics.inc('wait_timeouts', key=key)
+            raise
+        finally:
+            waited = time.monotonic() - started
+            self.local.waited = getattr(self.local, 'waited', 0.0) + waited
+            metrics.observe(f"wait_{key}", waited)
+
+    def start_page(self):
+        self.local.waited = 0.0
+
+    def page_total(self):
+        """Сколько секунд текущий поток провёл в ожиданиях с последнего start_page()."""
+        return getattr(self.local, 'waited', 0.0)
+
+    def summary(self):
+        """p95 задержки по каждому ключу."""
+        with self.lock:
+            keys = list(self.samples)
+        return {key: round(self._percentile(key)[0], 2) for key in keys}